@@ -0,0 +1,404 @@
+""" An ASGI service exposing summarization, QnA, CV extraction and workout recommendations over HTTP.
+    Handlers are async: GPT and index calls run on the thread pool, CPU bound document extraction runs
+    on a pool of worker processes and GPT clients are pooled per API key.
+
+    Run with: uvicorn main:app --app-dir api --host 0.0.0.0 --port 8000
+    Every request except /health passes the OpenAI API key as "Authorization: Bearer <key>".
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import threading
+from typing import List, Literal, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import FastAPI, File, Form, Header, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+src_path = os.path.abspath(os.path.join(project_root, "src"))
+sys.path.insert(0, src_path)
+
+from prompts import summarize_text, summarize_cv, prompt_doc_qa
+from cv_utils import CV_EXTRACTOR
+from workout_utils import (
+    WORKOUT_PLAN_STORE,
+    FITNESS_GOALS,
+    FITNESS_LEVELS,
+    WORKOUT_STYLES,
+    WORKOUT_LOCATIONS,
+)
+from gpt_utils import GPT_UTILS, CHAT_HISTORY, RETRIEVAL_MODE, RETRIEVAL_MODES
+from db_utils import VECTOR_DB_UTILS, COLLECTION_MANAGER, list_collections, is_streamed_file
+from url_utils import validate_input_url, validate_youtube_url, extract_text_url
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+API_EXTRACTION_WORKERS = config["API_EXTRACTION_WORKERS"]  # Worker processes for document extraction
+API_CLIENT_POOL_SIZE = config["API_CLIENT_POOL_SIZE"]  # Number of API keys whose GPT clients are kept
+API_CHAT_SESSIONS = config["API_CHAT_SESSIONS"]  # Number of conversations whose history is kept
+
+MAX_SUMMARY_INPUT_TOKENS = 10000  # Same limit as the summarization page
+SUMMARY_FILE_TYPES = [".pdf", ".docx", ".txt"]
+INDEX_FILE_TYPES = [".pdf", ".docx", ".txt", ".xlsx"]
+
+
+def _extract_file_text(file_path) -> str:
+    """A function run in a worker process to extract the text of a document for summarization."""
+    return VECTOR_DB_UTILS().extract_file_text(file_path)
+
+
+def _prefetch_file_documents(file_path) -> int:
+    """A function run in a worker process to extract a document for indexing into the shared extraction cache."""
+    if is_streamed_file(file_path):
+        # Large text files and workbooks are streamed by the build without the extraction cache
+        return 0
+    return len(VECTOR_DB_UTILS().load_file_documents(file_path))
+
+
+class CLIENT_POOL:
+    """A class to share GPT clients, and their HTTP connections, across requests made with the same API key."""
+
+    def __init__(self, max_size=API_CLIENT_POOL_SIZE) -> None:
+        self.max_size = max_size
+        self.clients = OrderedDict()  # api_key -> GPT_UTILS, least recently used first
+        self.lock = threading.Lock()
+
+    def get(self, api_key) -> GPT_UTILS:
+        with self.lock:
+            gpt = self.clients.get(api_key)
+            if gpt is None:
+                gpt = self.clients[api_key] = GPT_UTILS(api_key=api_key)
+                while len(self.clients) > self.max_size:
+                    self.clients.popitem(last=False)
+            else:
+                self.clients.move_to_end(api_key)
+            return gpt
+
+
+class CHAT_SESSIONS:
+    """A class to keep the chat history of conversations, the least recently used ones are dropped first."""
+
+    def __init__(self, max_size=API_CHAT_SESSIONS) -> None:
+        self.max_size = max_size
+        self.sessions = OrderedDict()  # (api_key, collection, session_id) -> (CHAT_HISTORY, lock)
+        self.lock = threading.Lock()
+
+    def get(self, key) -> tuple:
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.sessions[key] = (CHAT_HISTORY(), threading.Lock())
+                while len(self.sessions) > self.max_size:
+                    self.sessions.popitem(last=False)
+            else:
+                self.sessions.move_to_end(key)
+            return session
+
+
+class SummarizeTextRequest(BaseModel):
+    text: str = Field(min_length=1)
+    word_limit: int = Field(default=250, ge=50, le=1000)
+
+
+class SummarizeUrlRequest(BaseModel):
+    url: str
+    word_limit: int = Field(default=250, ge=50, le=1000)
+
+
+class WorkoutRequest(BaseModel):
+    # Inputs are limited to the options of the workout page, so every plan belongs to the stored input space
+    fitness_goal: Literal[tuple(FITNESS_GOALS)]
+    fitness_level: Literal[tuple(FITNESS_LEVELS)]
+    workout_style: List[Literal[tuple(WORKOUT_STYLES)]] = Field(min_length=1)
+    days_per_week: int = Field(ge=1, le=7)
+    workout_location: Literal[tuple(WORKOUT_LOCATIONS)]
+    refresh: bool = False  # Replace the stored plan of these inputs with a new one
+
+
+class QueryRequest(BaseModel):
+    question: str = Field(min_length=1)
+    retrieval_mode: Literal[tuple(RETRIEVAL_MODES)] = RETRIEVAL_MODE
+    session_id: Optional[str] = Field(default=None, max_length=128)  # Follow-up questions of a conversation
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.extraction_pool = ProcessPoolExecutor(max_workers=API_EXTRACTION_WORKERS)
+    app.state.clients = CLIENT_POOL()
+    app.state.collections = COLLECTION_MANAGER()
+    app.state.chat_sessions = CHAT_SESSIONS()
+    yield
+    app.state.extraction_pool.shutdown(cancel_futures=True)
+
+
+app = FastAPI(title="GPT Use Cases API", lifespan=lifespan)
+
+
+def get_gpt(authorization) -> GPT_UTILS:
+    """A function to return the pooled GPT client of the bearer API key of a request."""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing 'Authorization: Bearer <OpenAI API key>' header.")
+    return app.state.clients.get(authorization[len("Bearer ") :].strip())
+
+
+async def extract_in_worker(function, file_path):
+    """A function to run an extraction function on the worker processes without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(app.state.extraction_pool, function, file_path)
+
+
+def save_upload(upload: UploadFile, folder_path, allowed_types) -> str:
+    """A function to write an uploaded file to a folder and return its path."""
+    file_name = os.path.basename(upload.filename or "")
+    if os.path.splitext(file_name)[1].lower() not in allowed_types:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported file '{file_name}'. Supported types: {', '.join(allowed_types)}",
+        )
+    file_path = os.path.join(folder_path, file_name)
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(upload.file, f)
+    return file_path
+
+
+async def summarize(gpt: GPT_UTILS, text: str, word_limit: int) -> dict:
+    """A function to summarize a text with GPT models within the input token limit."""
+    start_time = time.time()
+    if not text:
+        raise HTTPException(status_code=422, detail="No text content to summarize.")
+    num_tokens = await run_in_threadpool(gpt.num_tokens_from_string, text)
+    if num_tokens is not None and num_tokens >= MAX_SUMMARY_INPUT_TOKENS:
+        raise HTTPException(status_code=413, detail="The content is too large to summarize.")
+    response = await run_in_threadpool(
+        gpt.get_completion_from_messages,
+        messages=summarize_text(text_input=text, word_limit=word_limit),
+    )
+    return {
+        "summary": response.choices[0].message.content,
+        "tokens_used": response.usage.total_tokens,
+        "execution_time": time.time() - start_time,
+    }
+
+
+@app.get("/health")
+async def health() -> dict:
+    return {"status": "ok"}
+
+
+@app.post("/summarize/text")
+async def summarize_text_endpoint(request: SummarizeTextRequest, authorization: str = Header(None)) -> dict:
+    return await summarize(get_gpt(authorization), request.text, request.word_limit)
+
+
+@app.post("/summarize/url")
+async def summarize_url_endpoint(request: SummarizeUrlRequest, authorization: str = Header(None)) -> dict:
+    gpt = get_gpt(authorization)
+    if not validate_input_url(request.url):
+        raise HTTPException(status_code=422, detail="Invalid URL.")
+    text = await run_in_threadpool(extract_text_url, request.url)
+    return await summarize(gpt, text, request.word_limit)
+
+
+@app.post("/summarize/youtube")
+async def summarize_youtube_endpoint(request: SummarizeUrlRequest, authorization: str = Header(None)) -> dict:
+    gpt = get_gpt(authorization)
+    if not validate_youtube_url(request.url):
+        raise HTTPException(status_code=422, detail="Invalid YouTube URL.")
+    documents = await run_in_threadpool(VECTOR_DB_UTILS().youtube_transcript, yt_url=request.url)
+    if not documents:
+        raise HTTPException(status_code=422, detail="Unable to extract the transcript of this video.")
+    text = "\n".join(document.page_content for document in documents)
+    return await summarize(gpt, text, request.word_limit)
+
+
+@app.post("/summarize/document")
+async def summarize_document_endpoint(
+    file: UploadFile = File(...),
+    word_limit: int = Form(250),
+    authorization: str = Header(None),
+) -> dict:
+    gpt = get_gpt(authorization)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = save_upload(file, temp_dir, SUMMARY_FILE_TYPES)
+        text = await extract_in_worker(_extract_file_text, file_path)
+    return await summarize(gpt, text, word_limit)
+
+
+@app.post("/cv/summarize")
+async def summarize_cv_endpoint(
+    file: UploadFile = File(...),
+    word_limit: int = Form(250),
+    authorization: str = Header(None),
+) -> dict:
+    gpt = get_gpt(authorization)
+    start_time = time.time()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = save_upload(file, temp_dir, [".pdf", ".docx"])
+        text = await extract_in_worker(_extract_file_text, file_path)
+    if not text:
+        raise HTTPException(status_code=422, detail="No text content found in the CV.")
+    response = await run_in_threadpool(
+        gpt.get_completion_from_messages, messages=summarize_cv(text, word_limit=word_limit)
+    )
+    return {
+        "summary": response.choices[0].message.content,
+        "tokens_used": response.usage.total_tokens,
+        "execution_time": time.time() - start_time,
+    }
+
+
+@app.post("/cv/extract")
+async def extract_cv_endpoint(file: UploadFile = File(...), authorization: str = Header(None)) -> dict:
+    gpt = get_gpt(authorization)
+    start_time = time.time()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = save_upload(file, temp_dir, [".pdf", ".docx"])
+        text = await extract_in_worker(_extract_file_text, file_path)
+    if not text:
+        raise HTTPException(status_code=422, detail="No text content found in the CV.")
+    extraction = await run_in_threadpool(CV_EXTRACTOR(gpt).extract, text)
+    if extraction["errors"] and not any(extraction["cv_details"].values()):
+        raise HTTPException(status_code=502, detail="The model did not return the CV details.")
+    return {
+        "cv_details": extraction["cv_details"],
+        "tokens_used": extraction["tokens_used"],
+        "reextracted": extraction["reextracted"],
+        "errors": extraction["errors"],
+        "execution_time": time.time() - start_time,
+    }
+
+
+@app.post("/workouts/recommend")
+async def recommend_workouts_endpoint(request: WorkoutRequest, authorization: str = Header(None)) -> dict:
+    gpt = get_gpt(authorization)
+    start_time = time.time()
+    entry, served_from_store = await run_in_threadpool(
+        WORKOUT_PLAN_STORE().serve, gpt, request.model_dump(exclude={"refresh"}), refresh=request.refresh
+    )
+    return {
+        "workout_plan": entry["workout_plan"],
+        "tokens_used": 0 if served_from_store else entry["tokens_used"],
+        "served_from_store": served_from_store,
+        "execution_time": time.time() - start_time,
+    }
+
+
+@app.get("/collections")
+async def list_collections_endpoint() -> list:
+    return [
+        VECTOR_DB_UTILS(collection=name).read_manifest() or {"name": name}
+        for name in list_collections()
+    ]
+
+
+@app.post("/collections/{collection}/documents")
+async def build_collection_endpoint(
+    collection: str,
+    files: List[UploadFile] = File(...),
+    incremental: bool = Form(False),
+    authorization: str = Header(None),
+) -> dict:
+    gpt = get_gpt(authorization)
+    try:
+        vector_db = VECTOR_DB_UTILS(collection=collection)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    # Uploads are recorded by file name, the temporary directory is removed after the build
+    vector_db.source_path = ""
+    indexed_sources = set((vector_db.read_manifest() or {}).get("sources", [])) if incremental else set()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_paths = [save_upload(upload, temp_dir, INDEX_FILE_TYPES) for upload in files]
+        # Extract the new files in parallel worker processes, the build then reads them from the extraction cache
+        await asyncio.gather(
+            *(
+                extract_in_worker(_prefetch_file_documents, file_path)
+                for file_path in file_paths
+                if vector_db.file_source(file_path) not in indexed_sources
+            )
+        )
+        vector_db.knowledge_base_path = temp_dir
+        db, build_seconds = await run_in_threadpool(
+            vector_db.run_db_build,
+            input_type="documents",
+            embeddings=gpt.embeddings,
+            incremental=incremental,
+        )
+    if db is None:
+        raise HTTPException(status_code=500, detail="The vector database could not be built.")
+
+    app.state.collections.invalidate(collection)
+    return {
+        "collection": collection,
+        "files": len(file_paths),
+        "num_chunks": db.index.ntotal,
+        "execution_time": build_seconds,
+        "dedup": vector_db.dedup_report,
+    }
+
+
+@app.post("/collections/{collection}/query")
+async def query_collection_endpoint(
+    collection: str, request: QueryRequest, authorization: str = Header(None)
+) -> dict:
+    gpt = get_gpt(authorization)
+    try:
+        db, bm25_index = await run_in_threadpool(app.state.collections.get, collection, gpt.embeddings)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if db is None:
+        raise HTTPException(status_code=404, detail=f"Collection '{collection}' does not exist.")
+
+    start_time = time.time()
+    if request.session_id is None:
+        result = await run_in_threadpool(
+            gpt.retrieval_qa,
+            request.question,
+            prompt_doc_qa(),
+            db,
+            retrieval_mode=request.retrieval_mode,
+            bm25_index=bm25_index,
+        )
+    else:
+        history, lock = app.state.chat_sessions.get((gpt.api_key, collection, request.session_id))
+
+        def converse():
+            # Turns of one conversation are answered in order
+            with lock:
+                return gpt.conversational_qa(
+                    request.question,
+                    prompt_doc_qa(),
+                    db,
+                    history,
+                    retrieval_mode=request.retrieval_mode,
+                    bm25_index=bm25_index,
+                )
+
+        result = await run_in_threadpool(converse)
+    if result is None:
+        raise HTTPException(status_code=502, detail="Unable to answer the question.")
+    return {
+        "answer": result["result"],
+        "standalone_question": result.get("standalone_query", request.question),
+        "history_tokens": result.get("history_tokens", 0),
+        "tokens_used": result["tokens_used"],
+        "context_stats": result["context_stats"],
+        "sources": [
+            {"source": document.metadata.get("source"), "content": document.page_content}
+            for document in result["source_documents"]
+        ],
+        "execution_time": time.time() - start_time,
+    }
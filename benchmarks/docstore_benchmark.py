@@ -0,0 +1,138 @@
+""" A python file to compare the pickled LangChain docstore with the columnar docstore.
+    The same synthetic collection is saved in both formats, then each is loaded in a fresh interpreter
+    to measure the load time, the memory added by the load and the time to fetch retrieved chunks.
+
+    Run with: python benchmarks/docstore_benchmark.py --chunks 10000 50000
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+src_path = os.path.abspath(os.path.join(project_root, "src"))
+sys.path.insert(0, src_path)
+
+from langchain.vectorstores import FAISS
+from langchain.embeddings import FakeEmbeddings
+from docstore_utils import save_docstore
+
+WORDS = (
+    "tower paris steel height metres structure visitors engineer design lattice "
+    "broadcast aerial museum river bridge station history century exhibition record"
+).split()
+
+# Runs in the child interpreter: loads one format and prints the measurements as JSON
+CHILD_SCRIPT = """
+import sys, json, time, random, resource
+sys.path.insert(0, {src_path!r})
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+from langchain.vectorstores import FAISS
+from langchain.embeddings import FakeEmbeddings
+from docstore_utils import load_columnar_db
+
+embeddings = FakeEmbeddings(size={dim!r})
+
+rss_before = rss_mb()
+start = time.perf_counter()
+if {columnar!r}:
+    db = load_columnar_db({folder_path!r}, embeddings)
+else:
+    db = FAISS.load_local({folder_path!r}, embeddings)
+load_seconds = time.perf_counter() - start
+rss_after = rss_mb()
+
+rng = random.Random(0)
+positions = [rng.randrange(db.index.ntotal) for _ in range({fetches!r})]
+start = time.perf_counter()
+for position in positions:
+    db.docstore.search(db.index_to_docstore_id[position]).page_content
+fetch_seconds = time.perf_counter() - start
+print(json.dumps({{"load_seconds": load_seconds, "rss_mb": rss_after - rss_before, "fetch_seconds": fetch_seconds}}))
+"""
+
+
+def synthetic_db(num_chunks, dim, seed=0):
+    """A function to build a FAISS db of synthetic chunks with the metadata of real document chunks."""
+    rng = random.Random(seed)
+    texts = [" ".join(rng.choice(WORDS) for _ in range(150)) for _ in range(num_chunks)]
+    metadatas = [
+        {
+            "source": f"/data/knowledge_base/report_{index // 40}.pdf",
+            "start_index": (index % 40) * 900,
+            "num_tokens": rng.randint(150, 250),
+        }
+        for index in range(num_chunks)
+    ]
+    vectors = np.random.default_rng(seed).random((num_chunks, dim), dtype=np.float32)
+    return FAISS.from_embeddings(list(zip(texts, vectors.tolist())), FakeEmbeddings(size=dim), metadatas)
+
+
+def folder_size(folder_path, exclude=()) -> int:
+    return sum(
+        os.path.getsize(os.path.join(folder_path, file_name))
+        for file_name in os.listdir(folder_path)
+        if file_name not in exclude
+    )
+
+
+def measure_load(folder_path, columnar, fetches, dim) -> dict:
+    """A function to load a saved db in a fresh interpreter and return its measurements."""
+    script = CHILD_SCRIPT.format(
+        src_path=src_path, folder_path=folder_path, columnar=columnar, fetches=fetches, dim=dim
+    )
+    completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the pickled and the columnar docstore.")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 50000], help="Collection sizes in chunks")
+    parser.add_argument("--dim", type=int, default=256, help="Dimension of the synthetic vectors")
+    parser.add_argument("--fetches", type=int, default=20, help="Chunks fetched by id after the load")
+    args = parser.parse_args()
+
+    print(f"{'chunks':>8} {'format':<9} {'docstore MB':>12} {'load s':>8} {'RSS MB':>8} {'fetch ms':>9}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for num_chunks in args.chunks:
+            db = synthetic_db(num_chunks, args.dim)
+            pickle_path = os.path.join(work_dir, f"pickle_{num_chunks}")
+            columnar_path = os.path.join(work_dir, f"columnar_{num_chunks}")
+            db.save_local(pickle_path)
+            db.save_local(columnar_path)
+            os.remove(os.path.join(columnar_path, "index.pkl"))
+            save_docstore(db, columnar_path)
+
+            for name, folder_path, columnar in [
+                ("pickle", pickle_path, False),
+                ("columnar", columnar_path, True),
+            ]:
+                result = measure_load(folder_path, columnar, args.fetches, args.dim)
+                docstore_mb = folder_size(folder_path, exclude=["index.faiss"]) / 1024 / 1024
+                print(
+                    f"{num_chunks:>8} {name:<9} {docstore_mb:>12.2f} {result['load_seconds']:>8.3f} "
+                    f"{result['rss_mb']:>8.1f} {result['fetch_seconds'] * 1000:>9.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+""" A local stand-in for the OpenAI chat completions and embeddings endpoints used by the benchmarks.
+    Responses are deterministic and the latency of each endpoint is configurable, so benchmarks run without network.
+    Chat requests with tools are answered with a tool call whose arguments fill the function schema.
+
+    Run standalone with: python benchmarks/fake_openai.py --port 8765 --chat-latency 0.2
+"""
+
+import re
+import json
+import time
+import base64
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class FAKE_OPENAI_BACKEND:
+    """A class to generate deterministic completions and embeddings."""
+
+    def __init__(
+        self, embedding_dim=1536, chat_latency=0.0, embedding_latency=0.0, token_latency=0.0
+    ) -> None:
+        self.embedding_dim = embedding_dim
+        self.chat_latency = chat_latency  # Seconds added to every chat completion request
+        self.token_latency = token_latency  # Seconds added per completion token, like model decoding
+        self.embedding_latency = embedding_latency  # Seconds added to every embeddings request
+        self.token_vectors = {}  # token -> deterministic random vector
+        self.lock = threading.Lock()
+        self.requests = {"chat": 0, "embeddings": 0}
+
+    def _token_vector(self, token) -> np.ndarray:
+        """A method to return the deterministic vector of a token."""
+        vector = self.token_vectors.get(token)
+        if vector is None:
+            seed = int.from_bytes(hashlib.sha256(str(token).encode()).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.embedding_dim).astype(np.float32)
+            with self.lock:
+                self.token_vectors[token] = vector
+        return vector
+
+    def embed(self, text_or_tokens) -> np.ndarray:
+        """A method to embed a text or a token list as the normalised sum of its token vectors.
+        Texts sharing tokens get similar vectors, so retrieval over fake embeddings stays meaningful.
+        """
+        tokens = (
+            text_or_tokens
+            if isinstance(text_or_tokens, list)
+            else TOKEN_PATTERN.findall(text_or_tokens.lower())
+        )
+        vector = np.zeros(self.embedding_dim, dtype=np.float32)
+        for token in tokens or [""]:
+            vector += self._token_vector(token)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+    def embeddings_response(self, body) -> dict:
+        """A method to build the response of an embeddings request."""
+        time.sleep(self.embedding_latency)
+        with self.lock:
+            self.requests["embeddings"] += 1
+        inputs = body["input"]
+        # A single string or a single token list is one input
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        data = []
+        num_tokens = 0
+        for index, item in enumerate(inputs):
+            vector = self.embed(item)
+            num_tokens += len(item) if isinstance(item, list) else len(item.split())
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-ada-002"),
+            "usage": {"prompt_tokens": num_tokens, "total_tokens": num_tokens},
+        }
+
+    def schema_instance(self, schema):
+        """A method to build a value of a JSON schema with one item per array."""
+        if schema.get("type") == "object":
+            return {name: self.schema_instance(value) for name, value in schema.get("properties", {}).items()}
+        if schema.get("type") == "array":
+            return [self.schema_instance(schema.get("items", {}))]
+        return {"integer": 0, "number": 0.0, "boolean": False}.get(schema.get("type"), "NA")
+
+    def chat_response(self, body) -> dict:
+        """A method to build the response of a chat completion request."""
+        with self.lock:
+            self.requests["chat"] += 1
+        prompt = json.dumps(body["messages"])
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+        if body.get("tools"):
+            function = body["tools"][0]["function"]
+            arguments = json.dumps(self.schema_instance(function.get("parameters", {})))
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{digest}",
+                        "type": "function",
+                        "function": {"name": function["name"], "arguments": arguments},
+                    }
+                ],
+            }
+            completion_tokens = len(TOKEN_PATTERN.findall(arguments)) + arguments.count('"')
+            finish_reason = "tool_calls"
+        else:
+            content = f"Deterministic answer {digest}."
+            message = {"role": "assistant", "content": content}
+            completion_tokens = len(content.split())
+            finish_reason = "stop"
+        prompt_tokens = len(prompt.split())
+        time.sleep(self.chat_latency + self.token_latency * completion_tokens)
+        return {
+            "id": f"chatcmpl-{digest}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+
+def _make_handler(backend):
+    """A function to build the HTTP request handler bound to a backend."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.endswith("/embeddings"):
+                response = backend.embeddings_response(body)
+            elif self.path.endswith("/chat/completions"):
+                response = backend.chat_response(body)
+            else:
+                self.send_error(404, f"Unknown endpoint: {self.path}")
+                return
+            payload = json.dumps(response).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output clean
+
+    return Handler
+
+
+class FAKE_OPENAI_SERVER:
+    """A class to run the fake backend as a local OpenAI compatible HTTP server in a background thread."""
+
+    def __init__(self, backend=None, host="127.0.0.1", port=0) -> None:
+        self.backend = backend or FAKE_OPENAI_BACKEND()
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self.backend))
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI backend for offline benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="Seconds per chat request")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Seconds per embeddings request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds per completion token")
+    args = parser.parse_args()
+
+    server = FAKE_OPENAI_SERVER(
+        FAKE_OPENAI_BACKEND(
+            args.embedding_dim, args.chat_latency, args.embedding_latency, args.token_latency
+        ),
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Fake OpenAI backend listening on {server.base_url}")
+    server.server.serve_forever()
@@ -0,0 +1,177 @@
+""" A python file to report the cold start import cost of every Streamlit page.
+    Each page's module level imports run in a fresh interpreter with -X importtime, so the report shows
+    the import time of the page, its slowest modules and which heavy ML or parsing libraries it loads.
+
+    Run with: python benchmarks/import_report.py --strict
+"""
+
+import os
+import re
+import ast
+import sys
+import json
+import glob
+import argparse
+import subprocess
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+frontend_path = os.path.join(project_root, "frontend")
+src_path = os.path.join(project_root, "src")
+
+MAIN_PAGE = "frontend/main.py"
+
+# Libraries that should only load when a page actually parses, embeds, indexes or calls the models
+HEAVY_MODULES = [
+    "langchain",
+    "langchain_core",
+    "langchain_community",
+    "faiss",
+    "numpy",
+    "tiktoken",
+    "openai",
+    "pdfminer",
+    "docx2txt",
+    "unstructured",
+    "trafilatura",
+    "openpyxl",
+    "pytube",
+]
+
+IMPORTTIME_PATTERN = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+# Runs in the child interpreter: executes the page imports and prints the result as JSON
+CHILD_SCRIPT = """
+import sys, json, time
+sys.path.insert(0, {src_path!r})
+sys.path.insert(0, {frontend_path!r})
+errors = []
+start = time.perf_counter()
+for statement in {statements!r}:
+    try:
+        exec(statement, {{}})
+    except Exception as e:
+        errors.append(f"{{statement.splitlines()[0]}} {{type(e).__name__}}: {{e}}")
+seconds = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{"seconds": seconds, "heavy_modules": heavy, "errors": errors}}))
+"""
+
+
+def page_imports(page_path) -> list:
+    """A function to return the source of the module level import statements of a page, in order."""
+    with open(page_path, encoding="utf-8") as f:
+        source = f.read()
+    tree = ast.parse(source)
+    return [
+        ast.get_source_segment(source, node)
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    ]
+
+
+def top_level_imports(importtime_output) -> list:
+    """A function to return the (module, cumulative seconds) of the top level imports in -X importtime output."""
+    modules = []
+    for line in importtime_output.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        # Top level imports are not indented, nested imports are already counted in their parent
+        if match and match.group(3) == " ":
+            modules.append((match.group(4), int(match.group(2)) / 1e6))
+    return modules
+
+
+def interpreter_startup_modules() -> set:
+    """A function to return the modules the interpreter imports before running any code."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "pass"], capture_output=True, text=True
+    )
+    return {name for name, _ in top_level_imports(completed.stderr)}
+
+
+def measure_page(page_path, top, startup_modules) -> dict:
+    """A function to import the dependencies of a page in a fresh interpreter and measure the cost."""
+    script = CHILD_SCRIPT.format(
+        src_path=src_path,
+        frontend_path=frontend_path,
+        statements=page_imports(page_path),
+        heavy=HEAVY_MODULES,
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=project_root,  # Pages load their assets relative to the project root
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        return {
+            "page": os.path.relpath(page_path, project_root),
+            "seconds": None,
+            "heavy_modules": [],
+            "slowest_modules": [],
+            "errors": completed.stderr.strip().splitlines()[-1:],
+        }
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["page"] = os.path.relpath(page_path, project_root)
+    result["slowest_modules"] = sorted(
+        (module for module in top_level_imports(completed.stderr) if module[0] not in startup_modules),
+        key=lambda module: module[1],
+        reverse=True,
+    )[:top]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the cold start import cost of every Streamlit page.")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest modules listed per page")
+    parser.add_argument("--budget", type=float, default=1.5, help="Cold start budget of the main page in seconds")
+    parser.add_argument("--output", help="Optional JSON file to write the report to")
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Exit with an error when a page fails to import, or the main page loads a heavy library or exceeds its budget",
+    )
+    args = parser.parse_args()
+
+    pages = [os.path.join(project_root, MAIN_PAGE)] + sorted(
+        glob.glob(os.path.join(frontend_path, "pages", "*.py"))
+    )
+    startup_modules = interpreter_startup_modules()
+    report = [measure_page(page, args.top, startup_modules) for page in pages]
+
+    for result in report:
+        seconds = f"{result['seconds']:.3f}s" if result["seconds"] is not None else "failed"
+        print(f"{result['page']:<42} {seconds:>9}  heavy: {', '.join(result['heavy_modules']) or '-'}")
+        for name, module_seconds in result["slowest_modules"]:
+            print(f"    {name:<38} {module_seconds:.3f}s")
+        for error in result["errors"]:
+            print(f"    error: {error}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"\nReport written to {args.output}")
+
+    main_page = report[0]
+    failures = []
+    if main_page["heavy_modules"]:
+        failures.append(f"{MAIN_PAGE} loads {', '.join(main_page['heavy_modules'])}")
+    if main_page["seconds"] is None or main_page["seconds"] > args.budget:
+        failures.append(f"{MAIN_PAGE} exceeds its cold start budget of {args.budget:.2f}s")
+    # A page whose imports raise has not been measured, so it can not pass the check
+    failures.extend(
+        f"{result['page']} fails {len(result['errors'])} imports, first: {result['errors'][0]}"
+        for result in report
+        if result["errors"]
+    )
+    if any(result["seconds"] is None and not result["errors"] for result in report):
+        failures.append("a page could not be measured")
+    for failure in failures:
+        print(f"\nBudget check failed: {failure}")
+    if args.strict and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
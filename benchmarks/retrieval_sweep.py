@@ -0,0 +1,203 @@
+""" A python file to sweep chunking, index and retrieval settings against labelled questions.
+    An index is built in memory for every chunking and deduplication setting, then every retrieval setting is
+    evaluated on it. Remote embeddings are cached on disk by text hash, so a chunk or a question is embedded
+    once across all settings and runs. Reports recall@k, MRR, prompt tokens per query and retrieval latency,
+    and picks the cheapest setting that meets the quality bar.
+
+    The questions file has one JSON object per line:
+        {"question": "...", "sources": ["report.pdf"], "evidence": "optional text the chunk must contain"}
+
+    Run with: python benchmarks/retrieval_sweep.py <corpus dir> <questions.jsonl> --chunk-sizes 500 1000 --ks 4 6
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+src_path = os.path.abspath(os.path.join(project_root, "src"))
+sys.path.insert(0, src_path)
+
+from langchain.vectorstores import FAISS
+from db_utils import VECTOR_DB_UTILS, CHUNK_SIZE, CHUNK_OVERLAP
+from embedding_utils import (
+    get_embeddings,
+    EMBEDDING_BACKEND,
+    HASHED_TFIDF_EMBEDDINGS,
+    CACHED_EMBEDDINGS,
+)
+from dedup_utils import chunk_sources
+from retrieval_utils import HYBRID_RETRIEVER, BM25_INDEX, RETRIEVAL_MODES
+from context_utils import CONTEXT_BUILDER, count_tokens
+from prompts import prompt_doc_qa
+
+results_path = f"{project_root}/benchmarks/results"
+
+
+def load_questions(questions_path) -> list:
+    """A function to read the labelled questions, sources are matched by file name."""
+    questions = []
+    with open(questions_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                question = json.loads(line)
+                question["sources"] = {os.path.basename(source) for source in question["sources"]}
+                questions.append(question)
+    return questions
+
+
+def relevant_sources(document, question) -> set:
+    """A function to return the labelled sources a retrieved chunk answers, empty when it is not relevant."""
+    evidence = question.get("evidence")
+    if evidence and evidence.lower() not in document.page_content.lower():
+        return set()
+    return {os.path.basename(source) for source in chunk_sources(document.metadata)} & question["sources"]
+
+
+def build_index(corpus_dir, chunk_size, chunk_overlap, dedup, embeddings) -> dict:
+    """A function to extract, split, optionally deduplicate and embed a corpus into an in-memory index."""
+    vector_db = VECTOR_DB_UTILS(collection="sweep")
+    vector_db.chunk_size = chunk_size
+    vector_db.chunk_overlap = chunk_overlap
+    vector_db.knowledge_base_path = corpus_dir
+
+    start_time = time.perf_counter()
+    chunks = vector_db.process_documents(vector_db.create_documents())
+    if dedup:
+        chunks = vector_db.deduplicate_chunks(chunks)
+    if isinstance(embeddings, HASHED_TFIDF_EMBEDDINGS):
+        # The local model is fitted on the chunks it embeds, so it is fitted again for every chunking
+        embeddings = HASHED_TFIDF_EMBEDDINGS().fit([chunk.page_content for chunk in chunks])
+    texts, vectors = vector_db.embed_chunks(embeddings, chunks)
+    db = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, [chunk.metadata for chunk in chunks])
+    return {
+        "db": db,
+        "bm25_index": BM25_INDEX.from_db(db),
+        "chunks": len(chunks),
+        "index_tokens": sum(chunk.metadata["num_tokens"] for chunk in chunks),
+        "build_seconds": time.perf_counter() - start_time,
+    }
+
+
+def evaluate(index, questions, mode, k, fetch_k, lambda_mult) -> dict:
+    """A function to run the labelled questions against an index with one retrieval setting."""
+    retriever = HYBRID_RETRIEVER(
+        db=index["db"], bm25_index=index["bm25_index"], mode=mode, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult
+    )
+    prompt = prompt_doc_qa()
+    context_builder = CONTEXT_BUILDER()
+    recalls, reciprocal_ranks, prompt_tokens, latencies = [], [], [], []
+    for question in questions:
+        start_time = time.perf_counter()
+        documents = retriever.get_relevant_documents(question["question"])
+        latencies.append(time.perf_counter() - start_time)
+
+        found, first_rank = set(), None
+        for rank, document in enumerate(documents, start=1):
+            sources = relevant_sources(document, question)
+            if sources and first_rank is None:
+                first_rank = rank
+            found |= sources
+        recalls.append(len(found) / len(question["sources"]))
+        reciprocal_ranks.append(1 / first_rank if first_rank else 0.0)
+
+        # The prompt the QnA page would send for these chunks
+        context, _, _ = context_builder.build(documents)
+        prompt_tokens.append(count_tokens(prompt.format(context=context, question=question["question"])))
+
+    return {
+        "recall": float(np.mean(recalls)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "prompt_tokens": float(np.mean(prompt_tokens)),
+        "latency_ms_p50": float(np.percentile(latencies, 50) * 1000),
+        "latency_ms_p95": float(np.percentile(latencies, 95) * 1000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep chunking, index and retrieval settings.")
+    parser.add_argument("corpus_dir", help="Directory of PDF, DOCX, TXT and XLSX files")
+    parser.add_argument("questions", help="JSONL file of labelled questions")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[CHUNK_SIZE], help="Chunk sizes in characters")
+    parser.add_argument("--chunk-overlaps", type=int, nargs="+", default=[CHUNK_OVERLAP], help="Chunk overlaps in characters")
+    parser.add_argument("--dedup", choices=["on", "off"], nargs="+", default=["on"], help="Near-duplicate removal")
+    parser.add_argument("--modes", choices=RETRIEVAL_MODES, nargs="+", default=RETRIEVAL_MODES, help="Retrieval modes")
+    parser.add_argument("--ks", type=int, nargs="+", default=[6], help="Chunks retrieved per question")
+    parser.add_argument("--fetch-ks", type=int, nargs="+", default=[20], help="Candidates re-ranked by MMR")
+    parser.add_argument(
+        "--lambda-mults", type=float, nargs="+", default=[0.5], help="MMR diversity, 1.0 is plain similarity search"
+    )
+    parser.add_argument("--min-recall", type=float, default=0.9, help="Recall@k a setting must reach")
+    parser.add_argument("--min-mrr", type=float, default=0.0, help="MRR a setting must reach")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="OpenAI API key, defaults to $OPENAI_API_KEY")
+    parser.add_argument("--base-url", default=None, help="Optional OpenAI compatible endpoint")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    embeddings = get_embeddings(EMBEDDING_BACKEND, api_key=args.api_key, base_url=args.base_url)
+    if not isinstance(embeddings, HASHED_TFIDF_EMBEDDINGS):
+        embeddings = CACHED_EMBEDDINGS(embeddings)
+
+    results = []
+    print(
+        f"{'size':>5} {'overlap':>7} {'dedup':>5} {'mode':<8} {'k':>3} {'fetch':>5} {'lambda':>6} "
+        f"{'chunks':>7} {'recall':>7} {'mrr':>6} {'prompt tok':>10} {'p50 ms':>7} {'p95 ms':>7}"
+    )
+    for chunk_size, chunk_overlap, dedup in itertools.product(args.chunk_sizes, args.chunk_overlaps, args.dedup):
+        if chunk_overlap >= chunk_size:
+            continue
+        index = build_index(args.corpus_dir, chunk_size, chunk_overlap, dedup == "on", embeddings)
+        for mode, k, fetch_k, lambda_mult in itertools.product(args.modes, args.ks, args.fetch_ks, args.lambda_mults):
+            if fetch_k < k or (mode == "lexical" and (fetch_k, lambda_mult) != (args.fetch_ks[0], args.lambda_mults[0])):
+                # Lexical retrieval does not use the MMR settings, it is evaluated once per k
+                continue
+            settings = {
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+                "dedup": dedup,
+                "mode": mode,
+                "k": k,
+                "fetch_k": fetch_k,
+                "lambda_mult": lambda_mult,
+            }
+            metrics = evaluate(index, questions, mode, k, fetch_k, lambda_mult)
+            results.append(
+                {**settings, "chunks": index["chunks"], "index_tokens": index["index_tokens"], **metrics}
+            )
+            print(
+                f"{chunk_size:>5} {chunk_overlap:>7} {dedup:>5} {mode:<8} {k:>3} {fetch_k:>5} {lambda_mult:>6.2f} "
+                f"{index['chunks']:>7} {metrics['recall']:>7.3f} {metrics['mrr']:>6.3f} "
+                f"{metrics['prompt_tokens']:>10.0f} {metrics['latency_ms_p50']:>7.2f} {metrics['latency_ms_p95']:>7.2f}"
+            )
+
+    if isinstance(embeddings, CACHED_EMBEDDINGS):
+        print(f"\nEmbedding cache: {embeddings.hits} hits, {embeddings.misses} texts embedded ({embeddings.cache_path})")
+
+    # The cheapest setting sends the fewest prompt tokens per query, ties go to the faster retrieval
+    passing = [r for r in results if r["recall"] >= args.min_recall and r["mrr"] >= args.min_mrr]
+    if passing:
+        best = min(passing, key=lambda r: (r["prompt_tokens"], r["latency_ms_p50"]))
+        print(
+            f"\nCheapest setting with recall@k >= {args.min_recall} and MRR >= {args.min_mrr}: "
+            f"chunk_size={best['chunk_size']} chunk_overlap={best['chunk_overlap']} dedup={best['dedup']} "
+            f"mode={best['mode']} k={best['k']} fetch_k={best['fetch_k']} lambda_mult={best['lambda_mult']} "
+            f"({best['prompt_tokens']:.0f} prompt tokens per query)"
+        )
+    else:
+        print(f"\nNo setting reaches recall@k >= {args.min_recall} and MRR >= {args.min_mrr}.")
+
+    os.makedirs(results_path, exist_ok=True)
+    output_path = os.path.join(results_path, f"sweep_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, "w") as f:
+        json.dump({"questions": len(questions), "results": results}, f, indent=2)
+    print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+""" A python file to benchmark every stage of the summarization and QnA pipelines offline.
+    OpenAI endpoints are served by the local fake backend, corpora are synthetic and grow in size,
+    and the results are written as JSON so runs can be compared across commits.
+
+    Run with: python benchmarks/run_benchmarks.py --sizes 50 200 1000 --compare benchmarks/results/<previous>.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+src_path = os.path.abspath(os.path.join(project_root, "src"))
+sys.path.insert(0, src_path)
+
+from fake_openai import FAKE_OPENAI_BACKEND, FAKE_OPENAI_SERVER
+from langchain.vectorstores import FAISS
+from db_utils import VECTOR_DB_UTILS
+from cache_utils import EXTRACTION_CACHE
+from gpt_utils import GPT_UTILS
+from retrieval_utils import HYBRID_RETRIEVER, BM25_INDEX
+from prompts import prompt_doc_qa, summarize_text, extract_cv_details
+from json_schema import response_schema
+from cv_utils import CV_EXTRACTOR
+
+results_path = f"{project_root}/benchmarks/results"
+
+WORDS = (
+    "tower paris steel height metres structure visitors engineer design lattice "
+    "broadcast aerial museum river bridge station history century exhibition record "
+    "building material weight paint elevator restaurant platform summit ticket"
+).split()
+
+
+def synthetic_cv(num_jobs=8, seed=0) -> str:
+    """A function to write a multi-page resume with the usual section headings."""
+    rng = random.Random(seed)
+
+    def sentence():
+        return " ".join(rng.choice(WORDS) for _ in range(14)).capitalize() + "."
+
+    lines = ["Jane Doe", "jane.doe@example.com | +44 20 7946 0000 | London", "", "PROFESSIONAL SUMMARY"]
+    lines += [sentence() for _ in range(4)]
+    lines += ["", "WORK EXPERIENCE"]
+    for job in range(num_jobs):
+        lines += [f"Engineer {job} at Company {job}, January {2010 + job} - December {2011 + job}"]
+        lines += [f"- {sentence()}" for _ in range(6)]
+    lines += ["", "EDUCATION", "MSc Structural Engineering, Example University, 2009, GPA 3.8"]
+    lines += ["", "TECHNICAL SKILLS", ", ".join(WORDS)]
+    lines += ["", "CERTIFICATIONS", "Chartered Engineer, Engineering Council, 2014"]
+    return "\n".join(lines)
+
+
+def run_cv(gpt) -> list:
+    """A function to compare the single request CV extraction with the sectioned parallel extraction."""
+    results = []
+    cv_text = synthetic_cv()
+
+    def extract_single():
+        prompt, functions = extract_cv_details(resume_context=cv_text, response_schema=response_schema)
+        return gpt.get_completion_from_messages(messages=prompt, functions=functions)
+
+    measure(results, "cv_extract_single", 1, 1, extract_single)
+    measure(results, "cv_extract_sections", 1, 1, lambda: CV_EXTRACTOR(gpt).extract(cv_text))
+    return results
+
+
+def synthetic_corpus(folder_path, num_docs, words_per_doc=600, seed=0) -> list:
+    """A function to write a deterministic corpus of text files mixing common words and unique identifiers."""
+    rng = random.Random(seed)
+    os.makedirs(folder_path, exist_ok=True)
+    for doc_index in range(num_docs):
+        words = [rng.choice(WORDS) for _ in range(words_per_doc)]
+        # Every document carries a few unique codes so lexical retrieval has exact targets
+        for code_index in range(3):
+            words.insert(rng.randrange(len(words)), f"DOC-{doc_index}-{code_index}")
+        sentences = [" ".join(words[i : i + 12]).capitalize() + "." for i in range(0, len(words), 12)]
+        with open(os.path.join(folder_path, f"doc_{doc_index}.txt"), "w") as f:
+            f.write("\n\n".join(" ".join(sentences[i : i + 5]) for i in range(0, len(sentences), 5)))
+    return [f"What is DOC-{rng.randrange(num_docs)}-{rng.randrange(3)} about?" for _ in range(20)]
+
+
+def failed(output) -> bool:
+    """A function to check whether a stage returned no result, or no result for one of its items."""
+    if output is None:
+        return True
+    if isinstance(output, list):
+        return any(item is None or (isinstance(item, dict) and item.get("error")) for item in output)
+    return False
+
+
+def measure(results, stage, corpus_docs, items, fn, expect_result=False):
+    """A function to time one stage and append its result.
+    QnA functions print their errors and return None, so with expect_result a stage without a result
+    fails the run instead of being reported as fast.
+    """
+    start_time = time.perf_counter()
+    output = fn()
+    seconds = time.perf_counter() - start_time
+    if expect_result and failed(output):
+        sys.exit(f"The {stage} stage returned no result, see the errors above.")
+    results.append(
+        {
+            "stage": stage,
+            "corpus_docs": corpus_docs,
+            "items": items,
+            "seconds": seconds,
+            "items_per_second": items / seconds if seconds > 0 else None,
+        }
+    )
+    print(f"{stage:<28} docs={corpus_docs:<6} items={items:<6} {seconds:9.4f}s")
+    return output
+
+
+def run_corpus(gpt, num_docs, work_dir) -> list:
+    """A function to run every stage benchmark on a synthetic corpus of the given size."""
+    results = []
+    corpus_path = os.path.join(work_dir, f"corpus_{num_docs}")
+    questions = synthetic_corpus(corpus_path, num_docs)
+
+    vector_db = VECTOR_DB_UTILS(collection="benchmark")
+    vector_db.knowledge_base_path = corpus_path
+    vector_db.db_path = os.path.join(work_dir, f"db_{num_docs}")
+    vector_db.extraction_cache = EXTRACTION_CACHE(
+        cache_dir=os.path.join(work_dir, f"cache_{num_docs}")
+    )
+
+    documents = measure(results, "extract_cold", num_docs, num_docs, vector_db.create_documents)
+    measure(results, "extract_cached", num_docs, num_docs, vector_db.create_documents)
+    chunks = measure(
+        results, "split", num_docs, num_docs, lambda: vector_db.process_documents(documents)
+    )
+    texts = [chunk.page_content for chunk in chunks]
+    vectors = measure(
+        results, "embed", num_docs, len(texts), lambda: gpt.embeddings.embed_documents(texts)
+    )
+    measure(
+        results,
+        "embed_dispatched",
+        num_docs,
+        len(texts),
+        lambda: vector_db.embed_chunks(gpt.embeddings, chunks),
+    )
+    db = measure(
+        results,
+        "faiss_build",
+        num_docs,
+        len(texts),
+        lambda: FAISS.from_embeddings(
+            list(zip(texts, vectors)), gpt.embeddings, [chunk.metadata for chunk in chunks]
+        ),
+    )
+    bm25_index = measure(results, "bm25_build", num_docs, len(texts), lambda: BM25_INDEX.from_db(db))
+
+    measure(
+        results,
+        "index_save",
+        num_docs,
+        len(texts),
+        lambda: vector_db.save_db(db, bm25_index, "documents"),
+    )
+    db = measure(
+        results, "index_load", num_docs, len(texts), lambda: vector_db.load_local_db(gpt.embeddings)
+    )
+    bm25_index = measure(
+        results, "bm25_load", num_docs, len(texts), lambda: vector_db.load_bm25_index(db)
+    )
+
+    for mode in ["lexical", "vector", "hybrid"]:
+        retriever = HYBRID_RETRIEVER(db=db, bm25_index=bm25_index, mode=mode, k=6)
+        measure(
+            results,
+            f"retrieve_{mode}",
+            num_docs,
+            len(questions),
+            lambda: [retriever.get_relevant_documents(question) for question in questions],
+        )
+        measure(
+            results,
+            f"retrieve_{mode}_batch",
+            num_docs,
+            len(questions),
+            lambda: retriever.batch_get_relevant_documents(questions),
+        )
+
+    measure(
+        results,
+        "retrieval_qa",
+        num_docs,
+        len(questions),
+        lambda: [
+            gpt.retrieval_qa(question, prompt_doc_qa(), db, bm25_index=bm25_index)
+            for question in questions
+        ],
+        expect_result=True,
+    )
+    measure(
+        results,
+        "batch_retrieval_qa",
+        num_docs,
+        len(questions),
+        lambda: list(
+            gpt.batch_retrieval_qa(questions, prompt_doc_qa(), db, bm25_index=bm25_index)
+        ),
+        expect_result=True,
+    )
+    summary_inputs = [document.page_content for document in documents[:10]]
+    measure(
+        results,
+        "summarize",
+        num_docs,
+        len(summary_inputs),
+        lambda: [
+            gpt.get_completion_from_messages(messages=summarize_text(text, word_limit=250))
+            for text in summary_inputs
+        ],
+    )
+    return results
+
+
+def git_commit() -> str:
+    """A function to return the current git commit, or unknown outside a git checkout."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=project_root, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, baseline_path) -> None:
+    """A function to print the speedup of every stage against a previous result file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["stage"], r["corpus_docs"]): r["seconds"] for r in baseline["results"]}
+    print(f"\nComparison against {baseline['commit']} ({baseline_path}):")
+    for result in current["results"]:
+        key = (result["stage"], result["corpus_docs"])
+        if key in previous and result["seconds"] > 0:
+            print(
+                f"{result['stage']:<28} docs={result['corpus_docs']:<6} "
+                f"{previous[key]:9.4f}s -> {result['seconds']:9.4f}s "
+                f"({previous[key] / result['seconds']:.2f}x)"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline stage level benchmarks.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000], help="Corpus sizes in documents")
+    parser.add_argument("--chat-latency", type=float, default=0.05, help="Fake chat latency in seconds")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="Fake embeddings latency in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Fake seconds per completion token")
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--output", help="Result file path, defaults to benchmarks/results/<time>_<commit>.json")
+    parser.add_argument("--compare", help="A previous result file to compare against")
+    args = parser.parse_args()
+
+    backend = FAKE_OPENAI_BACKEND(
+        args.embedding_dim, args.chat_latency, args.embedding_latency, args.token_latency
+    )
+    with FAKE_OPENAI_SERVER(backend) as server, tempfile.TemporaryDirectory() as work_dir:
+        gpt = GPT_UTILS(api_key="sk-benchmark", base_url=server.base_url)
+        results = []
+        for num_docs in args.sizes:
+            results.extend(run_corpus(gpt, num_docs, work_dir))
+        results.extend(run_cv(gpt))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": vars(args),
+        "requests": backend.requests,
+        "results": results,
+    }
+    output_path = args.output or os.path.join(
+        results_path, f"{time.strftime('%Y%m%d_%H%M%S')}_{report['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nResults written to {output_path}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
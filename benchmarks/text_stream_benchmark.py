@@ -0,0 +1,96 @@
+""" A python file to compare reading a text file whole with streaming it from a memory map.
+    Synthetic log files of increasing size are split into chunks in a fresh interpreter per method,
+    to measure the throughput in MB/s and the peak memory of the process.
+    Only reading and splitting are measured, embedding and indexing the chunks in a build are not included.
+
+    Run with: python benchmarks/text_stream_benchmark.py --sizes-mb 64 256 1024
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+src_path = os.path.abspath(os.path.join(project_root, "src"))
+
+WORDS = (
+    "request response user session token cache index query latency error warning retry "
+    "timeout upstream service worker queue batch commit rollback connection"
+).split()
+
+# Runs in the child interpreter: splits the file with one method and prints the measurements as JSON
+CHILD_SCRIPT = """
+import sys, json, time, resource
+sys.path.insert(0, {src_path!r})
+from text_stream_utils import iter_text_chunks, CHUNK_SIZE, CHUNK_OVERLAP
+
+start = time.perf_counter()
+num_chunks = 0
+if {stream!r}:
+    for chunk, start_index in iter_text_chunks({file_path!r}, window_mb={window_mb!r}):
+        num_chunks += 1
+else:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    with open({file_path!r}, encoding="utf-8") as f:
+        num_chunks = len(text_splitter.split_text(f.read()))
+seconds = time.perf_counter() - start
+peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({{"seconds": seconds, "chunks": num_chunks, "peak_rss_mb": peak_mb}}))
+"""
+
+
+def write_log_file(file_path, size_mb, seed=0) -> None:
+    """A function to write a synthetic log file of about size_mb megabytes."""
+    rng = random.Random(seed)
+    lines = [
+        f"2024-01-01T00:00:{index % 60:02d} INFO " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 24)))
+        for index in range(5000)
+    ]
+    block = ("\n".join(lines) + "\n").encode("utf-8")
+    with open(file_path, "wb") as f:
+        for _ in range(max(1, int(size_mb * 1024 * 1024 / len(block)))):
+            f.write(block)
+
+
+def measure(file_path, stream, window_mb) -> dict:
+    """A function to split a file in a fresh interpreter and return its measurements."""
+    script = CHILD_SCRIPT.format(src_path=src_path, file_path=file_path, stream=stream, window_mb=window_mb)
+    completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare whole file reads with memory mapped streaming.")
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[64, 256], help="File sizes in megabytes")
+    parser.add_argument("--window-mb", type=float, default=4, help="Window decoded and split at a time when streaming")
+    parser.add_argument("--skip-read", action="store_true", help="Only measure streaming, for files larger than memory")
+    args = parser.parse_args()
+
+    print(f"{'file MB':>8} {'method':<7} {'chunks':>9} {'seconds':>8} {'MB/s':>7} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size_mb in args.sizes_mb:
+            file_path = os.path.join(work_dir, f"log_{size_mb:g}mb.txt")
+            write_log_file(file_path, size_mb)
+            file_mb = os.path.getsize(file_path) / 1024 / 1024
+            methods = [("stream", True)] if args.skip_read else [("read", False), ("stream", True)]
+            for name, stream in methods:
+                result = measure(file_path, stream, args.window_mb)
+                print(
+                    f"{file_mb:>8.0f} {name:<7} {result['chunks']:>9} {result['seconds']:>8.2f} "
+                    f"{file_mb / result['seconds']:>7.1f} {result['peak_rss_mb']:>12.0f}"
+                )
+            os.remove(file_path)
+
+
+if __name__ == "__main__":
+    main()
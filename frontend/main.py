@@ -1,16 +1,10 @@
 import os
 import sys
-import json
-import time
-import docx2txt
 import streamlit as st
 from pages.settings import (
     page_config,
     custom_css,
-    delete_folder_contents,
-    write_uploaded_file,
 )
-from pdfminer.high_level import extract_text
 from streamlit_extras.switch_page_button import switch_page
 
 
@@ -19,11 +13,7 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 src_path = os.path.abspath(os.path.join(project_root, "src"))
 sys.path.insert(0, src_path)
 
-from prompts import summarize_cv, extract_cv_details
-from gpt_utils import GPT_UTILS
-from json_schema import response_schema
-
-# gpt = GPT_UTILS()
+# The main page only links to the other pages, parsing and ML libraries are loaded by the pages that use them
 
 resume_path = f"{project_root}/resumes"
 
@@ -38,6 +28,8 @@ if st.sidebar.button("QnA with your data 📒", use_container_width=True):
     switch_page("query_with_data")
 if st.sidebar.button("Workout Recommender 🏋🏻", use_container_width=True):
     switch_page("workout_recommendations")
+if st.sidebar.button("Diagnostics 🩺", use_container_width=True):
+    switch_page("diagnostics")
 # if st.sidebar.button("Process Resumes ⚙️", use_container_width=True, disabled=True):
 #    switch_page("process_resumes")
 
@@ -0,0 +1,143 @@
+"""A streamlit page to summarize the traced stages of ingestion, retrieval and generation."""
+import os
+import sys
+import streamlit as st
+from pages.settings import (
+    page_config,
+    custom_css,
+    switch_main,
+)
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+src_path = os.path.abspath(os.path.join(project_root, "src"))
+sys.path.insert(0, src_path)
+
+# Loading the tracer shared by the src utilities
+from trace_utils import tracer, STAGES
+from cache_utils import EXTRACTION_CACHE, EXTRACTOR_VERSIONS
+
+
+def extraction_cache():
+    """A streamlit function to show the size of the extraction cache and invalidate stale extractions."""
+    cache = EXTRACTION_CACHE()
+    with st.expander(label="Extraction Cache", expanded=False):
+        stats = cache.stats()
+        col1, col2, col3 = st.columns(3)
+        col1.metric(label="Entries", value=stats["entries"])
+        col2.metric(
+            label="Size",
+            value=f"{stats['size_mb']:.1f} MB",
+            delta=f"of {stats['max_size_mb']:.0f} MB",
+            delta_color="off",
+        )
+        extractor = col3.selectbox(
+            label="Extractor",
+            options=["All extractors"] + sorted(EXTRACTOR_VERSIONS),
+            help="Entries of a single file can be removed with scripts/extraction_cache.py --file",
+        )
+        if st.button("Invalidate Extractions 🗑️", use_container_width=True):
+            removed = cache.invalidate(extractor=None if extractor == "All extractors" else extractor)
+            st.success(f"Removed {removed} cache entries, the files are extracted again on their next build.")
+
+
+def diagnostics():
+    """A streamlit function to show the stage metrics of this session and export them."""
+
+    # Load the page config and custom css from settings
+    page_config()
+    custom_css()
+    switch_main()
+
+    # Define the header for the page
+    st.header("Pipeline Diagnostics 🩺", divider="orange")
+
+    st.info(
+        """
+            Durations, token counts and cache hits of every stage that ran in this app: load, extract, split, embed, index, retrieve and complete.
+            Export the spans as JSONL or the metrics as a Prometheus text file for external dashboards.
+            """
+    )
+
+    extraction_cache()
+
+    summary = tracer.summary()
+    if not summary:
+        st.warning("No stage has been traced yet. Build a database or ask a question first.")
+        return
+
+    # Totals per stage, in pipeline order
+    columns = st.columns(len(STAGES))
+    for column, stage in zip(columns, STAGES):
+        rows = [row for row in summary if row["stage"] == stage]
+        column.metric(
+            label=stage.capitalize(),
+            value=f"{sum(row['total_seconds'] for row in rows):.2f}s",
+            delta=f"{sum(row['count'] for row in rows)} spans",
+            delta_color="off",
+        )
+
+    st.markdown("### Stage Summary:")
+    st.dataframe(
+        [
+            {
+                "Stage": row["stage"],
+                "Name": row["name"],
+                "Count": row["count"],
+                "Errors": row["errors"],
+                "Total (s)": round(row["total_seconds"], 4),
+                "Mean (s)": round(row["mean_seconds"], 4),
+                "p50 (s)": round(row["p50_seconds"], 4),
+                "p95 (s)": round(row["p95_seconds"], 4),
+                "Max (s)": round(row["max_seconds"], 4),
+                "Items": row["items"],
+                "Tokens": row["tokens"],
+                "Cache Hits": row["cache_hits"],
+                "Cache Misses": row["cache_misses"],
+            }
+            for row in summary
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    with st.expander(label="Recent Spans", expanded=False):
+        st.dataframe(
+            [
+                {
+                    "Stage": record["stage"],
+                    "Name": record["name"],
+                    "Duration (s)": round(record["duration_seconds"], 4),
+                    "Status": record["status"],
+                    "Attributes": str(record["attributes"]),
+                    "Trace": record["trace_id"][:8],
+                }
+                for record in tracer.recent(limit=200)
+            ],
+            use_container_width=True,
+            hide_index=True,
+        )
+
+    col1, col2, col3 = st.columns(3)
+    with open(tracer.export_jsonl(), "rb") as f:
+        col1.download_button(
+            "Download Spans (JSONL) ⬇️",
+            data=f.read(),
+            file_name="traces.jsonl",
+            mime="application/jsonl",
+            use_container_width=True,
+        )
+    with open(tracer.export_prometheus(), "rb") as f:
+        col2.download_button(
+            "Download Metrics (Prometheus) ⬇️",
+            data=f.read(),
+            file_name="metrics.prom",
+            mime="text/plain",
+            use_container_width=True,
+        )
+    if col3.button("Clear Spans 🗑️", use_container_width=True):
+        tracer.clear()
+        st.rerun()
+
+
+diagnostics()
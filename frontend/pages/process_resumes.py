@@ -18,15 +18,40 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
 src_path = os.path.abspath(os.path.join(project_root, "src"))
 sys.path.insert(0, src_path)
 
-from gpt_utils import GPT_UTILS
+from db_utils import VECTOR_DB_UTILS
 
-gpt = GPT_UTILS()
+# Initialize database class for cached document extraction
+vector_db = VECTOR_DB_UTILS()
 
 resumes_path = f"{project_root}/resumes_local"
 
 if "valid_key" not in st.session_state:
     st.session_state.valid_key = False
 
+if "resume_digest" not in st.session_state:
+    st.session_state.resume_digest = None
+
+
+def digest_local_resumes():
+    """A function to link the local resumes to their candidates and extract every new candidate once.
+    Exact and near-duplicate resumes are matched before any GPT request and reuse their candidate's details.
+    """
+    from resume_utils import RESUME_INDEX  # Loads NumPy, only needed when resumes are digested
+
+    file_names = os.listdir(resumes_path) if os.path.exists(resumes_path) else []
+    file_paths = [
+        os.path.join(resumes_path, file_name)
+        for file_name in sorted(file_names)
+        if file_name.lower().endswith((".pdf", ".docx"))
+    ]
+    resume_index = RESUME_INDEX()
+    records, report = resume_index.digest(st.session_state.gpt, file_paths, vector_db.extract_file_text)
+    st.session_state.resume_digest = {
+        "records": records,
+        "report": report,
+        "candidates": resume_index.candidates,
+    }
+
 
 def process_resumes():
     """A Streamlit function to allow the system to collect the resumes either pdf or docx files only, and write it to desired storage.
@@ -50,8 +75,6 @@ def process_resumes():
             """
     )
 
-    st.session_state.valid_key = gpt.validate_key()
-
     if not st.session_state.valid_key:
         st.warning(
             "Invalid Open AI API Key. Please update your key and redeploy the app."
@@ -92,7 +115,11 @@ def process_resumes():
                 st.error("Yet to be implemented, Please use Dry Run mode for now.")
 
     if st.button("Reset Local Directory 🚮"):
+        from resume_utils import RESUME_INDEX
+
         delete_folder_contents(resumes_path)
+        RESUME_INDEX().clear()
+        st.session_state.resume_digest = None
 
     with col2:
         with st.expander("", expanded=True):
@@ -102,14 +129,31 @@ def process_resumes():
             )
             st.metric(label="Files in Amazon S3 Directory", value=0)
         sub_col1, sub_col2, sub_col3 = st.columns([0.49, 0.02, 0.49])
-        digest_resumes = sub_col1.button("Digest Resumes", use_container_width=True)
+        digest_resumes = sub_col1.button(
+            "Digest Resumes", use_container_width=True, disabled=not st.session_state.valid_key
+        )
         start_analysis = sub_col3.button("Get Insights", use_container_width=True)
 
-    if st.session_state.run_type == "Dry Run":
+    if digest_resumes:
+        with st.spinner("Matching duplicate resumes and extracting new candidates..."):
+            digest_local_resumes()
+
+    if st.session_state.run_type == "Dry Run" and st.session_state.resume_digest:
         st.divider()
-        # tab1, tab2 = st.tabs("Digest Resumes")
-        digest_resumes = st.button("Digest Resumes")
-        start_analysis = st.button("Get Insights")
+        report = st.session_state.resume_digest["report"]
+        metric_cols = st.columns(4)
+        metric_cols[0].metric(label="Candidates", value=report["candidates"])
+        metric_cols[1].metric(label="Exact Duplicates", value=report["exact"])
+        metric_cols[2].metric(label="Near Duplicates", value=report["near"])
+        metric_cols[3].metric(label="Resumes Extracted", value=report["extracted"])
+        st.caption(f"Tokens used: {report['tokens_used']}")
+        st.dataframe(st.session_state.resume_digest["records"], use_container_width=True)
+        for candidate_id, candidate in st.session_state.resume_digest["candidates"].items():
+            with st.expander(f"{candidate['canonical_file']} ({len(candidate['files'])} files)"):
+                st.caption(f"Candidate {candidate_id}: {', '.join(candidate['files'])}")
+                for error in candidate.get("errors", []):
+                    st.warning(error)
+                st.write(candidate["cv_details"])
 
 
 process_resumes()
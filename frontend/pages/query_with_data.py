@@ -10,6 +10,7 @@ from pages.settings import (
     custom_css,
     switch_main,
     delete_folder_contents,
+    write_uploaded_file,
     write_uploaded_files,
     count_files_in_directory,
 )
@@ -29,24 +30,62 @@ with open(f"{project_root}/config/config.json", "r") as config_file:
 KNOWLEDGE_BASE_DIR = config[
     "KNOWLEDGE_BASE_DIR"
 ]  # Load Knowledge base directory name
-FAISS_DB_DIR = config["FAISS_DB_DIR"]  # Load Vector database directory name
 
 
 # Loading prompt templates and GPT Utilities from src
 from prompts import prompt_doc_qa
-from db_utils import VECTOR_DB_UTILS
+from db_utils import VECTOR_DB_UTILS, COLLECTION_MANAGER, list_collections, current_snapshot_path
+from gpt_utils import BATCH_QNA_MAX_WORKERS, CHAT_HISTORY, RETRIEVAL_MODES, RETRIEVAL_MODE
+from batch_utils import load_questions, results_to_csv
+from job_utils import JOB_QUEUE, ACTIVE_STATUSES, RESUMABLE_STATUSES
 from url_utils import *
 
-# Initialize Vector database
-vector_db = VECTOR_DB_UTILS()
+# Default collection name for each input option
+default_collections = {
+    "Upload document(s)": "documents",
+    "Paste an URL": "web_pages",
+    "Paste a YouTube URL": "youtube",
+}
 
 # Path for the knowledge base documents
 kb_path = f"{project_root}/{KNOWLEDGE_BASE_DIR}"
-db_path = f"{project_root}/{FAISS_DB_DIR}"
+# Path for the question files and results of batch QnA
+batch_path = f"{project_root}/batch_qna"
+# Seconds between two refreshes of the build jobs panel
+JOB_POLL_SECONDS = 2
+
+
+@st.cache_resource
+def get_collection_manager():
+    """A function to share one collection manager, and so the loaded collections, across all sessions."""
+    return COLLECTION_MANAGER()
+
+
+@st.cache_resource
+def get_job_queue():
+    """A function to share one background build queue across all sessions, builds survive page reloads."""
+    return JOB_QUEUE(
+        on_complete=lambda job: get_collection_manager().invalidate(job["collection"])
+    )
 
 
 if "db_exist" not in st.session_state:
     st.session_state.db_exist = False
+if "chat_histories" not in st.session_state:
+    st.session_state.chat_histories = {}  # collection -> (CHAT_HISTORY, displayed messages)
+
+
+def load_collection(collection):
+    """A streamlit function to load a collection for querying, returns (None, None) when it cannot be queried."""
+    if not collection:
+        return None, None
+    try:
+        return get_collection_manager().get(
+            collection, embeddings=st.session_state.gpt.embeddings
+        )
+    except ValueError as e:
+        st.error(e)
+        return None, None
 
 
 def input_documents():
@@ -72,7 +111,7 @@ def input_documents():
                 st.error("Error while uploading files. Please check input files.")
 
 
-def input_url():
+def input_url(vector_db):
     """A streamlit function to extract text content from web url."""
 
     with st.form("Input_WebURL"):
@@ -93,23 +132,15 @@ def input_url():
                         "Unable to extract text content from this URL. Please try other URL."
                     )
                 else:
-                    # Convert into chunks and build db
-                    db, db_build_time = vector_db.run_db_build(
+                    # Convert into chunks and build db in the background
+                    job_id = get_job_queue().submit(
+                        collection=vector_db.collection,
                         input_type="web_url",
                         embeddings=st.session_state.gpt.embeddings,
                         page_content=extracted_text,
                         source_url=input_url,
-                        db_persist=True,
                     )
-                    if db is not None:
-                        st.info(
-                            f"Database build completed in {db_build_time:.4f} seconds"
-                        )
-                        st.session_state.db_exist = True
-                        return st.session_state.db_exist
-                    else:
-                        st.session_state.db_exist = False
-                        return st.session_state.db_exist
+                    st.info(f"Database build queued as job {job_id}.")
 
             else:
                 st.error("Invalid URL. Please correct and submit again.")
@@ -117,45 +148,252 @@ def input_url():
                 return st.session_state.db_exist
 
 
-def process_documents(persist_db: bool = True):
-    """A streamlit function to convert the uploaded document files into chunks and store in vector db."""
+def process_documents(vector_db, incremental: bool = False):
+    """A streamlit function to queue the build of the vector db from the uploaded document files."""
+    if count_files_in_directory(kb_path) == 0:
+        st.error("Please upload the documents first.")
+        return None
     try:
-        db, db_build_time = vector_db.run_db_build(
+        job_id = get_job_queue().submit(
+            collection=vector_db.collection,
             input_type="documents",
             embeddings=st.session_state.gpt.embeddings,
-            db_persist=persist_db,
+            incremental=incremental,
+            files_path=kb_path,
         )
-        if db is not None:
-            st.info(f"Database build completed in {db_build_time:.4f} seconds")
-            st.session_state.db_exist = True
-            return st.session_state.db_exist
-        else:
-            st.session_state.db_exist = False
-            return st.session_state.db_exist
+        st.info(f"Database build queued as job {job_id}.")
+        return job_id
 
     except Exception as e:
-        error_msg = f"An error occurred while reading files: {e}"
+        error_msg = f"An error occurred while queuing the build: {e}"
         st.error(error_msg)
-        st.session_state.db_exist = False
-        return st.session_state.db_exist
-
-
-def delete_vector_database():
+        return None
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def build_jobs(collection):
+    """A streamlit fragment polling the status of the recent build jobs of a collection, with cancel and resume buttons."""
+    job_queue = get_job_queue()
+    jobs = job_queue.recent(collection=collection, limit=3)
+    if not jobs:
+        st.caption(f"No build job for '{collection}' yet.")
+        return
+
+    for job in jobs:
+        status_text = f"Job {job['id']} · {job['status']}"
+        if job["message"]:
+            status_text += f" · {job['message']}"
+        st.progress(job["progress"], text=status_text)
+        dedup_report = (job["result"] or {}).get("dedup")
+        if dedup_report and dedup_report["dropped"]:
+            st.caption(
+                f"Deduplication kept {dedup_report['kept']} of {dedup_report['chunks']} chunks, "
+                f"saving {dedup_report['embeddings_saved']} embeddings and "
+                f"{dedup_report['index_bytes_saved'] / 1024:.1f} KB of index space."
+            )
+        if job["status"] in ACTIVE_STATUSES:
+            if st.button("Cancel build ✖️", key=f"cancel_{job['id']}", use_container_width=True):
+                job_queue.cancel(job["id"])
+        elif job["status"] in RESUMABLE_STATUSES:
+            if st.button(
+                "Resume build 🔁",
+                key=f"resume_{job['id']}",
+                disabled=not st.session_state.valid_key,
+                use_container_width=True,
+            ):
+                job_queue.resume(job["id"], embeddings=st.session_state.gpt.embeddings)
+
+
+def delete_vector_database(vector_db):
     """A streamlit function show a button and metric to drop a vector database."""
     try:
         drop_database = st.button(
             label="Reset Vector Database", use_container_width=True
         )
         if drop_database:
-            delete_folder_contents(db_path)
+            # Queries already running finish on the snapshot they loaded
+            vector_db.reset()
+            get_collection_manager().invalidate(vector_db.collection)
 
         st.metric(
-            label="Files in Vector database", value=count_files_in_directory(db_path)
+            label=f"Files in '{vector_db.collection}' collection",
+            value=count_files_in_directory(current_snapshot_path(vector_db.db_path) or ""),
         )
     except Exception as e:
         st.error(f"Error deleting vector database: {e}")
 
 
+def batch_query_with_data(vector_db):
+    """A streamlit function to answer a CSV or JSONL file of questions concurrently and download the results."""
+
+    with st.form("Batch_QnA_Data"):
+        collections = list_collections()
+        query_collection = st.selectbox(
+            label="Collection to query",
+            options=collections,
+            index=collections.index(vector_db.collection)
+            if vector_db.collection in collections
+            else 0,
+            placeholder="No collection is built yet",
+        )
+        question_file = st.file_uploader(
+            label="Upload questions",
+            type=["csv", "jsonl"],
+            help="A CSV file with a 'question' column or a JSONL file with one question per line.",
+        )
+        retrieval_mode = st.radio(
+            label="Retrieval mode",
+            options=RETRIEVAL_MODES,
+            index=RETRIEVAL_MODES.index(RETRIEVAL_MODE),
+            format_func=lambda mode: mode.capitalize(),
+            horizontal=True,
+        )
+        max_workers = st.slider(
+            label="Concurrent questions",
+            min_value=1,
+            max_value=32,
+            value=BATCH_QNA_MAX_WORKERS,
+        )
+        submit_batch = st.form_submit_button(
+            label="Answer Questions", disabled=not st.session_state.valid_key
+        )
+
+    if submit_batch:
+        if question_file is None:
+            st.error("Please upload a question file first.")
+            return
+        file_path, _ = write_uploaded_file(question_file, batch_path)
+        try:
+            questions = load_questions(file_path)
+        except ValueError as e:
+            st.error(f"Unable to read questions: {e}")
+            return
+        if not questions:
+            st.error("No questions found in the uploaded file.")
+            return
+
+        local_db, bm25_index = load_collection(query_collection)
+        if local_db is None:
+            st.error("Database does not exist. Please build the database first.")
+            return
+
+        # Stream every answer to the results file as soon as it is completed
+        start_time = time.time()
+        results_path = os.path.join(batch_path, f"results_{int(start_time)}.jsonl")
+        progress = st.progress(0.0, text=f"Answered 0/{len(questions)} questions")
+        with open(results_path, "w", encoding="utf-8") as results_file:
+            for count, result in enumerate(
+                st.session_state.gpt.batch_retrieval_qa(
+                    queries=questions,
+                    prompt=prompt_doc_qa(),
+                    db=local_db,
+                    retrieval_mode=retrieval_mode,
+                    bm25_index=bm25_index,
+                    max_workers=max_workers,
+                ),
+                start=1,
+            ):
+                results_file.write(json.dumps(result) + "\n")
+                results_file.flush()
+                progress.progress(
+                    count / len(questions),
+                    text=f"Answered {count}/{len(questions)} questions",
+                )
+        end_time = time.time()
+
+        csv_path = results_to_csv(results_path, results_path.replace(".jsonl", ".csv"))
+        st.success(
+            f"Answered {len(questions)} questions in {(end_time - start_time):.4f} seconds"
+        )
+        col1, col2 = st.columns(2)
+        with open(results_path, "rb") as f:
+            col1.download_button(
+                label="Download results (JSONL)",
+                data=f.read(),
+                file_name=os.path.basename(results_path),
+                use_container_width=True,
+            )
+        with open(csv_path, "rb") as f:
+            col2.download_button(
+                label="Download results (CSV)",
+                data=f.read(),
+                file_name=os.path.basename(csv_path),
+                use_container_width=True,
+            )
+
+
+def chat_with_data(vector_db):
+    """A streamlit function to hold a conversation with a collection. Follow-up questions are rewritten with the
+    conversation history, which is compacted into a running summary to keep every turn within a fixed budget.
+    """
+    collections = list_collections()
+    col1, col2 = st.columns([0.7, 0.3])
+    chat_collection = col1.selectbox(
+        label="Collection to chat with",
+        options=collections,
+        index=collections.index(vector_db.collection)
+        if vector_db.collection in collections
+        else 0,
+        placeholder="No collection is built yet",
+    )
+    retrieval_mode = col1.radio(
+        label="Retrieval mode",
+        options=RETRIEVAL_MODES,
+        index=RETRIEVAL_MODES.index(RETRIEVAL_MODE),
+        format_func=lambda mode: mode.capitalize(),
+        horizontal=True,
+    )
+    if chat_collection not in st.session_state.chat_histories:
+        st.session_state.chat_histories[chat_collection] = (CHAT_HISTORY(), [])
+    history, messages = st.session_state.chat_histories[chat_collection]
+    if col2.button(label="Clear Conversation", disabled=len(messages) == 0):
+        history.clear()
+        messages.clear()
+    col2.caption(f"History: {history.tokens()}/{history.token_budget} tokens, {len(history.turns)} recent turns")
+
+    for message in messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            if message.get("caption"):
+                st.caption(message["caption"])
+
+    question = st.chat_input(
+        placeholder="Ask a question or a follow-up", disabled=not st.session_state.valid_key
+    )
+    if not question:
+        return
+
+    start_time = time.time()
+    local_db, bm25_index = load_collection(chat_collection)
+    if local_db is None:
+        st.error("Database does not exist. Please build the database first.")
+        return
+    messages.append({"role": "user", "content": question})
+    with st.chat_message("user"):
+        st.markdown(question)
+    with st.chat_message("assistant"):
+        with st.spinner("Retrieving response ..."):
+            response = st.session_state.gpt.conversational_qa(
+                query=question,
+                prompt=prompt_doc_qa(),
+                db=local_db,
+                history=history,
+                retrieval_mode=retrieval_mode,
+                bm25_index=bm25_index,
+            )
+        if response is None:
+            st.error("Unable to answer the question.")
+            messages.pop()
+            return
+        caption = (
+            f"Searched for: {response['standalone_query']} · Tokens used: {response['tokens_used']} · "
+            f"History: {response['history_tokens']} tokens · {time.time() - start_time:.2f} seconds"
+        )
+        st.markdown(response["result"])
+        st.caption(caption)
+    messages.append({"role": "assistant", "content": response["result"], "caption": caption})
+
+
 def query_with_data():
     """A streamlit function to load the page to upload documents and query with the data. You can input data in two ways:
     1. A text document such as PDF or DOCX.
@@ -189,6 +427,16 @@ def query_with_data():
             label="Select an input option",
             options=["Upload document(s)", "Paste an URL", "Paste a YouTube URL"],
         )
+        build_collection = st.text_input(
+            label="Collection to build",
+            value=default_collections[input_option],
+            help="Each collection keeps its own index, so builds never overwrite other collections.",
+        )
+        try:
+            vector_db = VECTOR_DB_UTILS(collection=build_collection)
+        except ValueError as e:
+            st.error(e)
+            st.stop()
         if input_option == "Upload document(s)":
             input_documents()
             st.sidebar.info(
@@ -196,7 +444,7 @@ def query_with_data():
                             **Steps to Manage Knowledge Base:**\n
                             1. Browse to select files and click "Upload Documents" to upload selected files to knowledge base.
                             2. In the right side, **KB_Snapshot** tab displays file count and you can reset directory by clicking **Reset Local Directory** button.
-                            3. In the **Manage_DB** tab, click **Build Vector Database** to build the vector database. Upon successful build, File count should be 2.
+                            3. In the **Manage_DB** tab, click **Build Vector Database** to queue the build of the vector database. The build runs in the background, its progress is shown below the reset button and it can be cancelled. Upon successful build, File count should be 4.
                             4. Optionally, you can reset the vector database by clicking **Reset Vector Database** button.
                             5. Once knowledge base built, you can proceed to ask the related questions from documents.
                             """
@@ -215,23 +463,28 @@ def query_with_data():
                             value=count_files_in_directory(kb_path),
                         )
                     with tab2:
+                        append_db = st.toggle(
+                            label="Append new files to existing database",
+                            help="Only files that are not indexed yet are embedded and added to the database.",
+                        )
                         digest_button = st.button(
                             label="Build Vector Database",
                             disabled=not st.session_state.valid_key,
                             use_container_width=True,
                         )
                         if digest_button:
-                            db_state = process_documents()
+                            process_documents(vector_db, incremental=append_db)
 
                         # Drop vector database
-                        delete_vector_database()
+                        delete_vector_database(vector_db)
+                        build_jobs(vector_db.collection)
 
         elif input_option == "Paste an URL":
-            input_url()
+            input_url(vector_db)
             st.sidebar.info(
                 """
                             **Steps to Manage Knowledge Base:**\n
-                            1. Paste a Web URL or blog page URL and click on **Extract Web Page Content** to extract content and build the vector database. Upon successful build, file count should be 2.
+                            1. Paste a Web URL or blog page URL and click on **Extract Web Page Content** to extract content and queue the build of the vector database. The build runs in the background with its progress shown in the right panel. Upon successful build, file count should be 4.
                             2. Optionally, you can reset the vector database by clicking **Reset Vector Database** button.
                             3. Once knowledge base built, you can proceed to ask the related questions from documents.
                             """
@@ -240,7 +493,8 @@ def query_with_data():
             with col2:
                 with st.expander("", expanded=True):
                     # Drop vector database
-                    delete_vector_database()
+                    delete_vector_database(vector_db)
+                    build_jobs(vector_db.collection)
 
         elif input_option == "Paste a YouTube URL":
             with st.form("Input_WebURL"):
@@ -256,23 +510,20 @@ def query_with_data():
                 if submit_url:
                     # Validate the YouTube Video URL
                     if validate_youtube_url(yt_url):
-                        db, db_build_time = vector_db.run_db_build(
+                        job_id = get_job_queue().submit(
+                            collection=vector_db.collection,
                             input_type="yt_url",
                             embeddings=st.session_state.gpt.embeddings,
                             source_url=yt_url,
-                            db_persist=True,
                         )
                         # video_info = vector_db._get_video_info(yt_url)
-                        if db is not None:
-                            st.info(
-                                f"Database build completed in {db_build_time:.4f} seconds"
-                            )
+                        st.info(f"Database build queued as job {job_id}.")
                     else:
                         st.error("Invalid URL. Please correct and submit again.")
             st.sidebar.info(
                 """
                             **Steps to Manage Knowledge Base:**\n
-                            1. Paste an YouTube Video URL and click on **Extract YouTube Transcript** to extract content and build the vector database. Upon successful build, file count should be 2.
+                            1. Paste an YouTube Video URL and click on **Extract YouTube Transcript** to extract content and queue the build of the vector database. The build runs in the background with its progress shown in the right panel. Upon successful build, file count should be 4.
                             2. Optionally, you can reset the vector database by clicking **Reset Vector Database** button in **Manage_DB** tab.
                             3. **Video Details** tab provides video info and **Watch Video** provides the embedded YouTube video to watch.
                             4. Once knowledge base built, you can proceed to ask the related questions from documents.
@@ -286,7 +537,8 @@ def query_with_data():
                     )
                     with tab1:
                         # Drop vector database
-                        delete_vector_database()
+                        delete_vector_database(vector_db)
+                        build_jobs(vector_db.collection)
                     if validate_youtube_url(yt_url):
                         with tab2:
                             video_info = vector_db._get_video_info(yt_url)
@@ -300,11 +552,40 @@ def query_with_data():
     st.divider()
     response = None
 
+    query_mode = st.radio(
+        label="Select a query option",
+        options=["Ask a question", "Chat", "Upload a question file"],
+        horizontal=True,
+    )
+    if query_mode == "Upload a question file":
+        batch_query_with_data(vector_db)
+        return
+    if query_mode == "Chat":
+        chat_with_data(vector_db)
+        return
+
     with st.form("QnA_Data"):
+        collections = list_collections()
+        query_collection = st.selectbox(
+            label="Collection to query",
+            options=collections,
+            index=collections.index(vector_db.collection)
+            if vector_db.collection in collections
+            else 0,
+            placeholder="No collection is built yet",
+        )
         input_query = st.text_input(
             label="Please enter the query that can be answered from available database",
             placeholder="Enter your query",
         )
+        retrieval_mode = st.radio(
+            label="Retrieval mode",
+            options=RETRIEVAL_MODES,
+            index=RETRIEVAL_MODES.index(RETRIEVAL_MODE),
+            format_func=lambda mode: mode.capitalize(),
+            horizontal=True,
+            help="Lexical mode matches exact identifiers and runs retrieval locally, vector mode matches by meaning and hybrid fuses both.",
+        )
         return_source_docs = st.toggle(label="Return Source documents info", value=True)
         submit_query = st.form_submit_button(
             label="Submit Query", disabled=not st.session_state.valid_key
@@ -312,7 +593,7 @@ def query_with_data():
 
     if submit_query:
         start_time = time.time()
-        local_db = vector_db.load_local_db(embeddings=st.session_state.gpt.embeddings)
+        local_db, bm25_index = load_collection(query_collection)
         if local_db is not None:
             with st.spinner("Retrieving response ..."):
                 response = st.session_state.gpt.retrieval_qa(
@@ -320,6 +601,8 @@ def query_with_data():
                     prompt=prompt_doc_qa(),
                     db=local_db,
                     return_source_documents=return_source_docs,
+                    retrieval_mode=retrieval_mode,
+                    bm25_index=bm25_index,
                 )
         else:
             st.error("Database does not exist. Please build the database first.")
@@ -345,7 +628,10 @@ def query_with_data():
                 unsafe_allow_html=True,
             )
         st.markdown(
-            f"<p style='font-size: smaller; color: green;'>Reponse time: {(end_time - start_time):.4f} seconds</p>",
+            f"<p style='font-size: smaller; color: green;'>Reponse time: {(end_time - start_time):.4f} seconds</br>"
+            f"Tokens used: {response['tokens_used']}</br>"
+            f"Context tokens: {response['context_stats']['context_tokens']} "
+            f"(saved {response['context_stats']['tokens_saved']} of {response['context_stats']['retrieved_tokens']} retrieved)</p>",
             unsafe_allow_html=True,
         )
 
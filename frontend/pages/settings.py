@@ -11,8 +11,6 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
 src_path = os.path.abspath(os.path.join(project_root, "src"))
 sys.path.insert(0, src_path)
 
-from gpt_utils import GPT_UTILS
-
 icon = Image.open("assets/Everything-GPT.ico")
 
 
@@ -61,6 +59,9 @@ def page_config():
         )
         configure_api_key = api_key_form.form_submit_button("Configure API Key")
 
+        # Imported here so pages render without loading the GPT utilities until a key is configured
+        from gpt_utils import GPT_UTILS
+
         if configure_api_key:
             # Validate the API Key
             if openai_api_key_input:
@@ -74,9 +75,10 @@ def page_config():
             st.warning("Please configure your OpenAI API key!")
         else:
             st.success("OpenAI API Key is Configured!")
-            st.session_state.gpt = GPT_UTILS(
-                api_key=st.session_state.get("OPENAI_API_KEY", "")
-            )
+            api_key = st.session_state.get("OPENAI_API_KEY", "")
+            # Reuse the client of the session so its embeddings and connections are created once
+            if getattr(st.session_state.gpt, "api_key", None) != api_key:
+                st.session_state.gpt = GPT_UTILS(api_key=api_key)
 
 
 @st.cache_resource
@@ -10,8 +10,6 @@ import os
 import sys
 import time
 import streamlit as st
-import docx2txt
-from pdfminer.high_level import extract_text
 from pages.settings import (
     page_config,
     custom_css,
@@ -196,21 +194,8 @@ def summary_document():
         )
         if submit_button:
             file_path, file_type = write_uploaded_file(upload_document, temp_dir)
-            extracted_text = ""
-            # st.write(file_type)
-            if file_type == "application/pdf":
-                # Extract PDF text
-                extracted_text = extract_text(file_path)
-            elif (
-                file_type
-                == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            ):
-                # Extract DOCX text
-                extracted_text = docx2txt.process(file_path)
-            elif file_type == "text/plain":
-                # Extract TXT file contents
-                with open(file_path) as f:
-                    extracted_text = f.read()
+            # Extract PDF, DOCX or TXT text, reusing the cached extraction of the same file
+            extracted_text = vector_db.extract_file_text(file_path)
 
             if extracted_text is not None:
                 num_tokens = st.session_state.gpt.num_tokens_from_string(extracted_text)
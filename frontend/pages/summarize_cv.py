@@ -5,9 +5,7 @@
 """
 import os
 import sys
-import json
 import time
-import docx2txt
 import streamlit as st
 from pages.settings import (
     page_config,
@@ -16,16 +14,18 @@ from pages.settings import (
     write_uploaded_file,
     switch_main,
 )
-from pdfminer.high_level import extract_text
 
 # Get the absolute path to the project root directory
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
 src_path = os.path.abspath(os.path.join(project_root, "src"))
 sys.path.insert(0, src_path)
 
-from prompts import summarize_cv, extract_cv_details
-from json_schema import response_schema
+from prompts import summarize_cv
+from cv_utils import CV_EXTRACTOR
+from db_utils import VECTOR_DB_UTILS
 
+# Initialize database class for cached document extraction
+vector_db = VECTOR_DB_UTILS()
 
 resume_path = f"{project_root}/resumes"
 
@@ -82,17 +82,8 @@ with col1:
 
     if submit_button:
         file_path, file_type = write_uploaded_file(uploaded_file, resume_path)
-        extracted_text = ""
-        # st.write(file_type)
-        if file_type == "application/pdf":
-            # Extract PDF text
-            extracted_text = extract_text(file_path)
-        elif (
-            file_type
-            == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        ):
-            # Extract DOCX text
-            extracted_text = docx2txt.process(file_path)
+        # Extract PDF or DOCX text, reusing the cached extraction of the same file
+        extracted_text = vector_db.extract_file_text(file_path)
 
         if len(extracted_text) != 0:
             if output_type == "Text Summary":
@@ -115,17 +106,12 @@ with col1:
                 # Start timer
                 start_time = time.time()
 
-                prompt, cv_details_schema = extract_cv_details(
-                    resume_context=extracted_text, response_schema=response_schema
-                )
-                gpt_response = st.session_state.gpt.get_completion_from_messages(
-                    messages=prompt, functions=cv_details_schema
-                )
-                gpt_summary = gpt_response.choices[0].message.tool_calls[0].function.arguments
-                tokens_used = gpt_response.usage.total_tokens
-                # st.markdown("#### GPT Response:")
-                # st.markdown(gpt_summary)
-                json_response = json.loads(gpt_summary)
+                # Resume sections are extracted in parallel requests and merged into the response schema
+                extraction = CV_EXTRACTOR(st.session_state.gpt).extract(extracted_text)
+                tokens_used = extraction["tokens_used"]
+                json_response = extraction["cv_details"]
+                for error in extraction["errors"]:
+                    st.warning(error)
 
                 # End timer
                 end_time = time.time()
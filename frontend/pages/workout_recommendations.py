@@ -14,8 +14,14 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
 src_path = os.path.abspath(os.path.join(project_root, "src"))
 sys.path.insert(0, src_path)
 
-# Loading prompt templates and GPT Utilities from src
-from prompts import recommend_workouts
+# Loading the workout plan store from src
+from workout_utils import (
+    WORKOUT_PLAN_STORE,
+    FITNESS_GOALS,
+    FITNESS_LEVELS,
+    WORKOUT_STYLES,
+    WORKOUT_LOCATIONS,
+)
 
 
 
@@ -39,6 +45,7 @@ def workout_recommender():
     workout_plan = ""
     tokens_used = 0
     execution_time = 0.00
+    served_from_store = False
 
     if not st.session_state.valid_key:
         st.warning("Invalid or No OpenAI API Key configured. Please re-configure your OpenAI API Key.")
@@ -47,13 +54,13 @@ def workout_recommender():
 
     with col1.form("Fitness_Requirements", clear_on_submit=False):
         Fitness_Goal = st.radio(label="What's your fitness goal?",
-                                options=['Build Muscle', 'Lose Weight', 'Improve Endurance', 'Increase Flexibility'],
+                                options=FITNESS_GOALS,
                                 horizontal=True,)
         Fitness_Level = st.radio(label="What's your fitness level?",
-                                options=['Beginner', 'Intermediate', 'Advanced', 'Pro-Level'],
+                                options=FITNESS_LEVELS,
                                 horizontal=True,)
         Workout_style = st.multiselect(label="What's your preferred workout style?",
-                                options=['Weight Lifting 🏋🏻', 'Cardio 🏃🏻‍♂️', 'Yoga 🧘🏻‍♀️', 'Pilates 🤸🏻'],
+                                options=WORKOUT_STYLES,
                                 placeholder="Please select your preferred workout styles")
                                 # captions=['🏋🏻', '🏃🏻‍♂️', '🧘🏻‍♀️', '🤸🏻'],
                                 # horizontal=True,)
@@ -61,7 +68,9 @@ def workout_recommender():
                                 min_value=1,
                                 max_value=7)
         Workout_Location = st.radio(label="Where do you prefer to workout?",
-                                options=['Home Only','Gym or Fitness Studio'])
+                                options=WORKOUT_LOCATIONS)
+        refresh = st.checkbox(label="Generate a fresh plan",
+                                help="Plans are stored per choice of inputs. Check to replace the stored plan with a new one.")
         submit = st.form_submit_button(label="Get the Workout Routine 💪🏻",
                                         disabled=not st.session_state.valid_key)
     
@@ -79,10 +88,11 @@ def workout_recommender():
                 # Start timer
                 start_time = time.time()
 
-                prompt = recommend_workouts(user_inputs=user_inputs)
-                gpt_response = st.session_state.gpt.get_completion_from_messages(messages=prompt)
-                workout_plan = gpt_response.choices[0].message.content
-                tokens_used = gpt_response.usage.total_tokens
+                entry, served_from_store = WORKOUT_PLAN_STORE().serve(
+                    st.session_state.gpt, user_inputs, refresh=refresh
+                )
+                workout_plan = entry["workout_plan"]
+                tokens_used = 0 if served_from_store else entry["tokens_used"]
 
                 # End timer
                 end_time = time.time()
@@ -100,6 +110,8 @@ def workout_recommender():
                 st.markdown("### Workout Plan:")
                 st.divider()
                 st.write(workout_plan)
+                if served_from_store:
+                    st.caption("Served from the workout plan store. Check 'Generate a fresh plan' for a new one.")
                 st.markdown(
                     f"<p style='font-size: smaller; color: green;'>Tokens used: {tokens_used}</br>Executed in {execution_time:.4f} seconds",
                     unsafe_allow_html=True,
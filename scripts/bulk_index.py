@@ -0,0 +1,310 @@
+""" A command line tool to index a directory tree into a named collection the Streamlit app can query.
+    Files are extracted and split in parallel worker processes, near-duplicate chunks are optionally dropped and
+    the remaining chunks are embedded in checkpointed batches through the rate limited embedding dispatcher.
+    Progress is checkpointed after every file and every embedding batch, so an interrupted build resumes
+    where it stopped when the same command is run again.
+
+    Run with: python scripts/bulk_index.py <directory> --collection <name> [--append] [--restart] [--dedup | --no-dedup]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+src_path = os.path.abspath(os.path.join(project_root, "src"))
+sys.path.insert(0, src_path)
+
+from db_utils import VECTOR_DB_UTILS
+from embedding_utils import (
+    get_embeddings,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_DISPATCHER,
+    HASHED_TFIDF_EMBEDDINGS,
+)
+from dedup_utils import DEDUP_ENABLED
+from retrieval_utils import BM25_INDEX
+from langchain.docstore.document import Document
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+EXTRACTION_CACHE_DIR = config["EXTRACTION_CACHE_DIR"]  # Checkpoints are kept next to the extraction cache
+
+checkpoint_root = os.path.join(project_root, os.path.dirname(EXTRACTION_CACHE_DIR), "bulk_index")
+
+SUPPORTED_EXTENSIONS = [".pdf", ".docx", ".txt", ".xlsx"]
+
+
+def find_files(input_dir) -> list:
+    """A function to list the supported files of a directory tree in a stable order."""
+    file_paths = []
+    for folder, _, file_names in os.walk(input_dir):
+        for file_name in file_names:
+            if os.path.splitext(file_name)[1].lower() in SUPPORTED_EXTENSIONS:
+                file_paths.append(os.path.abspath(os.path.join(folder, file_name)))
+    return sorted(file_paths)
+
+
+def extract_and_split(file_path) -> dict:
+    """A function run in a worker process to extract a file and split it into chunks."""
+    vector_db = VECTOR_DB_UTILS()
+    chunks = vector_db.process_documents(vector_db.load_file_documents(file_path)) or []
+    return {
+        "file": file_path,
+        "chunks": [{"page_content": chunk.page_content, "metadata": chunk.metadata} for chunk in chunks],
+    }
+
+
+class CHECKPOINT:
+    """A class to persist the progress of a bulk build: the chunks of every extracted file and every embedded batch."""
+
+    def __init__(self, collection) -> None:
+        self.path = os.path.join(checkpoint_root, collection)
+        self.state_file = os.path.join(self.path, "state.json")
+        self.chunks_file = os.path.join(self.path, "chunks.jsonl")
+        self.vectors_path = os.path.join(self.path, "vectors")
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.state_file)
+
+    def clear(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def load_state(self) -> dict:
+        with open(self.state_file) as f:
+            return json.load(f)
+
+    def save_state(self, state) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(state, f, indent=4)
+        os.replace(temp_file, self.state_file)
+
+    def extracted(self) -> list:
+        """A method to return the extracted files in checkpoint order, ignoring a partially written last line."""
+        if not os.path.isfile(self.chunks_file):
+            return []
+        records = []
+        with open(self.chunks_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+        return records
+
+    def add_extracted(self, record, chunks_file) -> None:
+        chunks_file.write(json.dumps(record) + "\n")
+        chunks_file.flush()
+        os.fsync(chunks_file.fileno())
+
+    def batch_file(self, batch_index) -> str:
+        return os.path.join(self.vectors_path, f"batch_{batch_index:06d}.npy")
+
+    def has_batch(self, batch_index) -> bool:
+        return os.path.isfile(self.batch_file(batch_index))
+
+    def save_batch(self, batch_index, vectors) -> None:
+        os.makedirs(self.vectors_path, exist_ok=True)
+        temp_file = self.batch_file(batch_index) + ".tmp.npy"
+        np.save(temp_file, np.asarray(vectors, dtype=np.float32))
+        os.replace(temp_file, self.batch_file(batch_index))
+
+    def load_batch(self, batch_index) -> np.ndarray:
+        return np.load(self.batch_file(batch_index))
+
+
+def print_throughput(stage, count, unit, seconds) -> None:
+    rate = count / seconds if seconds > 0 else float("inf")
+    print(f"{stage:<10} {count:>8} {unit:<7} in {seconds:9.2f}s  {rate:10.1f} {unit}/s")
+
+
+def extract_files(checkpoint, file_paths, workers) -> list:
+    """A function to extract and split the files not extracted yet on worker processes, checkpointing every file."""
+    records = checkpoint.extracted()
+    done = {record["file"] for record in records}
+    pending = [file_path for file_path in file_paths if file_path not in done]
+    print(f"Extracting {len(pending)} files ({len(done)} already extracted) on {workers} processes")
+
+    start_time = time.time()
+    failed = []
+    with open(checkpoint.chunks_file, "a", encoding="utf-8") as chunks_file, ProcessPoolExecutor(
+        max_workers=workers
+    ) as executor:
+        futures = {executor.submit(extract_and_split, file_path): file_path for file_path in pending}
+        for count, future in enumerate(as_completed(futures), start=1):
+            try:
+                record = future.result()
+            except Exception as e:
+                print(f"Skipping {futures[future]}: {e}")
+                failed.append(futures[future])
+                continue
+            checkpoint.add_extracted(record, chunks_file)
+            records.append(record)
+            if count % 50 == 0 or count == len(pending):
+                print(f"  extracted {count}/{len(pending)} files")
+    seconds = time.time() - start_time
+    print_throughput("extract", len(pending) - len(failed), "docs", seconds)
+    return records
+
+
+def embed_chunks(checkpoint, embeddings, chunks, batch_size, workers) -> np.ndarray:
+    """A function to embed the chunks in checkpointed batches, skipping the batches embedded by a previous run.
+    Remote embeddings go through one dispatcher, so every batch shares its rate limits and retries.
+    """
+    texts = [chunk.page_content for chunk in chunks]
+    token_counts = [chunk.metadata.get("num_tokens", 0) for chunk in chunks]
+    batches = list(range(0, len(texts), batch_size))
+    pending = [index for index, _ in enumerate(batches) if not checkpoint.has_batch(index)]
+    print(f"Embedding {len(texts)} chunks in {len(batches)} batches ({len(batches) - len(pending)} already embedded)")
+
+    dispatcher = None
+    if not isinstance(embeddings, HASHED_TFIDF_EMBEDDINGS):
+        dispatcher = EMBEDDING_DISPATCHER(embeddings, max_concurrency=workers)
+
+    start_time = time.time()
+    requests, retries = 0, 0
+    for count, batch_index in enumerate(pending, start=1):
+        start = batches[batch_index]
+        batch_texts = texts[start : start + batch_size]
+        if dispatcher is None:
+            # Local embeddings are computed in vectorized batches on the CPU, there is no request to dispatch
+            vectors = embeddings.embed_documents(batch_texts)
+        else:
+            vectors = dispatcher.embed(batch_texts, token_counts=token_counts[start : start + batch_size])
+            requests += dispatcher.stats["requests"]
+            retries += dispatcher.stats["retries"]
+        checkpoint.save_batch(batch_index, vectors)
+        if count % 10 == 0 or count == len(pending):
+            print(f"  embedded {count}/{len(pending)} batches")
+    embedded = sum(min(batch_size, len(texts) - batches[index]) for index in pending)
+    if dispatcher is not None:
+        print(f"  sent {requests} requests with {retries} retries")
+    print_throughput("embed", embedded, "chunks", time.time() - start_time)
+
+    return np.vstack([checkpoint.load_batch(index) for index in range(len(batches))])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a directory tree into a named collection.")
+    parser.add_argument("input_dir", help="Directory searched recursively for PDF, DOCX, TXT and XLSX files")
+    parser.add_argument("--collection", default="documents", help="Name of the collection to build")
+    parser.add_argument("--append", action="store_true", help="Add the files that are not indexed yet to the existing collection")
+    parser.add_argument("--restart", action="store_true", help="Discard the checkpoint of a previous run")
+    parser.add_argument("--dedup", action="store_true", help="Drop near-duplicate chunks even when DEDUP_ENABLED is off")
+    parser.add_argument("--no-dedup", action="store_true", help="Embed near-duplicate chunks instead of dropping them")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Extraction processes")
+    parser.add_argument(
+        "--embedding-workers", type=int, default=EMBEDDING_MAX_CONCURRENCY, help="Concurrent embedding requests"
+    )
+    parser.add_argument("--batch-size", type=int, default=2000, help="Chunks per checkpointed embedding batch")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="OpenAI API key, defaults to $OPENAI_API_KEY")
+    parser.add_argument("--base-url", default=None, help="Optional OpenAI compatible endpoint")
+    args = parser.parse_args()
+
+    vector_db = VECTOR_DB_UTILS(collection=args.collection)
+    embeddings = get_embeddings(EMBEDDING_BACKEND, api_key=args.api_key, base_url=args.base_url)
+    existing_db = vector_db.load_local_db(embeddings) if args.append else None
+
+    checkpoint = CHECKPOINT(args.collection)
+    if args.restart:
+        checkpoint.clear()
+    settings = {
+        "input_dir": os.path.abspath(args.input_dir),
+        "append": args.append,
+        "batch_size": args.batch_size,
+        "embedding_backend": EMBEDDING_BACKEND,
+        "dedup": (DEDUP_ENABLED or args.dedup) and not args.no_dedup,
+    }
+    if checkpoint.exists():
+        state = checkpoint.load_state()
+        if state["settings"] != settings:
+            sys.exit(
+                f"A checkpoint of a build with other settings exists in {checkpoint.path}. "
+                "Run again with the same arguments to resume it or pass --restart."
+            )
+        file_paths = state["files"]
+        print(f"Resuming the build of '{args.collection}' from {checkpoint.path}")
+    else:
+        file_paths = find_files(args.input_dir)
+        if existing_db is not None:
+            indexed_sources = set((vector_db.read_manifest() or {}).get("sources", []))
+            file_paths = [file_path for file_path in file_paths if file_path not in indexed_sources]
+        state = {"settings": settings, "files": file_paths, "stage": "extract"}
+        checkpoint.save_state(state)
+
+    if not file_paths:
+        print("No new file to index.")
+        checkpoint.clear()
+        return
+
+    build_start = time.time()
+    records = extract_files(checkpoint, file_paths, args.workers)
+    chunks = [Document(**chunk) for record in records for chunk in record["chunks"]]
+    if not chunks:
+        sys.exit("No text could be extracted from the files.")
+    if settings["dedup"]:
+        # Deduplication is deterministic, so a resumed build finds the same chunks for its embedded batches
+        dedup_start = time.time()
+        chunks = vector_db.deduplicate_chunks(chunks, existing_db)
+        print_throughput("dedup", vector_db.dedup_report["chunks"], "chunks", time.time() - dedup_start)
+        print(f"  dropped {vector_db.dedup_report['dropped']} near-duplicate chunks")
+    if not chunks:
+        print("Every new chunk is a duplicate of an indexed chunk.")
+        checkpoint.clear()
+        return
+    texts = [chunk.page_content for chunk in chunks]
+    metadatas = [chunk.metadata for chunk in chunks]
+
+    state["stage"] = "embed"
+    checkpoint.save_state(state)
+    if isinstance(embeddings, HASHED_TFIDF_EMBEDDINGS):
+        if existing_db is not None:
+            embeddings = existing_db.embedding_function
+        else:
+            # The local embedding model is fitted on the chunks of the collection it embeds
+            embeddings = embeddings.fit(texts)
+    vectors = embed_chunks(checkpoint, embeddings, chunks, args.batch_size, args.embedding_workers)
+
+    index_start = time.time()
+    if existing_db is not None:
+        db = existing_db
+        bm25_index = vector_db.load_bm25_index(db)
+        doc_ids = db.add_embeddings(list(zip(texts, vectors.tolist())), metadatas)
+        bm25_index.add_documents(doc_ids, texts)
+    else:
+        from langchain.vectorstores import FAISS
+
+        db = FAISS.from_embeddings(list(zip(texts, vectors.tolist())), embeddings, metadatas)
+        bm25_index = BM25_INDEX.from_db(db)
+    vector_db.complete_dedup_report(db)
+    if vector_db.dedup_report is not None:
+        print(
+            f"Deduplication saved {vector_db.dedup_report['embeddings_saved']} embeddings and "
+            f"{vector_db.dedup_report['index_bytes_saved'] / 1024 / 1024:.2f} MB of index space"
+        )
+    vector_db.save_db(db, bm25_index, "documents")
+    print_throughput("index", len(texts), "chunks", time.time() - index_start)
+
+    seconds = time.time() - build_start
+    print_throughput("total", len(records), "docs", seconds)
+    print_throughput("total", len(texts), "chunks", seconds)
+    print(f"Collection '{args.collection}' written to {vector_db.snapshot_path} with {db.index.ntotal} chunks")
+    checkpoint.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+""" A command line tool to inspect and invalidate the extraction cache.
+    Entries are keyed by file content and extractor, so a stale extraction is removed by passing the file,
+    the extractor, or both. Without --file or --extractor, --clear removes every entry.
+
+    Run with: python scripts/extraction_cache.py [--file report.pdf ...] [--extractor pdfminer] [--clear]
+"""
+
+import os
+import sys
+import argparse
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+src_path = os.path.abspath(os.path.join(project_root, "src"))
+sys.path.insert(0, src_path)
+
+from cache_utils import EXTRACTION_CACHE, EXTRACTOR_VERSIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and invalidate the extraction cache.")
+    parser.add_argument("--file", nargs="+", default=[], help="Remove the entries of these files")
+    parser.add_argument("--extractor", choices=sorted(EXTRACTOR_VERSIONS), help="Remove the entries of this extractor")
+    parser.add_argument("--clear", action="store_true", help="Remove every entry")
+    args = parser.parse_args()
+
+    cache = EXTRACTION_CACHE()
+    removed = 0
+    if args.file:
+        for file_path in args.file:
+            if not os.path.isfile(file_path):
+                sys.exit(f"File not found: {file_path}")
+            removed += cache.invalidate(file_path=file_path, extractor=args.extractor)
+    elif args.extractor or args.clear:
+        removed = cache.invalidate(extractor=args.extractor)
+    if args.file or args.extractor or args.clear:
+        print(f"Removed {removed} cache entries.")
+
+    stats = cache.stats()
+    print(
+        f"{stats['entries']} entries, {stats['size_mb']:.1f} MB of {stats['max_size_mb']:.0f} MB in {cache.cache_dir}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+""" A command line tool to pre-generate workout plans so the workout recommendations page serves them instantly.
+    Inputs are generated in order of how often they were submitted, followed by the rest of the input space.
+    Plans already stored are skipped unless --refresh is passed, so the job can be stopped and run again.
+
+    Run with: python scripts/warm_workout_plans.py [--top 200 | --all] [--refresh] [--workers 4]
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+src_path = os.path.abspath(os.path.join(project_root, "src"))
+sys.path.insert(0, src_path)
+
+from gpt_utils import GPT_UTILS
+from workout_utils import WORKOUT_PLAN_STORE, WORKOUT_WARMUP_WORKERS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate the workout plans of popular inputs.")
+    parser.add_argument("--top", type=int, default=200, help="Number of most popular inputs to generate")
+    parser.add_argument("--all", action="store_true", help="Generate the whole input space")
+    parser.add_argument("--refresh", action="store_true", help="Regenerate plans that are already stored")
+    parser.add_argument("--workers", type=int, default=WORKOUT_WARMUP_WORKERS, help="Concurrent generations")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="OpenAI API key, defaults to $OPENAI_API_KEY")
+    parser.add_argument("--base-url", default=None, help="Optional OpenAI compatible endpoint")
+    args = parser.parse_args()
+
+    gpt = GPT_UTILS(api_key=args.api_key, base_url=args.base_url)
+    store = WORKOUT_PLAN_STORE()
+    candidates = store.popular_inputs(limit=None if args.all else args.top)
+    pending = [inputs for inputs in candidates if args.refresh or store.get(inputs) is None]
+    print(f"Generating {len(pending)} workout plans ({len(candidates) - len(pending)} already stored)")
+
+    start_time = time.time()
+    generated, failed, tokens_used = 0, 0, 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(store.generate, gpt, inputs) for inputs in pending]
+        for count, future in enumerate(as_completed(futures), start=1):
+            try:
+                tokens_used += future.result()["tokens_used"]
+                generated += 1
+            except Exception as e:
+                failed += 1
+                print(f"  failed: {e}")
+            if count % 10 == 0 or count == len(pending):
+                print(f"  generated {count}/{len(pending)} plans")
+
+    elapsed = time.time() - start_time
+    stats = store.stats()
+    print(
+        f"Generated {generated} plans with {tokens_used} tokens in {elapsed:.1f} s, {failed} failed. "
+        f"{stats['entries']}/{stats['input_space']} inputs are stored."
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+""" A python file to read question files and write the results of batch question answering."""
+
+import os
+import csv
+import json
+
+
+# Columns of the batch QnA results in the order they are exported
+RESULT_FIELDS = [
+    "index",
+    "question",
+    "answer",
+    "latency_seconds",
+    "retrieval_seconds",
+    "completion_seconds",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "context_tokens_saved",
+    "sources",
+    "error",
+]
+
+
+def load_questions(file_path) -> list:
+    """A function to read the questions from a CSV or JSONL file.
+
+    CSV files use the "question" column, or the first column when there is no such header.
+    JSONL lines are either plain strings or objects with a "question" key.
+    Raises ValueError for an unsupported file or a line that is not a question.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    questions = []
+
+    if ext == ".csv":
+        with open(file_path, newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.reader(f))
+        if not rows:
+            return questions
+        header = [column.strip().lower() for column in rows[0]]
+        if "question" in header:
+            column = header.index("question")
+            rows = rows[1:]
+        else:
+            column = 0
+        questions = [row[column].strip() for row in rows if len(row) > column]
+    elif ext == ".jsonl":
+        with open(file_path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    record = record.get("question")
+                if not isinstance(record, str):
+                    raise ValueError(
+                        f"Line {line_number} is neither a question string nor an object with a \"question\" text."
+                    )
+                questions.append(record.strip())
+    else:
+        raise ValueError(f"Unsupported question file extension: {ext}")
+
+    return [question for question in questions if question]
+
+
+def results_to_csv(jsonl_path, csv_path) -> str:
+    """A function to convert a JSONL file of batch QnA results into a CSV file ordered by question index."""
+    with open(jsonl_path, encoding="utf-8") as f:
+        results = [json.loads(line) for line in f if line.strip()]
+
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for result in sorted(results, key=lambda result: result["index"]):
+            writer.writerow(
+                {**result, "sources": "; ".join(source or "" for source in result.get("sources") or [])}
+            )
+
+    return csv_path
@@ -0,0 +1,178 @@
+""" A python file to cache the extracted contents of documents on local disk.
+    Entries are addressed by the content hash of the file and the extractor version,
+    so an uploaded file is parsed only once no matter which page uses it.
+"""
+
+import os
+import json
+import hashlib
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+EXTRACTION_CACHE_DIR = config["EXTRACTION_CACHE_DIR"]  # Load extraction cache directory name
+EXTRACTION_CACHE_MAX_MB = config[
+    "EXTRACTION_CACHE_MAX_MB"
+]  # Maximum size of the extraction cache on disk in megabytes
+
+
+extraction_cache_path = f"{project_root}/{EXTRACTION_CACHE_DIR}"
+
+# Version of each extractor. Bump a version when the extractor output changes to invalidate old entries.
+EXTRACTOR_VERSIONS = {
+    "pdfminer": "1",
+    "docx2txt": "1",
+    "text": "1",
+    "unstructured_docx": "1",
+    "unstructured_excel": "1",
+    "openpyxl_rows": f"1-{config['SPREADSHEET_CHUNK_TOKENS']}",  # Row chunks change with their token bound
+}
+
+# Writes after which the cache size is counted on disk again, other processes may write to the same cache
+SIZE_RESCAN_WRITES = 256
+# Share of the size limit the cache is evicted down to, so a full cache is not walked again on the next write
+EVICTION_TARGET = 0.9
+
+
+class EXTRACTION_CACHE:
+    """A class to store and reuse the extracted document contents keyed by file content hash."""
+
+    def __init__(
+        self, cache_dir=extraction_cache_path, max_size_mb=EXTRACTION_CACHE_MAX_MB
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.total_size = None  # Running size of the entries in bytes, counted on the first write
+        self.writes_since_scan = 0
+
+    def file_hash(self, file_path) -> str:
+        """A method to calculate the sha256 hash of the file contents."""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _entry_path(self, content_hash, extractor) -> str:
+        """A method to get the cache file path for a content hash and extractor."""
+        version = EXTRACTOR_VERSIONS.get(extractor, "1")
+        return os.path.join(
+            self.cache_dir, content_hash[:2], f"{content_hash}_{extractor}_v{version}.json"
+        )
+
+    def get(self, file_path, extractor, content_hash=None):
+        """A method to return the cached records of a file, or None when the file is not cached."""
+        content_hash = content_hash or self.file_hash(file_path)
+        entry_path = self._entry_path(content_hash, extractor)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            os.utime(entry_path)  # Mark the entry as recently used for eviction
+            return records
+        except (OSError, ValueError):
+            return None
+
+    def put(self, file_path, extractor, records, content_hash=None) -> None:
+        """A method to write the extracted records of a file to the cache."""
+        content_hash = content_hash or self.file_hash(file_path)
+        entry_path = self._entry_path(content_hash, extractor)
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            previous_size = os.path.getsize(entry_path) if os.path.exists(entry_path) else 0
+            temp_path = f"{entry_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(records, f)
+            os.replace(temp_path, entry_path)  # Readers never see a half written entry
+            self._add_size(os.path.getsize(entry_path) - previous_size)
+        except OSError as e:
+            print(f"Error while writing extraction cache entry: {e}")
+
+    def _entries(self) -> list:
+        """A method to list the cache entries as (path, size, last_used) tuples."""
+        entries = []
+        if not os.path.exists(self.cache_dir):
+            return entries
+        for root, _, files in os.walk(self.cache_dir):
+            for file_name in files:
+                if not file_name.endswith(".json"):
+                    continue
+                entry_path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                entries.append((entry_path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _add_size(self, size) -> None:
+        """A method to update the running size of the cache after a write and evict once it exceeds the limit.
+        The cache directory is only walked on the first write, every SIZE_RESCAN_WRITES writes and to evict.
+        """
+        if self.total_size is None or self.writes_since_scan >= SIZE_RESCAN_WRITES:
+            self.total_size = sum(entry_size for _, entry_size, _ in self._entries())
+            self.writes_since_scan = 0
+        else:
+            self.total_size += size
+            self.writes_since_scan += 1
+        if self.total_size > self.max_size_bytes:
+            self.evict()
+
+    def evict(self) -> int:
+        """A method to remove least recently used entries once the cache exceeds its size limit.
+        Entries are removed until the cache is down to EVICTION_TARGET of the limit.
+        """
+        entries = self._entries()
+        self.total_size = sum(size for _, size, _ in entries)
+        self.writes_since_scan = 0
+        removed = 0
+        if self.total_size <= self.max_size_bytes:
+            return removed
+        for entry_path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if self.total_size <= self.max_size_bytes * EVICTION_TARGET:
+                break
+            try:
+                os.remove(entry_path)
+                self.total_size -= size
+                removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def invalidate(self, file_path=None, extractor=None) -> int:
+        """A method to remove cache entries and return the number of removed entries.
+
+        Entries of the given file and/or extractor are removed. Without arguments the whole cache is cleared.
+        """
+        content_hash = self.file_hash(file_path) if file_path else None
+        removed = 0
+        for entry_path, _, _ in self._entries():
+            entry_hash, entry_extractor = os.path.basename(entry_path).rsplit("_v", 1)[
+                0
+            ].split("_", 1)
+            if content_hash is not None and entry_hash != content_hash:
+                continue
+            if extractor is not None and entry_extractor != extractor:
+                continue
+            try:
+                os.remove(entry_path)
+                removed += 1
+            except OSError:
+                continue
+        self.total_size = None  # Counted again on the next write
+        return removed
+
+    def stats(self) -> dict:
+        """A method to return the number of entries and size of the cache."""
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "size_mb": sum(size for _, size, _ in entries) / (1024 * 1024),
+            "max_size_mb": self.max_size_bytes / (1024 * 1024),
+        }
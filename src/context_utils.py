@@ -0,0 +1,188 @@
+""" A python file to pack retrieved chunks into a token budgeted context for the question answering prompt.
+    Chunks below a relevance cutoff are dropped, overlapping chunks of the same source are merged
+    and the most relevant text is packed first.
+"""
+
+import os
+import json
+from functools import lru_cache
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+default_model = config["DEFAULT_MODEL"]  # Default gpt model used to count tokens
+CONTEXT_TOKEN_BUDGET = config[
+    "CONTEXT_TOKEN_BUDGET"
+]  # Maximum number of context tokens stuffed into the QnA prompt
+CONTEXT_SCORE_CUTOFF = config[
+    "CONTEXT_SCORE_CUTOFF"
+]  # Chunks with relevance score below the cutoff are not packed
+
+CONTEXT_SEPARATOR = "\n\n"  # Separator between packed chunks, same as the stuff chain
+CHARS_PER_TOKEN = 4  # Average characters of an English token, used when no encoding can be loaded
+
+
+class CHARACTER_ESTIMATE_ENCODING:
+    """A class to estimate tokens as fixed length character pieces, with the methods of a tiktoken encoding used here."""
+
+    def encode(self, text, disallowed_special=()) -> list:
+        return [text[start : start + CHARS_PER_TOKEN] for start in range(0, len(text), CHARS_PER_TOKEN)]
+
+    def encode_batch(self, texts, disallowed_special=()) -> list:
+        return [self.encode(text) for text in texts]
+
+    def decode(self, tokens) -> str:
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """A function to load the token encoding of the default model once.
+    tiktoken downloads the encoding on first use, so without network access and without a pre-seeded
+    TIKTOKEN_CACHE_DIR the token counts are estimated from the text length instead.
+    """
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(default_model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Warning: token encoding could not be loaded, estimating token counts from text length: {e}")
+        return CHARACTER_ESTIMATE_ENCODING()
+
+
+def token_encoding_available() -> bool:
+    """A function to check whether the tiktoken encoding loaded, rather than the length estimate."""
+    return not isinstance(_get_encoding(), CHARACTER_ESTIMATE_ENCODING)
+
+
+def count_tokens(text: str) -> int:
+    """A function to count the number of tokens in a text string."""
+    return len(_get_encoding().encode(text, disallowed_special=()))
+
+
+def count_tokens_batch(texts) -> list:
+    """A function to count the number of tokens of several text strings in one batch."""
+    return [
+        len(tokens)
+        for tokens in _get_encoding().encode_batch(list(texts), disallowed_special=())
+    ]
+
+
+def _chunk_tokens(document) -> int:
+    """A function to get the precomputed token count of a chunk, counting it when it is missing."""
+    num_tokens = document.metadata.get("num_tokens")
+    return num_tokens if num_tokens is not None else count_tokens(document.page_content)
+
+
+class CONTEXT_BUILDER:
+    """A class to build the QnA context from retrieved chunks within a token budget."""
+
+    def __init__(
+        self, token_budget=CONTEXT_TOKEN_BUDGET, score_cutoff=CONTEXT_SCORE_CUTOFF
+    ) -> None:
+        self.token_budget = token_budget
+        self.score_cutoff = score_cutoff
+
+    def merge_chunks(self, documents) -> list:
+        """A method to merge adjacent or overlapping chunks of the same source into single segments."""
+        from langchain.docstore.document import Document
+
+        by_source = {}
+        unpositioned = []
+        for document in documents:
+            if "start_index" in document.metadata:
+                by_source.setdefault(document.metadata.get("source"), []).append(document)
+            else:
+                unpositioned.append(document)
+
+        merged = []
+        for chunks in by_source.values():
+            chunks.sort(key=lambda chunk: chunk.metadata["start_index"])
+            segment = chunks[0]
+            for chunk in chunks[1:]:
+                segment_end = segment.metadata["start_index"] + len(segment.page_content)
+                chunk_start = chunk.metadata["start_index"]
+                if chunk_start > segment_end:
+                    merged.append(segment)
+                    segment = chunk
+                    continue
+                # Append only the part of the chunk that is not already in the segment
+                tail = chunk.page_content[segment_end - chunk_start :]
+                page_content = segment.page_content + tail
+                segment = Document(
+                    page_content=page_content,
+                    metadata={
+                        **segment.metadata,
+                        "relevance_score": max(
+                            segment.metadata.get("relevance_score", 0.0),
+                            chunk.metadata.get("relevance_score", 0.0),
+                        ),
+                        "num_tokens": count_tokens(page_content),
+                    },
+                )
+            merged.append(segment)
+
+        return merged + unpositioned
+
+    def build(self, documents):
+        """A method to pack the retrieved chunks into a context string.
+        Returns the context, the packed segments and token statistics of the packing.
+        """
+        from langchain.docstore.document import Document
+
+        retrieved_tokens = sum(_chunk_tokens(document) for document in documents)
+
+        relevant = [
+            document
+            for document in documents
+            if document.metadata.get("relevance_score", 1.0) >= self.score_cutoff
+        ]
+        segments = sorted(
+            self.merge_chunks(relevant),
+            key=lambda segment: segment.metadata.get("relevance_score", 0.0),
+            reverse=True,
+        )
+
+        packed = []
+        context_tokens = 0
+        separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+        for segment in segments:
+            segment_tokens = _chunk_tokens(segment) + (separator_tokens if packed else 0)
+            if context_tokens + segment_tokens <= self.token_budget:
+                packed.append(segment)
+                context_tokens += segment_tokens
+            elif not packed:
+                # Truncate the most relevant segment when it alone exceeds the budget
+                encoding = _get_encoding()
+                page_content = encoding.decode(
+                    encoding.encode(segment.page_content, disallowed_special=())[
+                        : self.token_budget
+                    ]
+                )
+                packed.append(
+                    Document(
+                        page_content=page_content,
+                        metadata={**segment.metadata, "num_tokens": self.token_budget},
+                    )
+                )
+                context_tokens = self.token_budget
+
+        context = CONTEXT_SEPARATOR.join(segment.page_content for segment in packed)
+        stats = {
+            "retrieved_chunks": len(documents),
+            "packed_segments": len(packed),
+            "retrieved_tokens": retrieved_tokens,
+            "context_tokens": context_tokens,
+            "tokens_saved": max(retrieved_tokens - context_tokens, 0),
+        }
+        return context, packed, stats
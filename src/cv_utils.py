@@ -0,0 +1,348 @@
+""" A python file to extract the CV details in parallel, one request per group of resume sections.
+    The resume text is segmented locally by its section headings, and each group of sections is sent with
+    only its part of the response schema. The partial outputs are merged back into the full schema shape,
+    validated locally, and only the fields that are missing or invalid are requested again.
+"""
+
+import os
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor
+from prompts import extract_cv_details, reextract_cv_fields
+from json_schema import response_schema
+from schema_utils import compile_schema, repair_json, format_path
+from trace_utils import tracer
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+CV_EXTRACTION_WORKERS = config["CV_EXTRACTION_WORKERS"]  # Section requests of a CV running at the same time
+CV_SEGMENT_MIN_TOKENS = config[
+    "CV_SEGMENT_MIN_TOKENS"
+]  # Shorter CVs are extracted in a single request
+CV_REEXTRACT_ATTEMPTS = config["CV_REEXTRACT_ATTEMPTS"]  # Rounds of requests for fields that failed validation
+
+# Headings of the resume sections, matched on whole lines
+SECTION_HEADINGS = {
+    "personal": [
+        "personal information",
+        "personal details",
+        "personal profile",
+        "personal data",
+        "contact",
+        "contact information",
+        "contact details",
+        "languages",
+        "languages known",
+    ],
+    "summary": [
+        "summary",
+        "profile",
+        "professional summary",
+        "career summary",
+        "profile summary",
+        "about me",
+        "objective",
+        "career objective",
+        "professional profile",
+    ],
+    "education": [
+        "education",
+        "educational details",
+        "educational qualifications",
+        "academic details",
+        "academic qualifications",
+        "academics",
+        "qualifications",
+        "education and training",
+    ],
+    "experience": [
+        "experience",
+        "work experience",
+        "professional experience",
+        "employment history",
+        "employment",
+        "work history",
+        "career history",
+        "projects",
+        "project experience",
+        "professional background",
+    ],
+    "skills": [
+        "skills",
+        "technical skills",
+        "key skills",
+        "core competencies",
+        "technical summary",
+        "technical expertise",
+        "expertise",
+        "tools and technologies",
+        "skill set",
+        "technologies",
+    ],
+    "certifications": [
+        "certifications",
+        "certificates",
+        "certification",
+        "licenses and certifications",
+        "licenses & certifications",
+        "accreditations",
+    ],
+    "courses": [
+        "courses",
+        "courses completed",
+        "trainings",
+        "training",
+        "online courses",
+        "professional development",
+    ],
+}
+HEADING_SECTIONS = {
+    heading: section for section, headings in SECTION_HEADINGS.items() for heading in headings
+}
+HEADING_PATTERN = re.compile(r"^[\W\d_]*(.*?)[\s:\-–|]*$")
+
+# Schema properties extracted together, the resume sections they are read from and the sections of which
+# at least one must be found. "header" is the text before the first heading, where names and contact
+# details usually are.
+EXTRACTION_GROUPS = [
+    (["Personal_Information"], ["header", "personal", "summary"], ["header", "personal"]),
+    (["Educational_Details"], ["education"], ["education"]),
+    (
+        ["Experience_Details", "Work_Experiences"],
+        ["header", "summary", "experience", "skills"],
+        ["experience"],
+    ),
+    (["Certifications", "Courses_Completed"], ["certifications", "courses"], ["certifications", "courses"]),
+]
+
+
+# Validator of the response schema, compiled once
+CV_VALIDATOR = compile_schema(response_schema)
+
+
+def segment_resume(text) -> dict:
+    """A function to split a resume into its sections by detecting heading lines, returns section -> text."""
+    sections = {}
+    current = "header"
+    for line in text.splitlines():
+        match = HEADING_PATTERN.match(line.strip())
+        heading = match.group(1).lower() if match else ""
+        if heading in HEADING_SECTIONS and len(heading.split()) <= 4:
+            current = HEADING_SECTIONS[heading]
+            continue
+        sections.setdefault(current, []).append(line)
+    return {
+        section: "\n".join(lines).strip()
+        for section, lines in sections.items()
+        if "\n".join(lines).strip()
+    }
+
+
+def sub_schema(properties) -> dict:
+    """A function to build the response schema of a subset of the top level CV properties."""
+    return {
+        "type": "object",
+        "properties": {name: response_schema["properties"][name] for name in properties},
+        "required": list(properties),
+    }
+
+
+def empty_value(name):
+    """A function to return the empty value of a top level CV property."""
+    return [] if response_schema["properties"][name]["type"] == "array" else {}
+
+
+def failing_fields(errors) -> dict:
+    """A function to map validation errors to the fields to request again.
+    Returns property -> set of failing sub fields for objects, or None when the whole property is requested.
+    """
+    fields = {}
+    for path, _ in errors:
+        name = path[0]
+        if len(path) > 1 and response_schema["properties"][name]["type"] == "object":
+            if fields.get(name, set()) is not None:
+                fields.setdefault(name, set()).add(path[1])
+        else:
+            fields[name] = None
+    return fields
+
+
+def fields_schema(fields) -> dict:
+    """A function to build the response schema of the failing fields only."""
+    properties = {}
+    for name, sub_fields in fields.items():
+        schema = response_schema["properties"][name]
+        if sub_fields is not None:
+            schema = {
+                "type": "object",
+                "properties": {
+                    sub_name: sub_schema
+                    for sub_name, sub_schema in schema["properties"].items()
+                    if sub_name in sub_fields
+                },
+                "required": [sub_name for sub_name in schema["required"] if sub_name in sub_fields],
+            }
+        properties[name] = schema
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+
+def field_names(fields) -> list:
+    """A function to list the failing fields like Personal_Information.Email_ID."""
+    return [
+        format_path((name,) + ((sub_name,) if sub_name else ()))
+        for name, sub_fields in fields.items()
+        for sub_name in (sorted(sub_fields) if sub_fields is not None else [None])
+    ]
+
+
+class CV_EXTRACTOR:
+    """A class to extract the CV details with parallel requests per group of resume sections."""
+
+    def __init__(
+        self,
+        gpt,
+        max_workers=CV_EXTRACTION_WORKERS,
+        min_segment_tokens=CV_SEGMENT_MIN_TOKENS,
+        reextract_attempts=CV_REEXTRACT_ATTEMPTS,
+    ) -> None:
+        self.gpt = gpt
+        self.max_workers = max_workers
+        self.min_segment_tokens = min_segment_tokens
+        self.reextract_attempts = reextract_attempts
+
+    def plan(self, text) -> list:
+        """A method to return the (properties, context) requests of a CV.
+        A group whose sections were not found is read from the whole resume, and short or unstructured
+        resumes are extracted in a single request.
+        """
+        from context_utils import count_tokens
+
+        sections = segment_resume(text)
+        if count_tokens(text) < self.min_segment_tokens or set(sections) <= {"header"}:
+            return [(list(response_schema["properties"]), text)]
+
+        requests = []
+        for properties, section_names, required_sections in EXTRACTION_GROUPS:
+            if any(name in sections for name in required_sections):
+                context = "\n\n".join(sections[name] for name in section_names if name in sections)
+            else:
+                context = text
+            requests.append((properties, context))
+        return requests
+
+    def _request(self, prompt, functions, names) -> tuple:
+        """A method to run one request, returns (details, tokens used, error).
+        Malformed or truncated arguments are repaired before they are parsed.
+        """
+        try:
+            response = self.gpt.get_completion_from_messages(messages=prompt, functions=functions)
+        except Exception as e:
+            return {}, 0, str(e)
+        tokens_used = response.usage.total_tokens if response.usage is not None else 0
+        tool_calls = response.choices[0].message.tool_calls
+        if not tool_calls:
+            return {}, tokens_used, f"No details returned for {', '.join(names)}"
+        try:
+            details = repair_json(tool_calls[0].function.arguments)
+        except json.JSONDecodeError as e:
+            return {}, tokens_used, f"Invalid details returned for {', '.join(names)}: {e}"
+        if not isinstance(details, dict):
+            return {}, tokens_used, f"Invalid details returned for {', '.join(names)}"
+        return details, tokens_used, None
+
+    def _extract(self, properties, context) -> tuple:
+        """A method to run the extraction request of a group of properties."""
+        prompt, functions = extract_cv_details(
+            resume_context=context, response_schema=sub_schema(properties)
+        )
+        return self._request(prompt, functions, properties)
+
+    def _reextract(self, fields, context) -> tuple:
+        """A method to request only the failing fields again with a minimal prompt."""
+        names = field_names(fields)
+        prompt, functions = reextract_cv_fields(
+            resume_context=context, field_names=names, response_schema=fields_schema(fields)
+        )
+        return self._request(prompt, functions, names)
+
+    def extract(self, text) -> dict:
+        """A method to extract the CV details, merged in the order of the response schema.
+        The merged details are validated, failing fields are requested again up to reextract_attempts times,
+        and fields still failing after that are left empty or as returned and listed in errors.
+        """
+        requests = self.plan(text)
+        with tracer.span("extract", name="cv_details", items=len(requests)) as span:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(
+                    executor.map(lambda request: self._extract(*request), requests)
+                )
+
+            merged, contexts, request_errors, tokens_used = {}, {}, {}, 0
+            for (properties, context), (details, request_tokens, error) in zip(requests, results):
+                tokens_used += request_tokens
+                for name in properties:
+                    contexts[name] = context
+                    if name in details:
+                        merged[name] = details[name]
+                    elif error:
+                        request_errors[name] = error
+
+            reextracted, num_requests = [], len(requests)
+            for attempt in range(self.reextract_attempts + 1):
+                cv_details, validation_errors = CV_VALIDATOR(merged, ())
+                fields = failing_fields(validation_errors)
+                if not fields or attempt == self.reextract_attempts:
+                    break
+
+                # Failing fields read from the same resume sections share one request
+                groups = {}
+                for name, sub_fields in fields.items():
+                    groups.setdefault(contexts[name], {})[name] = sub_fields
+                reextracted.extend(field_names(fields))
+                num_requests += len(groups)
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    results = list(
+                        executor.map(lambda group: self._reextract(group[1], group[0]), groups.items())
+                    )
+
+                merged = cv_details
+                for group_fields, (details, request_tokens, error) in zip(groups.values(), results):
+                    tokens_used += request_tokens
+                    for name, sub_fields in group_fields.items():
+                        if name not in details:
+                            if error:
+                                request_errors[name] = error
+                            continue
+                        request_errors.pop(name, None)
+                        if sub_fields is None:
+                            merged[name] = details[name]
+                        elif isinstance(details[name], dict):
+                            merged[name] = {**merged[name], **details[name]}
+
+            span["tokens"] = tokens_used
+            span["reextracted"] = len(reextracted)
+
+        # A property lost with its request is reported once with the request error
+        errors = list(dict.fromkeys(request_errors[name] for name in fields if name in request_errors))
+        errors.extend(
+            f"{format_path(path)}: {message}"
+            for path, message in validation_errors
+            if path[0] not in request_errors
+        )
+        return {
+            "cv_details": {
+                name: cv_details.get(name, empty_value(name)) for name in response_schema["properties"]
+            },
+            "tokens_used": tokens_used,
+            "requests": num_requests,
+            "reextracted": reextracted,
+            "errors": errors,
+        }
@@ -1,20 +1,22 @@
 """ A python file to process text or documents into text chunks followed by embeddings to store in vector databases.
     It also provides the utilitie to clear the persisted db.
+    Every build is written to a new immutable snapshot directory of the collection and published by switching
+    the CURRENT pointer file atomically, so queries never read a half-written index.
+    LangChain, FAISS and the parsing libraries are imported inside the methods that use them to keep page loads fast.
 """
 
 import os
+import re
 import time
 import json
-from langchain.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.document_loaders import (
-    TextLoader,
-    PDFMinerLoader,
-    UnstructuredWordDocumentLoader,
-    UnstructuredExcelLoader,
-)
-from langchain.docstore.document import Document
-from langchain.document_loaders import YoutubeLoader
+import uuid
+import shutil
+import threading
+from collections import OrderedDict
+from cache_utils import EXTRACTION_CACHE
+from spreadsheet_utils import should_stream_workbook, iter_row_chunks, xlsx_row_records
+from text_stream_utils import should_stream, iter_text_chunks
+from trace_utils import tracer
 
 
 # Get the absolute path to the project root directory
@@ -29,64 +31,260 @@ with open(f"{project_root}/config/config.json", "r") as config_file:
 KNOWLEDGE_BASE_DIR = config[
     "KNOWLEDGE_BASE_DIR"
 ]  # Load Knowledge base directory name
-FAISS_DB_DIR = config["FAISS_DB_DIR"]  # Load Vector database directory name
+VECTOR_STORE_DIR = config["VECTOR_STORE_DIR"]  # Load directory name holding the named collections
+DEFAULT_COLLECTION = config["DEFAULT_COLLECTION"]  # Load default collection name
+COLLECTION_MEMORY_BUDGET_MB = config[
+    "COLLECTION_MEMORY_BUDGET_MB"
+]  # RAM budget in megabytes for collections kept loaded in memory
+SNAPSHOT_RETENTION_MINUTES = config[
+    "SNAPSHOT_RETENTION_MINUTES"
+]  # Minutes a replaced snapshot is kept for the readers still using it
 CHUNK_SIZE = config["CHUNK_SIZE"]  # Loading Text chunk size as integer variable
 CHUNK_OVERLAP = config["CHUNK_OVERLAP"]  # Loading Text chunk overlap as integer variable
+BUILD_BATCH_CHUNKS = config[
+    "BUILD_BATCH_CHUNKS"
+]  # Chunks split, embedded and indexed together while a build streams its documents
+DEDUP_ENABLED = config["DEDUP_ENABLED"]  # Drop near-duplicate chunks before embedding them
 
 
 knowledge_base_path = f"{project_root}/{KNOWLEDGE_BASE_DIR}"
-faiss_db_path = f"{project_root}/{FAISS_DB_DIR}"
+vector_store_path = f"{project_root}/{VECTOR_STORE_DIR}"
+
+MANIFEST_FILE_NAME = "manifest.json"  # File name of the collection manifest inside the db directory
+CURRENT_FILE_NAME = "CURRENT"  # File in the collection directory naming the published snapshot
+SNAPSHOT_DIR_NAME = "snapshots"  # Directory of the collection holding one directory per build
+COLLECTION_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class BuildCancelled(Exception):
+    """Raised by a build progress callback to stop the build before its next step."""
+
+
+def current_snapshot_path(db_path):
+    """A function to return the directory of the published snapshot of a collection, or None when it is empty.
+    Collections built before snapshots keep their files in the collection directory until their next build.
+    """
+    pointer_path = os.path.join(db_path, CURRENT_FILE_NAME)
+    if os.path.isfile(pointer_path):
+        with open(pointer_path, "r") as f:
+            snapshot_id = f.read().strip()
+        return os.path.join(db_path, SNAPSHOT_DIR_NAME, snapshot_id) if snapshot_id else None
+    if os.path.isfile(os.path.join(db_path, "index.faiss")):
+        return db_path
+    return None
+
+
+def is_streamed_file(file_path) -> bool:
+    """A function to check whether a file is large enough to be streamed into builds without the extraction cache."""
+    ext = "." + file_path.rsplit(".", 1)[-1]
+    if ext == ".txt":
+        return should_stream(file_path)
+    if ext == ".xlsx":
+        return should_stream_workbook(file_path)
+    return False
+
+
+def _report_progress(progress_callback, stage, fraction, message="") -> None:
+    """A function to report the progress of a build stage when a progress callback is given."""
+    if progress_callback is not None:
+        progress_callback(stage, fraction, message)
+
+
+def _loader_records(loader_class):
+    """A function to wrap a langchain loader class as an extractor returning cacheable records."""
+
+    def extract(file_path) -> list:
+        return [
+            {"page_content": document.page_content, "metadata": document.metadata}
+            for document in loader_class(file_path).load()
+        ]
+
+    return extract
+
+
+def _pdfminer_records(file_path) -> list:
+    """A function to extract the text of a PDF file with pdfminer."""
+    from pdfminer.high_level import extract_text
+
+    return [{"page_content": extract_text(file_path), "metadata": {}}]
+
+
+def _docx2txt_records(file_path) -> list:
+    """A function to extract the text of a DOCX file with docx2txt."""
+    import docx2txt
+
+    return [{"page_content": docx2txt.process(file_path), "metadata": {}}]
+
+
+def _text_records(file_path) -> list:
+    """A function to read the contents of a plain text file."""
+    with open(file_path) as f:
+        return [{"page_content": f.read(), "metadata": {}}]
 
 
 class VECTOR_DB_UTILS:
     """A class to define various utilities for vector databases."""
 
-    def __init__(self) -> None:
+    def __init__(self, collection: str = DEFAULT_COLLECTION) -> None:
+        if not COLLECTION_NAME_PATTERN.fullmatch(collection):
+            raise ValueError(
+                f"Invalid collection name: {collection}. Use letters, digits, '-' or '_' only."
+            )
+        self.collection = collection
         self.knowledge_base_path = knowledge_base_path
-        self.db_path = faiss_db_path
+        self.source_path = None  # Directory recorded as the location of the files, the files' own path when None
+        self.db_path = f"{vector_store_path}/{collection}"
+        self.snapshot_path = None  # Snapshot directory of the last loaded database
         self.chunk_size = CHUNK_SIZE
         self.chunk_overlap = CHUNK_OVERLAP
+        self.extraction_cache = EXTRACTION_CACHE()
+        self.dedup_report = None  # Near-duplicate report of the last build
 
-    def create_documents(self) -> list:
-        """A method to extract the document contents from the documents that exist in a folder and returns the list of documents."""
+    def file_source(self, file_path) -> str:
+        """A method to return the source recorded for a file, so files copied to a temporary directory keep
+        the location they were uploaded to and incremental builds recognise them.
+        """
+        if self.source_path is None:
+            return file_path
+        return os.path.join(self.source_path, os.path.basename(file_path))
+
+    def load_file_documents(self, file_path) -> list:
+        """A method to extract the documents of a single file, reusing cached extractions of the same content."""
+        from langchain.docstore.document import Document
+        from langchain.document_loaders import UnstructuredWordDocumentLoader
 
+        # Extractor name and function for the supported file types
         loader_mapping = {
-            ".pdf": PDFMinerLoader,
-            ".docx": UnstructuredWordDocumentLoader,
-            ".txt": TextLoader,
-            ".xlsx": UnstructuredExcelLoader,
+            ".pdf": ("pdfminer", _pdfminer_records),
+            ".docx": ("unstructured_docx", _loader_records(UnstructuredWordDocumentLoader)),
+            ".txt": ("text", _text_records),
+            ".xlsx": ("openpyxl_rows", xlsx_row_records),
         }
 
+        ext = "." + file_path.rsplit(".", 1)[-1]
+        if ext not in loader_mapping:
+            raise ValueError(f"Unsupported file extension: {ext}")
+        if is_streamed_file(file_path):
+            # Callers asking for a list hold every chunk, builds stream them with iter_file_documents
+            return list(self.iter_file_documents(file_path))
+
+        extractor, extract_fn = loader_mapping[ext]
+        records = self._extract_records(file_path, extractor, extract_fn)
+
+        # Source always points to the recorded file location, cached entries are location independent
+        source = self.file_source(file_path)
+        return [
+            Document(
+                page_content=record["page_content"],
+                metadata={**record["metadata"], "source": source},
+            )
+            for record in records
+        ]
+
+    def iter_file_documents(self, file_path):
+        """A method to yield the documents of a single file.
+        Large text files and workbooks are streamed chunk by chunk, other files are extracted through the cache.
+        """
+        if not is_streamed_file(file_path):
+            yield from self.load_file_documents(file_path)
+            return
+        if file_path.endswith(".txt"):
+            extractor, documents = "text_stream", self.iter_text_file_chunks(file_path)
+        else:
+            extractor, documents = "openpyxl_rows_stream", self.iter_workbook_chunks(file_path)
+        with tracer.span("extract", name=extractor, file=os.path.basename(file_path)) as span:
+            num_chunks = 0
+            for document in documents:
+                num_chunks += 1
+                yield document
+            span["items"] = num_chunks
+
+    def iter_text_file_chunks(self, file_path):
+        """A method to stream the chunks of a large text file from a memory map, without the extraction cache.
+        The chunks carry their start index and are not split again by process_documents.
+        """
+        from langchain.docstore.document import Document
+
+        source = self.file_source(file_path)
+        for chunk, start_index in iter_text_chunks(file_path, self.chunk_size, self.chunk_overlap):
+            yield Document(page_content=chunk, metadata={"source": source, "start_index": start_index})
+
+    def iter_workbook_chunks(self, file_path):
+        """A method to stream the row chunks of a large workbook, without the extraction cache.
+        The chunks carry their sheet and row range and are not split again by process_documents.
+        """
+        from langchain.docstore.document import Document
+
+        source = self.file_source(file_path)
+        for record in iter_row_chunks(file_path):
+            yield Document(page_content=record["page_content"], metadata={**record["metadata"], "source": source})
+
+    def extract_file_text(self, file_path) -> str:
+        """A method to extract the plain text of a PDF, DOCX or TXT file for summarization, reusing cached extractions."""
+
+        extractor_mapping = {
+            ".pdf": ("pdfminer", _pdfminer_records),
+            ".docx": ("docx2txt", _docx2txt_records),
+            ".txt": ("text", _text_records),
+        }
+
+        ext = "." + file_path.rsplit(".", 1)[-1]
+        if ext not in extractor_mapping:
+            raise ValueError(f"Unsupported file extension: {ext}")
+
+        extractor, extract_fn = extractor_mapping[ext]
+        records = self._extract_records(file_path, extractor, extract_fn)
+        return "".join(record["page_content"] for record in records)
+
+    def _extract_records(self, file_path, extractor, extract_fn) -> list:
+        """A method to return the cached records of a file or extract and cache them, traced as an extract span."""
+        with tracer.span("extract", name=extractor, file=os.path.basename(file_path)) as span:
+            content_hash = self.extraction_cache.file_hash(file_path)
+            records = self.extraction_cache.get(file_path, extractor, content_hash=content_hash)
+            span["cache_hit"] = records is not None
+            if records is None:
+                records = extract_fn(file_path)
+                self.extraction_cache.put(file_path, extractor, records, content_hash=content_hash)
+            span["items"] = len(records)
+            return records
+
+    def create_documents(self, progress_callback=None, skip_sources=()) -> list:
+        """A method to extract the document contents from the documents that exist in a folder and returns the list of documents.
+        Files whose source is in skip_sources are not extracted.
+        """
+
         # Check if documents folder exist and not empty
         if os.path.exists(self.knowledge_base_path) and os.listdir(
             self.knowledge_base_path
         ):
-            # Define empty documents list
-            documents = []
-
-            # Iterate over files and extract the text from documents
-            for file_name in os.listdir(self.knowledge_base_path):
-                file_path = os.path.join(self.knowledge_base_path, file_name)
-                ext = "." + file_path.rsplit(".", 1)[-1]
-
-                if ext in loader_mapping:
-                    loader_class = loader_mapping[
-                        ext
-                    ]  # get the defined loader class for the given file type
-                    loader = loader_class(file_path)  # define the loader for the file
-                    document_contents = (
-                        loader.load()
-                    )  # extract the document contents using loader
-                    documents.extend(
-                        document_contents
-                    )  # Append the existing document list
-                else:
-                    raise ValueError(f"Unsupported file extension: {ext}")
-
-            return documents
+            return list(
+                self.iter_documents(progress_callback=progress_callback, skip_sources=skip_sources)
+            )
         else:
             return None
 
+    def iter_documents(self, progress_callback=None, skip_sources=()):
+        """A method to yield the documents of the files in the knowledge base folder, file by file.
+        Files whose source is in skip_sources are not extracted.
+        """
+        if not os.path.isdir(self.knowledge_base_path):
+            return
+        with tracer.span("load", name="knowledge_base") as span:
+            num_documents = 0
+            file_names = os.listdir(self.knowledge_base_path)
+            for file_index, file_name in enumerate(file_names):
+                _report_progress(
+                    progress_callback, "extract", file_index / len(file_names), file_name
+                )
+                file_path = os.path.join(self.knowledge_base_path, file_name)
+                if self.file_source(file_path) in skip_sources:
+                    continue
+                # extract the document contents using cached loaders
+                for document in self.iter_file_documents(file_path):
+                    num_documents += 1
+                    yield document
+            span["items"] = num_documents
+
     def _get_video_info(self, yt_url) -> dict:
         """Get important video information.
 
@@ -120,11 +318,15 @@ class VECTOR_DB_UTILS:
 
     def youtube_transcript(self, yt_url):
         """A method to extract transcriptions from Youtube video and create"""
+        from langchain.document_loaders import YoutubeLoader
+
         try:
-            loader = YoutubeLoader.from_youtube_url(
-                youtube_url=yt_url, add_video_info=True
-            )
-            yt_transcript = loader.load()
+            with tracer.span("load", name="youtube_transcript") as span:
+                loader = YoutubeLoader.from_youtube_url(
+                    youtube_url=yt_url, add_video_info=True
+                )
+                yt_transcript = loader.load()
+                span["items"] = len(yt_transcript)
             # return [Document(page_content=yt_transcript, metadata={"source": yt_url})]
             return yt_transcript
         except Exception as e:
@@ -133,20 +335,50 @@ class VECTOR_DB_UTILS:
 
     def process_documents(self, documents):
         """A method to convert the extracted documents into chunks and return splitted data."""
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        from context_utils import count_tokens_batch
 
-        # Define the text splitter configurations
+        # Define the text splitter configurations, start index locates overlapping chunks when packing the context
         text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+            chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap, add_start_index=True
         )
 
         if not documents:
             print("No new document to process")
             return None
-        else:
-            text_chunks = text_splitter.split_documents(documents)
+
+        with tracer.span("split", documents=len(documents)) as span:
+            text_chunks = []
+            for document in documents:
+                if "row_start" in document.metadata or "start_index" in document.metadata:
+                    # Spreadsheet rows and streamed text files are already chunked by their loader
+                    text_chunks.append(document)
+                else:
+                    text_chunks.extend(text_splitter.split_documents([document]))
+
+            # Precompute the token count of every chunk for token budgeted context packing
+            for chunk, num_tokens in zip(
+                text_chunks, count_tokens_batch(chunk.page_content for chunk in text_chunks)
+            ):
+                chunk.metadata["num_tokens"] = num_tokens
+
+            span["items"] = len(text_chunks)
+            span["tokens"] = sum(chunk.metadata["num_tokens"] for chunk in text_chunks)
 
         return text_chunks
 
+    def iter_chunk_batches(self, documents, batch_size=BUILD_BATCH_CHUNKS):
+        """A method to split a stream of documents into lists of chunks of about batch_size chunks each."""
+        batch, batch_chars = [], 0
+        for document in documents:
+            batch.append(document)
+            batch_chars += len(document.page_content)
+            if batch_chars >= batch_size * self.chunk_size:
+                yield self.process_documents(batch)
+                batch, batch_chars = [], 0
+        if batch:
+            yield self.process_documents(batch)
+
     def run_db_build(
         self,
         input_type,
@@ -154,52 +386,512 @@ class VECTOR_DB_UTILS:
         page_content="",
         source_url="",
         db_persist: bool = True,
+        incremental: bool = False,
+        progress_callback=None,
+        deduplicate: bool = DEDUP_ENABLED,
         **kwargs,
     ):
-        """A method to build the vector db and store in the defined database path."""
+        """A method to build the vector db and store in the defined database path.
+        Documents are streamed through split, dedup, embed and index in batches of about BUILD_BATCH_CHUNKS
+        chunks, and the chunk texts are written to the docstore of the new snapshot as they are indexed,
+        so a build does not hold the texts of its files. The FAISS vectors, the lexical index and the chunk
+        metadata still grow with the number of chunks.
+        With incremental set, new chunks are appended to the existing database and its lexical index,
+        and documents whose source is already indexed are skipped.
+        With deduplicate set, near-duplicate chunks are merged into their first occurrence before embedding.
+        progress_callback(stage, fraction, message) is called between the steps of the build and may raise
+        BuildCancelled to stop it, in which case nothing is persisted and the exception is re-raised.
+        """
+        from langchain.vectorstores import FAISS
+        from langchain.docstore.document import Document
+        from retrieval_utils import BM25_INDEX
+        from embedding_utils import HASHED_TFIDF_EMBEDDINGS
+        from dedup_utils import CHUNK_DEDUPLICATOR, chunk_sources
+        from docstore_utils import COLUMNAR_DOCSTORE_WRITER, all_metadata
+
         try:
             start_time = time.time()
+            self.dedup_report = None
             os.makedirs(self.db_path, exist_ok=True)
 
-            # Get extracted documents content
+            existing_db = self.load_local_db(embeddings) if incremental else None
+            indexed_sources = set()
+            if existing_db is not None:
+                indexed_sources = {
+                    source
+                    for metadata in all_metadata(existing_db)
+                    for source in chunk_sources(metadata)
+                }
+
+            # Stages run batch by batch, so their progress is the share of the files read so far
+            files_read = {"fraction": 0.0}
+
+            def report_progress(stage, fraction, message=""):
+                if stage == "extract":
+                    files_read["fraction"] = fraction
+                _report_progress(progress_callback, stage, files_read["fraction"], message)
+
+            # Get extracted documents content, files already indexed are not extracted again
+            report_progress("extract", 0.0)
             if input_type == "documents":
-                documents = self.create_documents()
+                documents = self.iter_documents(
+                    progress_callback=report_progress, skip_sources=indexed_sources
+                )
             elif input_type == "web_url":
                 documents = [
                     Document(page_content=page_content, metadata={"source": source_url})
                 ]
             elif input_type == "yt_url":
-                documents = self.youtube_transcript(yt_url=source_url)
+                documents = self.youtube_transcript(yt_url=source_url) or []
 
-            # Get the text chunks
-            if documents is not None:
-                processed_documents = self.process_documents(documents=documents)
-            else:
+            documents = (
+                document
+                for document in documents
+                if document.metadata.get("source") not in indexed_sources
+            )
+            chunk_batches = self.iter_chunk_batches(documents)
+
+            if existing_db is None and isinstance(embeddings, HASHED_TFIDF_EMBEDDINGS):
+                # The local embedding model is fitted on every chunk of the collection it embeds,
+                # so a new local collection holds its chunks until the model is fitted
+                chunks = [chunk for batch in chunk_batches for chunk in batch]
+                if chunks:
+                    with tracer.span("embed", name="local_fit", items=len(chunks)):
+                        embeddings = embeddings.fit(chunk.page_content for chunk in chunks)
+                chunk_batches = [
+                    chunks[start : start + BUILD_BATCH_CHUNKS]
+                    for start in range(0, len(chunks), BUILD_BATCH_CHUNKS)
+                ]
+
+            # Near-duplicate chunks are dropped so repeated boilerplate is embedded and indexed once
+            deduplicator = CHUNK_DEDUPLICATOR() if deduplicate else None
+            snapshot_path = self.new_snapshot_path()
+            docstore = None
+            db, bm25_index = existing_db, None
+            if existing_db is not None:
+                bm25_index = self.load_bm25_index(existing_db)
+                # The new snapshot starts with the indexed chunks, their copied metadata can still
+                # receive the duplicates of new chunks
+                docstore = COLUMNAR_DOCSTORE_WRITER(snapshot_path)
+                for position in range(len(existing_db.index_to_docstore_id)):
+                    doc_id = existing_db.index_to_docstore_id[position]
+                    document = existing_db.docstore.search(doc_id)
+                    metadata = dict(document.metadata)
+                    docstore.add({doc_id: Document(page_content=document.page_content, metadata=metadata)})
+                    if deduplicator is not None:
+                        deduplicator.add_existing(document.page_content, metadata)
+                existing_db.docstore = docstore
+
+            num_chunks = 0
+            for chunks in chunk_batches:
+                if not chunks:
+                    continue
+                if deduplicator is not None:
+                    report_progress("dedup", 0.0)
+                    with tracer.span("dedup", items=len(chunks)) as span:
+                        chunks = deduplicator.filter(chunks)
+                        span["kept"] = len(chunks)
+                    if not chunks:
+                        continue
+
+                texts, vectors = self.embed_chunks(
+                    embeddings if db is None else db.embedding_function, chunks, report_progress
+                )
+                report_progress("index", 0.0, f"Indexed {num_chunks} chunks")
+                metadatas = [chunk.metadata for chunk in chunks]
+                with tracer.span("index", name="faiss_add", items=len(texts)):
+                    if db is None:
+                        docstore = COLUMNAR_DOCSTORE_WRITER(snapshot_path)
+                        db = FAISS.from_embeddings(
+                            list(zip(texts, vectors)), embeddings, metadatas, docstore=docstore
+                        )
+                        doc_ids = list(db.index_to_docstore_id.values())
+                    else:
+                        doc_ids = db.add_embeddings(list(zip(texts, vectors)), metadatas)
+                with tracer.span("index", name="bm25_add", items=len(texts)):
+                    if bm25_index is None:
+                        bm25_index = BM25_INDEX()
+                    bm25_index.add_documents(doc_ids, texts)
+                num_chunks += len(texts)
+
+            if db is None:
                 print("No document content is provided.")
+                return None, 0.00
 
-            # Build vector db
-            db = FAISS.from_documents(
-                documents=processed_documents, embedding=embeddings
-            )
+            if deduplicator is not None:
+                self.dedup_report = dict(deduplicator.report)
+            self.complete_dedup_report(db)
 
             if db_persist:
-                db.save_local(self.db_path)
-                # Implement logic to save the db to local
+                _report_progress(progress_callback, "index", 0.5, "Saving the database")
+                self.save_db(db, bm25_index, input_type, snapshot_path=snapshot_path)
+            else:
+                # The snapshot is not published and is removed with the abandoned snapshots
+                self.save_index(db, snapshot_path)
 
             end_time = time.time()
 
             return db, end_time - start_time
 
+        except BuildCancelled:
+            raise
         except Exception as e:
             error_msg = f"An error occurred while reading files: {e}"
             print(error_msg)
             return None, 0.00
 
+    def new_snapshot_path(self) -> str:
+        """A method to return the directory of a new snapshot of the collection, created when it is written."""
+        snapshot_id = f"{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        return os.path.join(self.db_path, SNAPSHOT_DIR_NAME, snapshot_id)
+
+    def save_db(self, db, bm25_index, input_type, snapshot_path=None) -> None:
+        """A method to persist the vector db, its lexical index, the local embedding model and the manifest
+        as a new snapshot, publish it and remove the snapshots retired longer than the retention period.
+        Builds that wrote their docstore while indexing pass the snapshot directory it was written to.
+        """
+        from embedding_utils import HASHED_TFIDF_EMBEDDINGS
+
+        with tracer.span("index", name="save", items=db.index.ntotal) as span:
+            snapshot_path = snapshot_path or self.new_snapshot_path()
+            snapshot_id = os.path.basename(snapshot_path)
+            os.makedirs(snapshot_path, exist_ok=True)
+            self.save_index(db, snapshot_path)
+            bm25_index.save(snapshot_path)
+            if isinstance(db.embedding_function, HASHED_TFIDF_EMBEDDINGS):
+                db.embedding_function.save(snapshot_path)
+            self.write_manifest(db, input_type, snapshot_path)
+            self.publish_snapshot(snapshot_id)
+            self.snapshot_path = snapshot_path
+            span["snapshot"] = snapshot_id
+        self.collect_garbage()
+
+    def save_index(self, db, folder_path) -> None:
+        """A method to write the FAISS index and the chunks as a columnar docstore.
+        The db switches to the written docstore, so it no longer reads the snapshot it was loaded from.
+        """
+        import faiss
+        from docstore_utils import COLUMNAR_DOCSTORE, COLUMNAR_DOCSTORE_WRITER, save_docstore
+
+        os.makedirs(folder_path, exist_ok=True)
+        faiss.write_index(db.index, os.path.join(folder_path, "index.faiss"))
+        if isinstance(db.docstore, COLUMNAR_DOCSTORE_WRITER) and db.docstore.folder_path == folder_path:
+            # The chunk texts were written while the db was built, only the columns are left
+            db.docstore.close()
+        else:
+            save_docstore(db, folder_path)
+        db.docstore = COLUMNAR_DOCSTORE.load(folder_path)
+
+    def publish_snapshot(self, snapshot_id) -> None:
+        """A method to switch the CURRENT pointer of the collection atomically, an empty id empties the collection."""
+        pointer_path = os.path.join(self.db_path, CURRENT_FILE_NAME)
+        with open(f"{pointer_path}.tmp", "w") as f:
+            f.write(snapshot_id)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{pointer_path}.tmp", pointer_path)
+
+    def reset(self) -> None:
+        """A method to empty the collection by publishing no snapshot, queries already running keep their snapshot."""
+        os.makedirs(self.db_path, exist_ok=True)
+        self.publish_snapshot("")
+        self.snapshot_path = None
+        self.collect_garbage()
+
+    def collect_garbage(self, retention_minutes=SNAPSHOT_RETENTION_MINUTES) -> list:
+        """A method to remove the snapshots that were replaced or abandoned longer than the retention period ago,
+        along with the files of a collection built before snapshots. Returns the removed snapshot ids.
+        """
+        pointer_path = os.path.join(self.db_path, CURRENT_FILE_NAME)
+        if not os.path.isfile(pointer_path):
+            return []
+        with open(pointer_path, "r") as f:
+            current_id = f.read().strip()
+        switched_at = os.path.getmtime(pointer_path)
+        now = time.time()
+        retention_seconds = retention_minutes * 60
+
+        removed = []
+        snapshots_path = os.path.join(self.db_path, SNAPSHOT_DIR_NAME)
+        snapshot_ids = os.listdir(snapshots_path) if os.path.isdir(snapshots_path) else []
+        for snapshot_id in snapshot_ids:
+            if snapshot_id == current_id:
+                continue
+            snapshot_path = os.path.join(snapshots_path, snapshot_id)
+            # Snapshots written after the last switch belong to builds that are running or failed
+            retired_at = max(switched_at, os.path.getmtime(snapshot_path))
+            if now - retired_at > retention_seconds:
+                shutil.rmtree(snapshot_path, ignore_errors=True)
+                removed.append(snapshot_id)
+
+        if now - switched_at > retention_seconds:
+            for file_name in os.listdir(self.db_path):
+                file_path = os.path.join(self.db_path, file_name)
+                if os.path.isfile(file_path) and file_name != CURRENT_FILE_NAME:
+                    os.remove(file_path)
+        return removed
+
+    def deduplicate_chunks(self, chunks, existing_db=None) -> list:
+        """A method to drop the chunks that are near-duplicates of another new chunk or of a chunk of the
+        existing database, traced as a dedup span. The report is kept in dedup_report.
+        """
+        from dedup_utils import CHUNK_DEDUPLICATOR
+        from docstore_utils import COLUMNAR_DOCSTORE
+
+        existing_ids, existing_chunks = [], []
+        if existing_db is not None:
+            existing_ids = list(existing_db.index_to_docstore_id.values())
+            existing_chunks = [existing_db.docstore.search(doc_id) for doc_id in existing_ids]
+        duplicate_counts = [len(chunk.metadata.get("duplicates", [])) for chunk in existing_chunks]
+        with tracer.span("dedup", items=len(chunks)) as span:
+            kept_chunks, self.dedup_report = CHUNK_DEDUPLICATOR().deduplicate(chunks, existing_chunks)
+            span.update(
+                kept=self.dedup_report["kept"],
+                dropped=self.dedup_report["dropped"],
+                tokens=self.dedup_report["tokens_saved"],
+            )
+        if existing_db is not None and isinstance(existing_db.docstore, COLUMNAR_DOCSTORE):
+            # Columnar documents are rebuilt on every lookup, so duplicates merged into them are written back
+            existing_db.docstore.update(
+                {
+                    doc_id: chunk
+                    for doc_id, chunk, count in zip(existing_ids, existing_chunks, duplicate_counts)
+                    if len(chunk.metadata.get("duplicates", [])) > count
+                }
+            )
+        return kept_chunks
+
+    def complete_dedup_report(self, db) -> None:
+        """A method to add the embeddings and index space saved by the last deduplication to its report."""
+        if self.dedup_report is None:
+            return
+        # Every dropped chunk saves one vector of float32 values and its stored text
+        self.dedup_report["embeddings_saved"] = self.dedup_report["dropped"]
+        self.dedup_report["index_bytes_saved"] = (
+            self.dedup_report["dropped"] * db.index.d * 4 + self.dedup_report["text_bytes_saved"]
+        )
+
+    def embed_chunks(self, embeddings, chunks, progress_callback=None):
+        """A method to embed the text chunks, traced as an embed span, and return their texts and vectors.
+        Remote embeddings go through the dispatcher, which packs chunks by their token counts into
+        concurrent requests, and progress is reported after every request.
+        """
+        from embedding_utils import (
+            EMBEDDING_DISPATCHER,
+            HASHED_TFIDF_EMBEDDINGS,
+            embedding_backend_name,
+        )
+
+        texts = [chunk.page_content for chunk in chunks]
+        with tracer.span(
+            "embed", name=embedding_backend_name(embeddings), items=len(texts)
+        ) as span:
+            token_counts = [chunk.metadata.get("num_tokens", 0) for chunk in chunks]
+            span["tokens"] = sum(token_counts)
+            if isinstance(embeddings, HASHED_TFIDF_EMBEDDINGS):
+                # Local embeddings are computed in vectorized batches on the CPU, there is no request to dispatch
+                vectors = embeddings.embed_documents(texts)
+            else:
+                dispatcher = EMBEDDING_DISPATCHER(embeddings)
+                vectors = dispatcher.embed(
+                    texts,
+                    token_counts=token_counts,
+                    progress_callback=lambda embedded, total: _report_progress(
+                        progress_callback,
+                        "embed",
+                        embedded / total,
+                        f"Embedded {embedded}/{total} chunks",
+                    ),
+                )
+                span.update(
+                    requests=dispatcher.stats["requests"],
+                    retries=dispatcher.stats["retries"],
+                    vectors_per_second=dispatcher.stats["vectors_per_second"],
+                )
+        return texts, vectors
+
     def load_local_db(self, embeddings):
-        """A simple method to load locally saved vector database."""
-        if os.path.exists(self.db_path) and os.path.isfile(
-            os.path.join(self.db_path, "index.faiss")
+        """A simple method to load locally saved vector database.
+        Raises ValueError when the database was built with another embedding backend than the given embeddings.
+        """
+        from langchain.vectorstores import FAISS
+        from embedding_utils import HASHED_TFIDF_EMBEDDINGS
+        from docstore_utils import has_columnar_docstore, load_columnar_db
+
+        # Resolve the snapshot once, so every file of the load comes from the same build
+        snapshot_path = current_snapshot_path(self.db_path)
+        if snapshot_path is not None and os.path.isfile(
+            os.path.join(snapshot_path, "index.faiss")
         ):
-            return FAISS.load_local(self.db_path, embeddings)
+            self.check_embedding_backend(embeddings, snapshot_path)
+            with tracer.span("load", name="index", collection=self.collection) as span:
+                if isinstance(embeddings, HASHED_TFIDF_EMBEDDINGS):
+                    # Queries must be projected with the local model fitted for this collection
+                    embeddings = HASHED_TFIDF_EMBEDDINGS.load(snapshot_path)
+                if has_columnar_docstore(snapshot_path):
+                    db = load_columnar_db(snapshot_path, embeddings)
+                else:
+                    # Collections saved before the columnar docstore keep their pickled docstore until rebuilt
+                    db = FAISS.load_local(snapshot_path, embeddings)
+                span["items"] = db.index.ntotal
+                span["snapshot"] = os.path.basename(snapshot_path)
+            self.snapshot_path = snapshot_path
+            return db
         else:
             return None
+
+    def check_embedding_backend(self, embeddings, snapshot_path=None) -> None:
+        """A method to reject embeddings of another backend than the one that built the database."""
+        from embedding_utils import embedding_backend_name
+
+        manifest = self.read_manifest(snapshot_path) or {}
+        index_backend = manifest.get("embedding_backend", "openai")
+        query_backend = embedding_backend_name(embeddings)
+        if index_backend != query_backend:
+            raise ValueError(
+                f"Collection '{self.collection}' was built with the '{index_backend}' embedding backend "
+                f"and cannot be queried with '{query_backend}' embeddings."
+            )
+
+    def load_bm25_index(self, db):
+        """A method to load the lexical index of the database, rebuilding it from the docstore when it is missing.
+        The index is read from the snapshot the database was loaded from.
+        """
+        from retrieval_utils import BM25_INDEX
+
+        snapshot_path = self.snapshot_path or current_snapshot_path(self.db_path)
+        bm25_index = BM25_INDEX.load(snapshot_path) if snapshot_path is not None else None
+        if bm25_index is None and db is not None:
+            bm25_index = BM25_INDEX.from_db(db)
+        return bm25_index
+
+    def write_manifest(self, db, input_type, snapshot_path) -> dict:
+        """A method to write the manifest describing the collection into a snapshot directory.
+        The creation time and input types are carried over from the published snapshot.
+        """
+        from embedding_utils import embedding_backend_name
+        from dedup_utils import chunk_sources
+        from docstore_utils import all_metadata
+
+        manifest = self.read_manifest() or {"created_at": time.time()}
+        sources = {source for metadata in all_metadata(db) for source in chunk_sources(metadata)}
+        manifest.update(
+            {
+                "name": self.collection,
+                "input_types": sorted(set(manifest.get("input_types", [])) | {input_type}),
+                "sources": sorted(source for source in sources if source),
+                "num_chunks": db.index.ntotal,
+                "embedding_backend": embedding_backend_name(db.embedding_function),
+                "embedding_dim": db.index.d,
+                "snapshot": os.path.basename(snapshot_path),
+                "updated_at": time.time(),
+            }
+        )
+        if self.dedup_report is not None:
+            manifest["dedup"] = self.dedup_report
+        with open(os.path.join(snapshot_path, MANIFEST_FILE_NAME), "w") as f:
+            json.dump(manifest, f, indent=4)
+        return manifest
+
+    def read_manifest(self, snapshot_path=None):
+        """A method to read the manifest of a snapshot, the published one by default.
+        Returns None when the collection has no manifest.
+        """
+        snapshot_path = snapshot_path or current_snapshot_path(self.db_path)
+        if snapshot_path is None:
+            return None
+        manifest_path = os.path.join(snapshot_path, MANIFEST_FILE_NAME)
+        if not os.path.isfile(manifest_path):
+            return None
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+
+
+def list_collections() -> list:
+    """A function to list the names of the collections that hold a built index."""
+    if not os.path.isdir(vector_store_path):
+        return []
+    collections = []
+    for name in os.listdir(vector_store_path):
+        snapshot_path = current_snapshot_path(os.path.join(vector_store_path, name))
+        if snapshot_path is not None and os.path.isfile(os.path.join(snapshot_path, "index.faiss")):
+            collections.append(name)
+    return sorted(collections)
+
+
+class COLLECTION_MANAGER:
+    """A class to load named collections lazily on first query and keep them in memory within a RAM budget.
+    Least recently used collections are evicted first when the budget is exceeded. A collection is reloaded
+    when a new snapshot of it is published, queries running on the previous snapshot finish on it.
+    """
+
+    def __init__(self, memory_budget_mb=COLLECTION_MEMORY_BUDGET_MB) -> None:
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self.loaded = OrderedDict()  # name -> (db, bm25_index, estimated size in bytes, snapshot path)
+        self.lock = threading.Lock()
+
+    def _estimate_size(self, db_path) -> int:
+        """A method to estimate the memory footprint of a collection from its persisted files.
+        Chunk texts of a columnar docstore stay on disk and are not counted.
+        """
+        from docstore_utils import DOCSTORE_TEXTS_FILE_NAME
+
+        return sum(
+            os.path.getsize(os.path.join(db_path, file_name))
+            for file_name in os.listdir(db_path)
+            if os.path.isfile(os.path.join(db_path, file_name))
+            and file_name != DOCSTORE_TEXTS_FILE_NAME
+        )
+
+    def get(self, name, embeddings):
+        """A method to return the (db, bm25_index) of a collection, loading it on first use.
+        Returns (None, None) when the collection does not exist and raises ValueError when the
+        collection was built with another embedding backend than the given embeddings.
+        """
+        from langchain.vectorstores import FAISS
+        from embedding_utils import HASHED_TFIDF_EMBEDDINGS
+
+        with self.lock:
+            vector_db = VECTOR_DB_UTILS(collection=name)
+            snapshot_path = current_snapshot_path(vector_db.db_path)
+            if name in self.loaded and self.loaded[name][3] == snapshot_path:
+                self.loaded.move_to_end(name)
+                db, bm25_index, _, _ = self.loaded[name]
+                vector_db.check_embedding_backend(embeddings, snapshot_path)
+            else:
+                self.loaded.pop(name, None)
+                db = vector_db.load_local_db(embeddings)
+                if db is None:
+                    return None, None
+                bm25_index = vector_db.load_bm25_index(db)
+                self.loaded[name] = (
+                    db,
+                    bm25_index,
+                    self._estimate_size(vector_db.snapshot_path),
+                    vector_db.snapshot_path,
+                )
+                self._evict(keep=name)
+
+        # Share the loaded index across sessions but embed queries with the caller's embeddings,
+        # local embedding models are fitted per collection and always come with the loaded index
+        if not isinstance(embeddings, HASHED_TFIDF_EMBEDDINGS):
+            db = FAISS(embeddings, db.index, db.docstore, db.index_to_docstore_id)
+        return db, bm25_index
+
+    def _evict(self, keep) -> None:
+        """A method to evict least recently used collections until the loaded ones fit in the budget."""
+        while self.memory_usage() > self.memory_budget_bytes and len(self.loaded) > 1:
+            name = next(iter(self.loaded))
+            if name == keep:
+                break
+            del self.loaded[name]
+            print(f"Evicted collection '{name}' from memory.")
+
+    def invalidate(self, name) -> None:
+        """A method to drop a collection from memory so the next query reloads it from disk."""
+        with self.lock:
+            self.loaded.pop(name, None)
+
+    def memory_usage(self) -> int:
+        """A method to return the estimated memory used by the loaded collections in bytes."""
+        return sum(size for _, _, size, _ in self.loaded.values())
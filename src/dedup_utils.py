@@ -0,0 +1,160 @@
+""" A python file to drop near-duplicate text chunks before they are embedded.
+    Chunks are compared with MinHash signatures of their word shingles and locality sensitive hashing,
+    so repeated boilerplate like navigation text, headers, footers or spreadsheet rows is embedded once.
+    The kept chunk records the metadata of every duplicate merged into it, like its source, position, sheet and rows.
+"""
+
+import os
+import re
+import json
+import zlib
+import numpy as np
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+DEDUP_ENABLED = config["DEDUP_ENABLED"]  # Drop near-duplicate chunks before embedding them
+DEDUP_THRESHOLD = config["DEDUP_THRESHOLD"]  # Estimated Jaccard similarity above which chunks are duplicates
+DEDUP_NUM_PERM = config["DEDUP_NUM_PERM"]  # Number of hash functions of a MinHash signature
+DEDUP_BANDS = config["DEDUP_BANDS"]  # Number of LSH bands the signature is split into
+DEDUP_SHINGLE_SIZE = config["DEDUP_SHINGLE_SIZE"]  # Number of words per shingle
+
+MERSENNE_PRIME = (1 << 31) - 1  # Shingle hashes are kept below 2**31 so the products fit in 64 bits
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def chunk_sources(metadata) -> list:
+    """A function to return the source of a chunk followed by the sources of the duplicates merged into it."""
+    sources = [metadata.get("source")]
+    for duplicate in metadata.get("duplicates", []):
+        if duplicate.get("source") not in sources:
+            sources.append(duplicate.get("source"))
+    return [source for source in sources if source]
+
+
+class CHUNK_DEDUPLICATOR:
+    """A class to find near-duplicate chunks with MinHash signatures and merge them into the first occurrence."""
+
+    def __init__(
+        self,
+        threshold=DEDUP_THRESHOLD,
+        num_perm=DEDUP_NUM_PERM,
+        bands=DEDUP_BANDS,
+        shingle_size=DEDUP_SHINGLE_SIZE,
+        seed: int = 1,
+    ) -> None:
+        if num_perm % bands != 0:
+            raise ValueError("The number of hash functions must be a multiple of the number of bands.")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.reset()
+
+    def reset(self) -> None:
+        """A method to forget every chunk seen so far and start a new report."""
+        self.buckets = {}  # LSH bucket key -> indexes into kept
+        self.kept, self.signatures = [], []  # Metadata and signature of every kept chunk
+        self.num_existing = 0
+        self.report = {
+            "chunks": 0,
+            "kept": 0,
+            "dropped": 0,
+            "merged_into_existing": 0,
+            "tokens_saved": 0,
+            "text_bytes_saved": 0,
+        }
+
+    def shingles(self, text) -> np.ndarray:
+        """A method to hash the word shingles of a text, short texts are a single shingle."""
+        words = WORD_PATTERN.findall(text.lower())
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {
+            " ".join(words[start : start + size]) for start in range(max(len(words) - size + 1, 1))
+        }
+        return np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) & MERSENNE_PRIME for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+
+    def signature(self, text) -> np.ndarray:
+        """A method to calculate the MinHash signature of a text."""
+        hashes = self.shingles(text)
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def band_keys(self, signature) -> list:
+        """A method to split a signature into the LSH bucket keys of its bands."""
+        return [
+            (band, signature[band * self.rows : (band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def _register(self, text, metadata, signature=None) -> None:
+        """A method to keep a chunk, only its metadata is held so duplicates can be merged into it later."""
+        signature = self.signature(text) if signature is None else signature
+        for key in self.band_keys(signature):
+            self.buckets.setdefault(key, []).append(len(self.kept))
+        self.kept.append(metadata)
+        self.signatures.append(signature)
+
+    def add_existing(self, text, metadata) -> None:
+        """A method to register a chunk that is already indexed, before any new chunk is filtered."""
+        self._register(text, metadata)
+        self.num_existing += 1
+
+    def filter(self, chunks) -> list:
+        """A method to drop the chunks that are near-duplicates of a chunk seen before, returns the kept chunks.
+        Chunks can be filtered batch by batch, every batch is compared with all the chunks seen before it.
+        Every dropped chunk is recorded in the "duplicates" metadata of the chunk it matched, so the kept
+        chunk maps back to all of its sources.
+        """
+        kept_chunks = []
+        for chunk in chunks:
+            self.report["chunks"] += 1
+            signature = self.signature(chunk.page_content)
+            candidates = {
+                index for key in self.band_keys(signature) for index in self.buckets.get(key, [])
+            }
+            match = None
+            # The earliest candidate above the threshold wins so the merge does not depend on bucket order
+            for index in sorted(candidates):
+                if np.mean(self.signatures[index] == signature) >= self.threshold:
+                    match = index
+                    break
+            if match is None:
+                self._register(chunk.page_content, chunk.metadata, signature)
+                kept_chunks.append(chunk)
+                self.report["kept"] += 1
+                continue
+
+            # The whole location of the duplicate is kept, like the sheet and rows of spreadsheet chunks
+            self.kept[match].setdefault("duplicates", []).append(
+                {key: value for key, value in chunk.metadata.items() if key != "duplicates"}
+            )
+            self.report["dropped"] += 1
+            self.report["merged_into_existing"] += match < self.num_existing
+            self.report["tokens_saved"] += chunk.metadata.get("num_tokens", 0)
+            self.report["text_bytes_saved"] += len(chunk.page_content.encode("utf-8"))
+        return kept_chunks
+
+    def deduplicate(self, chunks, existing_chunks=()) -> tuple:
+        """A method to drop the chunks that are near-duplicates of an earlier chunk or of an existing chunk.
+        Returns the kept chunks and a report.
+        """
+        self.reset()
+        for chunk in existing_chunks:
+            self.add_existing(chunk.page_content, chunk.metadata)
+        return self.filter(chunks), dict(self.report)
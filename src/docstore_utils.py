@@ -0,0 +1,306 @@
+""" A python file to persist the chunks of a vector database in a compact columnar format.
+    Chunk texts are stored in compressed blocks with an offset table and fetched lazily by id, and the
+    metadata is stored as columns of interned values, so loading a collection does not unpickle every chunk.
+"""
+
+import os
+import json
+import zlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain.docstore.base import AddableMixin, Docstore
+from langchain.docstore.document import Document
+
+
+DOCSTORE_FILE_NAME = "docstore.json"  # Column layout and interned metadata values
+DOCSTORE_ARRAYS_FILE_NAME = "docstore.npz"  # Ids, offset tables and metadata codes
+DOCSTORE_TEXTS_FILE_NAME = "docstore_texts.bin"  # Compressed blocks of chunk texts
+DOCSTORE_FORMAT_VERSION = 1
+
+TEXT_BLOCK_SIZE = 32  # Chunks compressed together, a lookup decompresses one block
+TEXT_BLOCK_CACHE_SIZE = 256  # Decompressed blocks kept in memory per collection
+
+
+def _is_int_column(values) -> bool:
+    return all(isinstance(value, int) and not isinstance(value, bool) for value in values)
+
+
+def _atomic_write(path, write) -> None:
+    """A function to write a file through a temporary file so readers never see it half written."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+def has_columnar_docstore(folder_path) -> bool:
+    """A function to check whether a db directory holds a columnar docstore."""
+    return os.path.isfile(os.path.join(folder_path, DOCSTORE_FILE_NAME))
+
+
+class COLUMNAR_DOCSTORE(Docstore, AddableMixin):
+    """A class to serve the chunks of a persisted columnar docstore.
+    Texts are decompressed on demand per block, documents added or updated after loading are kept in memory
+    until the docstore is saved again.
+    """
+
+    def __init__(self, folder_path, ids, text_offsets, block_offsets, columns) -> None:
+        self.texts_path = os.path.join(folder_path, DOCSTORE_TEXTS_FILE_NAME)
+        self.ids = ids
+        self.rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self.text_offsets = text_offsets
+        self.block_offsets = block_offsets
+        self.columns = columns  # [(name, kind, values or None, codes)]
+        self.added = {}  # doc_id -> Document added or updated after loading
+        self.deleted = set()
+        self.block_cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # The lock and the decompressed blocks are rebuilt after unpickling
+        state = self.__dict__.copy()
+        del state["lock"], state["block_cache"]
+        return state
+
+    def __setstate__(self, state) -> None:
+        self.__dict__.update(state)
+        self.block_cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, folder_path):
+        """A method to load the offset tables and metadata columns, chunk texts stay on disk."""
+        with open(os.path.join(folder_path, DOCSTORE_FILE_NAME), "r") as f:
+            layout = json.load(f)
+        if layout["version"] != DOCSTORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported docstore format version: {layout['version']}")
+        with np.load(os.path.join(folder_path, DOCSTORE_ARRAYS_FILE_NAME)) as arrays:
+            columns = [
+                (column["name"], column["kind"], column.get("values"), arrays[f"column_{index}"])
+                for index, column in enumerate(layout["columns"])
+            ]
+            return cls(
+                folder_path,
+                arrays["ids"].tolist(),
+                arrays["text_offsets"],
+                arrays["block_offsets"],
+                columns,
+            )
+
+    def _block(self, block_index) -> bytes:
+        """A method to return a decompressed block of texts, from the cache when it was read recently."""
+        with self.lock:
+            if block_index in self.block_cache:
+                self.block_cache.move_to_end(block_index)
+                return self.block_cache[block_index]
+            with open(self.texts_path, "rb") as f:
+                f.seek(int(self.block_offsets[block_index]))
+                compressed = f.read(
+                    int(self.block_offsets[block_index + 1] - self.block_offsets[block_index])
+                )
+            block = zlib.decompress(compressed)
+            self.block_cache[block_index] = block
+            if len(self.block_cache) > TEXT_BLOCK_CACHE_SIZE:
+                self.block_cache.popitem(last=False)
+            return block
+
+    def text(self, row) -> str:
+        """A method to fetch the text of a stored chunk by row."""
+        block_index = row // TEXT_BLOCK_SIZE
+        block_start = self.text_offsets[block_index * TEXT_BLOCK_SIZE]
+        start = int(self.text_offsets[row] - block_start)
+        end = int(self.text_offsets[row + 1] - block_start)
+        return self._block(block_index)[start:end].decode("utf-8")
+
+    def metadata(self, row, decoded_values=None) -> dict:
+        """A method to rebuild the metadata dict of a stored chunk from the columns.
+        decoded_values caches the decoded interned values when many rows are read, the returned values
+        are then shared between rows and must not be modified.
+        """
+        metadata = {}
+        for index, (name, kind, values, codes) in enumerate(self.columns):
+            code = int(codes[row])
+            if kind == "int":
+                if code != np.iinfo(np.int64).min:
+                    metadata[name] = code
+            elif code >= 0:
+                if decoded_values is None:
+                    metadata[name] = json.loads(values[code])
+                else:
+                    key = (index, code)
+                    if key not in decoded_values:
+                        decoded_values[key] = json.loads(values[code])
+                    metadata[name] = decoded_values[key]
+        return metadata
+
+    def search(self, search: str):
+        """A method to return the document of an id, or an error string like the LangChain in-memory docstore."""
+        if search in self.added:
+            return self.added[search]
+        row = self.rows.get(search)
+        if row is None or search in self.deleted:
+            return f"ID {search} not found."
+        return Document(page_content=self.text(row), metadata=self.metadata(row))
+
+    def add(self, texts: dict) -> None:
+        """A method to add new documents, they are written to disk with the next save."""
+        overlapping = [
+            doc_id
+            for doc_id in texts
+            if doc_id in self.added or (doc_id in self.rows and doc_id not in self.deleted)
+        ]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self.added.update(texts)
+
+    def update(self, texts: dict) -> None:
+        """A method to replace stored documents, used to record metadata changes of existing chunks."""
+        self.added.update(texts)
+
+    def delete(self, ids: list) -> None:
+        for doc_id in ids:
+            self.added.pop(doc_id, None)
+            if doc_id in self.rows:
+                self.deleted.add(doc_id)
+
+
+def all_metadata(db) -> list:
+    """A function to return the metadata of every chunk of a vector db in index order.
+    Stored columnar metadata is decoded once per distinct value, so the dicts must not be modified.
+    """
+    doc_ids = [db.index_to_docstore_id[position] for position in range(len(db.index_to_docstore_id))]
+    docstore = db.docstore
+    if not isinstance(docstore, COLUMNAR_DOCSTORE):
+        return [docstore.search(doc_id).metadata for doc_id in doc_ids]
+    decoded_values = {}
+    return [
+        docstore.added[doc_id].metadata
+        if doc_id in docstore.added
+        else docstore.metadata(docstore.rows[doc_id], decoded_values)
+        for doc_id in doc_ids
+    ]
+
+
+class COLUMNAR_DOCSTORE_WRITER(Docstore, AddableMixin):
+    """A class to write the chunks of a vector db as a columnar docstore while the db is being built.
+    Texts are compressed and appended to disk block by block as they are added, only the metadata of the
+    chunks is kept in memory until close() writes the offset tables and metadata columns.
+    Metadata dicts are kept by reference, so changes made to them before close() are written.
+    """
+
+    def __init__(self, folder_path) -> None:
+        os.makedirs(folder_path, exist_ok=True)
+        self.folder_path = folder_path
+        self.texts_path = os.path.join(folder_path, DOCSTORE_TEXTS_FILE_NAME)
+        self.texts_file = open(f"{self.texts_path}.tmp", "wb")
+        self.ids, self.metadatas = [], []
+        self.text_lengths, self.block_lengths = [], []
+        self.block = []  # Encoded texts of the block being filled
+
+    def add(self, texts: dict) -> None:
+        """A method to append documents in index order, their texts are written once their block is full."""
+        for doc_id, document in texts.items():
+            encoded = document.page_content.encode("utf-8")
+            self.ids.append(doc_id)
+            self.metadatas.append(document.metadata)
+            self.text_lengths.append(len(encoded))
+            self.block.append(encoded)
+            if len(self.block) == TEXT_BLOCK_SIZE:
+                self._flush_block()
+
+    def search(self, search: str):
+        raise NotImplementedError("Chunks are readable once the docstore is closed and loaded.")
+
+    def delete(self, ids: list) -> None:
+        raise NotImplementedError("Chunks cannot be deleted while the docstore is written.")
+
+    def _flush_block(self) -> None:
+        if self.block:
+            compressed = zlib.compress(b"".join(self.block), 6)
+            self.texts_file.write(compressed)
+            self.block_lengths.append(len(compressed))
+            self.block = []
+
+    def close(self) -> None:
+        """A method to write the last block, the offset tables and the metadata columns."""
+        self._flush_block()
+        self.texts_file.close()
+        os.replace(f"{self.texts_path}.tmp", self.texts_path)
+
+        # The offsets locate every text inside its decompressed block
+        text_offsets = np.zeros(len(self.text_lengths) + 1, dtype=np.int64)
+        np.cumsum(self.text_lengths, out=text_offsets[1:])
+        block_offsets = np.zeros(len(self.block_lengths) + 1, dtype=np.int64)
+        np.cumsum(self.block_lengths, out=block_offsets[1:])
+
+        # Integer metadata is stored as is, any other value is interned as JSON and stored as a code
+        metadatas = self.metadatas
+        names = list(dict.fromkeys(name for metadata in metadatas for name in metadata))
+        layout_columns, arrays = [], {}
+        for index, name in enumerate(names):
+            present = [metadata[name] for metadata in metadatas if name in metadata]
+            if _is_int_column(present):
+                codes = np.array(
+                    [metadata.get(name, np.iinfo(np.int64).min) for metadata in metadatas],
+                    dtype=np.int64,
+                )
+                layout_columns.append({"name": name, "kind": "int"})
+            else:
+                interned = {}
+                codes = np.array(
+                    [
+                        interned.setdefault(json.dumps(metadata[name], sort_keys=True), len(interned))
+                        if name in metadata
+                        else -1
+                        for metadata in metadatas
+                    ],
+                    dtype=np.int32,
+                )
+                layout_columns.append({"name": name, "kind": "interned", "values": list(interned)})
+            arrays[f"column_{index}"] = codes
+
+        _atomic_write(
+            os.path.join(self.folder_path, DOCSTORE_ARRAYS_FILE_NAME),
+            lambda f: np.savez(
+                f,
+                ids=np.array(self.ids, dtype=str),
+                text_offsets=text_offsets,
+                block_offsets=block_offsets,
+                **arrays,
+            ),
+        )
+        # The layout is written last, it marks the docstore as complete
+        _atomic_write(
+            os.path.join(self.folder_path, DOCSTORE_FILE_NAME),
+            lambda f: f.write(
+                json.dumps(
+                    {
+                        "version": DOCSTORE_FORMAT_VERSION,
+                        "num_docs": len(self.ids),
+                        "block_size": TEXT_BLOCK_SIZE,
+                        "columns": layout_columns,
+                    }
+                ).encode("utf-8")
+            ),
+        )
+
+
+def save_docstore(db, folder_path) -> None:
+    """A function to write the chunks of a vector db as a columnar docstore in index order."""
+    writer = COLUMNAR_DOCSTORE_WRITER(folder_path)
+    for position in range(len(db.index_to_docstore_id)):
+        doc_id = db.index_to_docstore_id[position]
+        writer.add({doc_id: db.docstore.search(doc_id)})
+    writer.close()
+
+
+def load_columnar_db(folder_path, embeddings):
+    """A function to load a FAISS vector db whose chunks are stored in a columnar docstore."""
+    import faiss
+    from langchain.vectorstores import FAISS
+
+    index = faiss.read_index(os.path.join(folder_path, "index.faiss"))
+    docstore = COLUMNAR_DOCSTORE.load(folder_path)
+    index_to_docstore_id = dict(enumerate(docstore.ids))
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
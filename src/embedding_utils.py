@@ -0,0 +1,434 @@
+""" A python file to define the embedding backends used to build and query the vector databases.
+    The backend is selected in config.json: "openai" uses OpenAI's embeddings API and "local_tfidf" runs a
+    hashed TF-IDF model with a randomized SVD projection on the CPU without any network call.
+    Remote embeddings of large corpora go through a dispatcher that packs chunks into token sized requests
+    and sends them concurrently within the rate limits of the API.
+"""
+
+import os
+import json
+import zlib
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from retrieval_utils import tokenize
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+EMBEDDING_BACKEND = config["EMBEDDING_BACKEND"]  # Embedding backend - openai or local_tfidf
+LOCAL_EMBEDDING_DIM = config["LOCAL_EMBEDDING_DIM"]  # Dimension of the local embedding vectors
+LOCAL_EMBEDDING_FEATURES = config[
+    "LOCAL_EMBEDDING_FEATURES"
+]  # Number of hashed term features of the local embedding model
+EMBEDDING_REQUEST_MAX_TOKENS = config[
+    "EMBEDDING_REQUEST_MAX_TOKENS"
+]  # Tokens packed into a single embeddings request
+EMBEDDING_MAX_CONCURRENCY = config["EMBEDDING_MAX_CONCURRENCY"]  # Embeddings requests in flight at the same time
+EMBEDDING_REQUESTS_PER_MINUTE = config["EMBEDDING_REQUESTS_PER_MINUTE"]  # Request rate limit of the API
+EMBEDDING_TOKENS_PER_MINUTE = config["EMBEDDING_TOKENS_PER_MINUTE"]  # Token rate limit of the API
+EMBEDDING_MAX_RETRIES = config["EMBEDDING_MAX_RETRIES"]  # Retries of a failed request before the build fails
+EMBEDDING_CACHE_DIR = config["EMBEDDING_CACHE_DIR"]  # Directory of the persistent embedding caches
+
+EMBEDDING_BACKENDS = ["openai", "local_tfidf"]
+LOCAL_MODEL_FILE_NAME = "local_embedding.npz"  # File name of the fitted local model inside the db directory
+
+
+class HASHED_TFIDF_EMBEDDINGS(Embeddings):
+    """A class to embed texts locally with hashed TF-IDF features projected by a randomized SVD.
+    The model is fitted on the chunks of a collection and persisted with its index, so queries use the same projection.
+    """
+
+    backend_name = "local_tfidf"
+
+    def __init__(
+        self,
+        n_features=LOCAL_EMBEDDING_FEATURES,
+        dim=LOCAL_EMBEDDING_DIM,
+        idf=None,
+        components=None,
+        batch_size=512,
+    ) -> None:
+        self.n_features = n_features
+        self.dim = dim
+        self.idf = idf  # Inverse document frequency of every hashed feature
+        self.components = components  # (dim, n_features) projection from features to embedding space
+        self.batch_size = batch_size
+        self._feature_ids = {}  # token -> hashed feature id
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.idf is not None and self.components is not None
+
+    def _feature_id(self, token) -> int:
+        """A method to hash a token to a feature id with a hash that is stable across processes."""
+        feature_id = self._feature_ids.get(token)
+        if feature_id is None:
+            feature_id = zlib.crc32(token.encode("utf-8")) % self.n_features
+            self._feature_ids[token] = feature_id
+        return feature_id
+
+    def _term_frequencies(self, texts) -> np.ndarray:
+        """A method to build the sublinear term frequency matrix (texts, n_features) of a batch."""
+        rows, columns = [], []
+        for row, text in enumerate(texts):
+            feature_ids = [self._feature_id(token) for token in tokenize(text)]
+            rows.extend([row] * len(feature_ids))
+            columns.extend(feature_ids)
+        counts = np.bincount(
+            np.asarray(rows, dtype=np.int64) * self.n_features
+            + np.asarray(columns, dtype=np.int64),
+            minlength=len(texts) * self.n_features,
+        ).reshape(len(texts), self.n_features)
+        term_frequencies = np.zeros(counts.shape, dtype=np.float32)
+        np.log(counts, out=term_frequencies, where=counts > 0)
+        term_frequencies[counts > 0] += 1.0
+        return term_frequencies
+
+    def _tfidf(self, texts, idf) -> np.ndarray:
+        """A method to build the L2 normalised TF-IDF matrix of a batch."""
+        tfidf = self._term_frequencies(texts) * idf
+        tfidf /= np.linalg.norm(tfidf, axis=1, keepdims=True) + 1e-12
+        return tfidf
+
+    def _batches(self, texts):
+        for start in range(0, len(texts), self.batch_size):
+            yield start, texts[start : start + self.batch_size]
+
+    def fit(self, texts, oversample: int = 10, seed: int = 0):
+        """A method to fit the model on a corpus and return a new fitted instance.
+        The projection is the top singular vectors of the TF-IDF matrix found with a randomized SVD
+        computed batch by batch, so the full matrix is never held in memory.
+        """
+        texts = list(texts)
+        if not texts:
+            raise ValueError("Cannot fit the local embedding model without texts.")
+
+        # First pass: document frequencies
+        document_frequency = np.zeros(self.n_features, dtype=np.float64)
+        for _, batch in self._batches(texts):
+            document_frequency += (self._term_frequencies(batch) > 0).sum(axis=0)
+        idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        # Second pass: sample the range of the TF-IDF matrix with a random projection
+        rank = self.dim + oversample
+        omega = np.random.default_rng(seed).standard_normal((self.n_features, rank)).astype(np.float32)
+        sample = np.zeros((len(texts), rank), dtype=np.float32)
+        for start, batch in self._batches(texts):
+            sample[start : start + len(batch)] = self._tfidf(batch, idf) @ omega
+        basis, _ = np.linalg.qr(sample)
+
+        # Third pass: project the TF-IDF matrix on the basis and decompose the small matrix
+        projected = np.zeros((basis.shape[1], self.n_features), dtype=np.float32)
+        for start, batch in self._batches(texts):
+            projected += basis[start : start + len(batch)].T @ self._tfidf(batch, idf)
+        _, _, vt = np.linalg.svd(projected, full_matrices=False)
+
+        # Small corpora have fewer singular vectors than dimensions, pad to keep a fixed dimension
+        components = np.zeros((self.dim, self.n_features), dtype=np.float32)
+        components[: min(self.dim, vt.shape[0])] = vt[: self.dim]
+
+        return HASHED_TFIDF_EMBEDDINGS(
+            n_features=self.n_features,
+            dim=self.dim,
+            idf=idf,
+            components=components,
+            batch_size=self.batch_size,
+        )
+
+    def _embed(self, texts) -> np.ndarray:
+        """A method to embed texts into L2 normalised vectors, one vectorized batch at a time."""
+        if not self.is_fitted:
+            raise ValueError("The local embedding model is not fitted. Build the index first.")
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start, batch in self._batches(texts):
+            vectors[start : start + len(batch)] = self._tfidf(batch, self.idf) @ self.components.T
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        return vectors
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self._embed([text])[0].tolist()
+
+    def save(self, folder_path) -> None:
+        """A method to persist the fitted model in the given folder."""
+        np.savez_compressed(
+            os.path.join(folder_path, LOCAL_MODEL_FILE_NAME),
+            idf=self.idf,
+            components=self.components,
+            n_features=self.n_features,
+            dim=self.dim,
+        )
+
+    @classmethod
+    def load(cls, folder_path):
+        """A method to load a fitted model, returns None when the folder has no model."""
+        model_path = os.path.join(folder_path, LOCAL_MODEL_FILE_NAME)
+        if not os.path.isfile(model_path):
+            return None
+        with np.load(model_path) as data:
+            return cls(
+                n_features=int(data["n_features"]),
+                dim=int(data["dim"]),
+                idf=data["idf"],
+                components=data["components"],
+            )
+
+
+class RATE_LIMITER:
+    """A class to keep requests within a per minute request and token budget, refilled continuously."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute) -> None:
+        self.requests_per_second = requests_per_minute / 60
+        self.tokens_per_second = tokens_per_minute / 60
+        self.available_requests = float(requests_per_minute)
+        self.available_tokens = float(tokens_per_minute)
+        self.max_requests = float(requests_per_minute)
+        self.max_tokens = float(tokens_per_minute)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens) -> float:
+        """A method to wait until a request of the given tokens fits in the budget, returns the seconds waited."""
+        tokens = min(tokens, self.max_tokens)  # A request larger than the budget waits for a full bucket
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                elapsed = now - self.updated_at
+                self.updated_at = now
+                self.available_requests = min(
+                    self.max_requests, self.available_requests + elapsed * self.requests_per_second
+                )
+                self.available_tokens = min(
+                    self.max_tokens, self.available_tokens + elapsed * self.tokens_per_second
+                )
+                if self.available_requests >= 1 and self.available_tokens >= tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= tokens
+                    return waited
+                wait = max(
+                    (1 - self.available_requests) / self.requests_per_second,
+                    (tokens - self.available_tokens) / self.tokens_per_second,
+                )
+            time.sleep(wait)
+            waited += wait
+
+
+class EMBEDDING_DISPATCHER:
+    """A class to embed many texts with a remote embeddings backend.
+    Texts are packed in order into requests close to a token limit, requests run concurrently within the
+    rate limits and only the requests that fail are retried.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        max_tokens_per_request=EMBEDDING_REQUEST_MAX_TOKENS,
+        max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+        requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE,
+        tokens_per_minute=EMBEDDING_TOKENS_PER_MINUTE,
+        max_retries=EMBEDDING_MAX_RETRIES,
+    ) -> None:
+        self.embeddings = embeddings
+        self.max_tokens_per_request = max_tokens_per_request
+        # LangChain splits larger calls into several requests, so a packed request never exceeds its chunk size
+        self.max_texts_per_request = getattr(embeddings, "chunk_size", 1000)
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RATE_LIMITER(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.stats = {}
+
+    def pack(self, token_counts) -> list:
+        """A method to split text positions into consecutive (start, end, tokens) requests within the limits."""
+        requests = []
+        start, tokens = 0, 0
+        for position, count in enumerate(token_counts):
+            if position > start and (
+                tokens + count > self.max_tokens_per_request
+                or position - start >= self.max_texts_per_request
+            ):
+                requests.append((start, position, tokens))
+                start, tokens = position, 0
+            tokens += count
+        if start < len(token_counts):
+            requests.append((start, len(token_counts), tokens))
+        return requests
+
+    def _send(self, texts, tokens) -> tuple:
+        """A method to send one request, retrying it with exponential backoff, returns (vectors, retries)."""
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(tokens)
+            try:
+                return self.embeddings.embed_documents(texts), attempt
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Embeddings request failed, retrying ({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(min(2**attempt, 30))
+
+    def embed(self, texts, token_counts=None, progress_callback=None) -> list:
+        """A method to embed texts and return their vectors in order.
+        progress_callback(embedded, total) is called after every completed request and may raise to stop the build.
+        """
+        texts = list(texts)
+        if token_counts is None:
+            from context_utils import count_tokens_batch
+
+            token_counts = count_tokens_batch(texts)
+        requests = self.pack(token_counts)
+        vectors = [None] * len(texts)
+
+        start_time = time.perf_counter()
+        embedded, retries = 0, 0
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        try:
+            futures = {
+                executor.submit(self._send, texts[start:end], tokens): (start, end)
+                for start, end, tokens in requests
+            }
+            for future in as_completed(futures):
+                start, end = futures[future]
+                request_vectors, request_retries = future.result()
+                vectors[start:end] = request_vectors
+                embedded += end - start
+                retries += request_retries
+                if progress_callback is not None:
+                    progress_callback(embedded, len(texts))
+        finally:
+            # Requests not started yet are dropped when a request fails for good or the build is cancelled
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        seconds = time.perf_counter() - start_time
+        self.stats = {
+            "vectors": len(texts),
+            "tokens": sum(token_counts),
+            "requests": len(requests),
+            "retries": retries,
+            "seconds": seconds,
+            "vectors_per_second": len(texts) / seconds if seconds > 0 else None,
+        }
+        return vectors
+
+
+class CACHED_EMBEDDINGS(Embeddings):
+    """A class to wrap remote embeddings with a persistent cache of vectors keyed by the text hash.
+    Texts embedded before, by any build or query, are served from a SQLite file without a request.
+    """
+
+    def __init__(self, embeddings, cache_dir=f"{project_root}/{EMBEDDING_CACHE_DIR}") -> None:
+        self.embeddings = embeddings
+        self.backend_name = embedding_backend_name(embeddings)
+        model = getattr(embeddings, "model", "")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_path = os.path.join(cache_dir, f"{self.backend_name}_{model}.sqlite".replace("/", "_"))
+        self.connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB)")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(text) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts):
+        """A method to embed texts, requesting only the texts that are not cached yet."""
+        keys = [self._key(text) for text in texts]
+        with self.lock:
+            cached = {}
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+                cached.update((key, np.frombuffer(vector, dtype=np.float32).tolist()) for key, vector in rows)
+
+        missing = list(dict.fromkeys(key for key in keys if key not in cached))
+        if missing:
+            texts_by_key = dict(zip(keys, texts))
+            vectors = self.embeddings.embed_documents([texts_by_key[key] for key in missing])
+            with self.lock:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO vectors (key, vector) VALUES (?, ?)",
+                    [
+                        (key, np.asarray(vector, dtype=np.float32).tobytes())
+                        for key, vector in zip(missing, vectors)
+                    ],
+                )
+                self.connection.commit()
+            cached.update(zip(missing, vectors))
+
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class OPENAI_TEXT_EMBEDDINGS(Embeddings):
+    """A class to embed texts with OpenAI's embeddings API without tokenizing them first.
+    LangChain's OpenAIEmbeddings encodes every text with tiktoken before sending it, which downloads the
+    encoding on first use. Chunks are split far below the context length of the embeddings model, so they
+    are sent as they are when the encoding cannot be loaded.
+    """
+
+    backend_name = "openai"
+
+    def __init__(self, api_key=None, base_url=None, model="text-embedding-ada-002", chunk_size=1000) -> None:
+        from openai import OpenAI
+
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.model = model
+        self.chunk_size = chunk_size
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.chunk_size):
+            response = self.client.embeddings.create(
+                model=self.model, input=texts[start : start + self.chunk_size]
+            )
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def get_embeddings(backend=EMBEDDING_BACKEND, api_key=None, base_url=None):
+    """A function to create the embeddings of the selected backend."""
+    if backend == "openai":
+        from context_utils import token_encoding_available
+
+        if not token_encoding_available():
+            return OPENAI_TEXT_EMBEDDINGS(api_key=api_key, base_url=base_url)
+
+        from langchain.embeddings import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(openai_api_key=api_key, openai_api_base=base_url)
+    elif backend == "local_tfidf":
+        return HASHED_TFIDF_EMBEDDINGS()
+    else:
+        raise ValueError(f"Unsupported embedding backend: {backend}")
+
+
+def embedding_backend_name(embeddings) -> str:
+    """A function to return the backend name of an embeddings object, as recorded in the index manifest."""
+    backend_name = getattr(embeddings, "backend_name", None)
+    if backend_name is not None:
+        return backend_name
+    return "openai" if type(embeddings).__name__ == "OpenAIEmbeddings" else type(embeddings).__name__
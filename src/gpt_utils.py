@@ -1,12 +1,13 @@
-"""This file to define basic functionalities using Open AI's GPT models. """
+"""This file to define basic functionalities using Open AI's GPT models.
+    The OpenAI client, tiktoken and the retrieval stack are imported on first use, so pages can import this module cheaply.
+"""
 
 import os
+import time
 import json
-import tiktoken  # Importing tiktoken library to calculate the number of tokens
-from openai import OpenAI  # Importing Open AI library
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.chat_models import ChatOpenAI
-from langchain.chains import RetrievalQA
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from trace_utils import tracer
 
 # Get the absolute path to the project root directory
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -21,21 +22,106 @@ default_model = config["DEFAULT_MODEL"]  # Default gpt model for use - gpt-3.5-t
 large_context_model = config[
     "LARGE_CONTEXT_MODEL"
 ]  # Large context gpt model for large amount of tokens - gpt-3.5-turbo-16k
+BATCH_QNA_MAX_WORKERS = config[
+    "BATCH_QNA_MAX_WORKERS"
+]  # Maximum number of concurrent completions in batch QnA
+EMBEDDING_BACKEND = config["EMBEDDING_BACKEND"]  # Embedding backend - openai or local_tfidf
+RETRIEVAL_MODE = config["RETRIEVAL_MODE"]  # Default retrieval mode - hybrid, vector or lexical
+RETRIEVAL_MODES = config["RETRIEVAL_MODES"]  # Retrieval modes offered by the pages and the API
+CHAT_HISTORY_TOKEN_BUDGET = config[
+    "CHAT_HISTORY_TOKEN_BUDGET"
+]  # Tokens of conversation history kept for rewriting follow-up questions
+CHAT_SUMMARY_MAX_TOKENS = config["CHAT_SUMMARY_MAX_TOKENS"]  # Maximum tokens of the running summary of older turns
+
+
+class CHAT_HISTORY:
+    """A class to keep the history of a conversation within a token budget.
+    Recent turns are kept verbatim and older turns are rolled into a running summary, so the history sent
+    with every follow-up question stays bounded however long the conversation gets.
+    """
+
+    def __init__(self, token_budget=CHAT_HISTORY_TOKEN_BUDGET) -> None:
+        self.token_budget = token_budget
+        self.summary = ""
+        self.summary_tokens = 0
+        self.turns = []  # [{"question", "answer", "tokens"}], oldest first
+
+    @staticmethod
+    def format_turn(turn) -> str:
+        return f"User: {turn['question']}\nAssistant: {turn['answer']}"
+
+    def is_empty(self) -> bool:
+        return not self.summary and not self.turns
+
+    def tokens(self) -> int:
+        """A method to return the tokens of the summary and the recent turns."""
+        return self.summary_tokens + sum(turn["tokens"] for turn in self.turns)
+
+    def add_turn(self, question, answer) -> None:
+        from context_utils import count_tokens
+
+        turn = {"question": question, "answer": answer}
+        turn["tokens"] = count_tokens(self.format_turn(turn))
+        self.turns.append(turn)
+
+    def render(self, turns=None) -> str:
+        """A method to render the summary and the recent turns, or only the given turns, as text."""
+        if turns is not None:
+            return "\n".join(self.format_turn(turn) for turn in turns)
+        parts = [f"Summary of the earlier conversation: {self.summary}"] if self.summary else []
+        parts.extend(self.format_turn(turn) for turn in self.turns)
+        return "\n".join(parts)
+
+    def turns_to_fold(self) -> int:
+        """A method to return the number of oldest turns to roll into the summary, 0 while the history fits.
+        Turns are folded until the history is back to half of the budget, so the summary is rewritten once
+        every few turns instead of every turn. The latest turn is kept unless it alone exceeds the budget.
+        """
+        remaining = self.tokens()
+        if remaining <= self.token_budget:
+            return 0
+        count = 0
+        while count < len(self.turns) and remaining > self.token_budget // 2:
+            if count == len(self.turns) - 1 and remaining <= self.token_budget:
+                break
+            remaining -= self.turns[count]["tokens"]
+            count += 1
+        return count
+
+    def fold(self, count, summary) -> None:
+        """A method to replace the oldest turns with the updated running summary."""
+        from context_utils import count_tokens
+
+        self.turns = self.turns[count:]
+        self.summary = summary
+        self.summary_tokens = count_tokens(summary)
+
+    def clear(self) -> None:
+        self.summary, self.summary_tokens, self.turns = "", 0, []
 
 
 class GPT_UTILS:
     """A class to define various utilities for GPT usage"""
 
-    def __init__(self, api_key) -> None:
+    def __init__(self, api_key, base_url=None) -> None:
         self.api_key = api_key
-        self.client = OpenAI(api_key=self.api_key)
+        self.base_url = base_url  # Optional OpenAI compatible endpoint, e.g. the local benchmark backend
         self.default_model = default_model
         self.large_context_model = large_context_model
-        self.embeddings = OpenAIEmbeddings(openai_api_key=self.api_key)
-        self.langchain_llm = ChatOpenAI(
-            openai_api_key=self.api_key, model=self.default_model, temperature=0.5, max_tokens=512
-        )
-        
+
+    @cached_property
+    def client(self):
+        """The OpenAI client, created on first use."""
+        from openai import OpenAI  # Importing Open AI library
+
+        return OpenAI(api_key=self.api_key, base_url=self.base_url)
+
+    @cached_property
+    def embeddings(self):
+        """The embeddings of the backend selected in config.json, created on first use."""
+        from embedding_utils import get_embeddings
+
+        return get_embeddings(EMBEDDING_BACKEND, api_key=self.api_key, base_url=self.base_url)
 
     def validate_key(self) -> bool:
         """A function to validate the Open AI API Key"""
@@ -59,18 +145,9 @@ class GPT_UTILS:
 
     def num_tokens_from_string(self, string: str) -> int:
         """Returns the number of tokens in a text string."""
+        from context_utils import count_tokens  # Shared encoding, estimated when it cannot be loaded offline
 
-        try:
-            encoding = tiktoken.encoding_for_model(
-                self.default_model
-            )  # Loading the correct encoding for default model
-            num_tokens = len(
-                encoding.encode(string)
-            )  # Calculating the length of the tokens
-            return num_tokens
-        except KeyError:
-            print("Warning: model not found.")  # Terminal Error message for debugging
-            return None
+        return count_tokens(string)
 
     def select_model(self, messages, max_tokens):
         """A function to decide the model choice between regular or large context."""
@@ -98,46 +175,257 @@ class GPT_UTILS:
         """A function to get completion from provided messages using GPT models."""
 
         #openai.api_key = self.api_key
-        if len(functions) > 0:
-            response = self.client.chat.completions.create(
-                model=self.select_model(messages=messages, max_tokens=max_tokens),
-                messages=messages,
-                tools = [
-                    {
-                        "type": "function",
-                        "function": functions[0]
-                    }
-                ],
-                tool_choice="auto",
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-        else:
-            response = self.client.chat.completions.create(
-                model=self.select_model(messages=messages, max_tokens=max_tokens),
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
+        model = self.select_model(messages=messages, max_tokens=max_tokens)
+        with tracer.span("complete", name=model) as span:
+            if len(functions) > 0:
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    tools = [
+                        {
+                            "type": "function",
+                            "function": functions[0]
+                        }
+                    ],
+                    tool_choice="auto",
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                )
+            else:
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                )
+
+            if response.usage is not None:
+                span["prompt_tokens"] = response.usage.prompt_tokens
+                span["completion_tokens"] = response.usage.completion_tokens
+                span["tokens"] = response.usage.total_tokens
 
         return response
 
-    def retrieval_qa(self, query, prompt, db, return_source_documents: bool = True):
-        """A function to use retrivers from vectorstores and generate completions with GPT models."""
+    def answer_from_documents(self, query, prompt, documents, context_builder=None) -> dict:
+        """A function to pack retrieved chunks into the prompt context and generate the answer with GPT models."""
+        from context_utils import CONTEXT_BUILDER
+
+        # Pack the most relevant text first within the context token budget
+        context_builder = context_builder or CONTEXT_BUILDER()
+        context, packed_documents, context_stats = context_builder.build(documents)
+
+        messages = [
+            {"role": "user", "content": prompt.format(context=context, question=query)}
+        ]
+        response = self.get_completion_from_messages(
+            messages=messages, temperature=0.5, max_tokens=512
+        )
+
+        return {
+            "query": query,
+            "result": response.choices[0].message.content,
+            "context_stats": context_stats,
+            "tokens_used": response.usage.total_tokens,
+            "prompt_tokens": response.usage.prompt_tokens,
+            "completion_tokens": response.usage.completion_tokens,
+            "source_documents": packed_documents,
+        }
+
+    def retrieval_qa(
+        self,
+        query,
+        prompt,
+        db,
+        return_source_documents: bool = True,
+        retrieval_mode: str = RETRIEVAL_MODE,
+        bm25_index=None,
+        context_builder=None,
+    ):
+        """A function to use retrivers from vectorstores and generate completions with GPT models.
+        retrieval_mode selects lexical (BM25 only, no embedding call), vector (FAISS MMR) or hybrid retrieval.
+        Retrieved chunks are packed into a token budgeted context and the prompt tokens saved are reported in context_stats.
+        """
 
         #openai.api_key = self.api_key
+        from retrieval_utils import HYBRID_RETRIEVER
+
         try:
-            retriever = db.as_retriever(search_type="mmr", search_kwargs={"k": 6})
-            retriever_qa_chain = RetrievalQA.from_chain_type(
-                llm=self.langchain_llm,
-                retriever=retriever,
-                chain_type="stuff",
-                return_source_documents=return_source_documents,
-                chain_type_kwargs={"prompt": prompt},
+            retriever = HYBRID_RETRIEVER(
+                db=db, bm25_index=bm25_index, mode=retrieval_mode, k=6
+            )
+            with tracer.span("retrieve", name=retrieval_mode) as span:
+                documents = retriever.get_relevant_documents(query)
+                span["items"] = len(documents)
+
+            result = self.answer_from_documents(
+                query, prompt, documents, context_builder=context_builder
             )
-            result = retriever_qa_chain({"query": query})
+            if not return_source_documents:
+                del result["source_documents"]
 
             return result
         except Exception as e:
             print(f"Error retrieving response: {e}")
             return None
+
+    def compact_history(self, history) -> int:
+        """A function to roll the oldest turns of a chat history into its running summary when it exceeds
+        its token budget. Returns the tokens used by the summarization, 0 when the history fits.
+        """
+        from prompts import summarize_chat_history
+
+        count = history.turns_to_fold()
+        if count == 0:
+            return 0
+        response = self.get_completion_from_messages(
+            messages=summarize_chat_history(history.summary, history.render(history.turns[:count])),
+            temperature=0,
+            max_tokens=CHAT_SUMMARY_MAX_TOKENS,
+        )
+        history.fold(count, response.choices[0].message.content.strip())
+        return response.usage.total_tokens
+
+    def conversational_qa(
+        self,
+        query,
+        prompt,
+        db,
+        history,
+        retrieval_mode: str = RETRIEVAL_MODE,
+        bm25_index=None,
+        context_builder=None,
+    ):
+        """A function to answer a question of a conversation against a vector database.
+        A follow-up question is first rewritten into a standalone question from the chat history, which is used
+        for retrieval and answering. The turn is then added to the history, which is compacted to its budget.
+        A failed compaction keeps the answer, the history is compacted again after the next turn.
+        """
+        from prompts import condense_question
+        from retrieval_utils import HYBRID_RETRIEVER
+
+        try:
+            standalone_query, condense_tokens = query, 0
+            if not history.is_empty():
+                response = self.get_completion_from_messages(
+                    messages=condense_question(history.render(), query),
+                    temperature=0,
+                    max_tokens=128,
+                )
+                standalone_query = response.choices[0].message.content.strip() or query
+                condense_tokens = response.usage.total_tokens
+
+            retriever = HYBRID_RETRIEVER(
+                db=db, bm25_index=bm25_index, mode=retrieval_mode, k=6
+            )
+            with tracer.span("retrieve", name=retrieval_mode) as span:
+                documents = retriever.get_relevant_documents(standalone_query)
+                span["items"] = len(documents)
+
+            result = self.answer_from_documents(
+                standalone_query, prompt, documents, context_builder=context_builder
+            )
+        except Exception as e:
+            print(f"Error retrieving response: {e}")
+            return None
+
+        history.add_turn(query, result["result"])
+        try:
+            summary_tokens = self.compact_history(history)
+        except Exception as e:
+            print(f"Error summarizing chat history: {e}")
+            summary_tokens = 0
+
+        result.update(
+            query=query,
+            standalone_query=standalone_query,
+            tokens_used=result["tokens_used"] + condense_tokens + summary_tokens,
+            history_tokens=history.tokens(),
+        )
+        return result
+
+    def batch_retrieval_qa(
+        self,
+        queries,
+        prompt,
+        db,
+        retrieval_mode: str = RETRIEVAL_MODE,
+        bm25_index=None,
+        max_workers: int = BATCH_QNA_MAX_WORKERS,
+        retrieval_batch_size: int = 32,
+    ):
+        """A generator to answer a list of questions concurrently against a vector database.
+        Retrieval runs once per batch of distinct questions and completions run on at most max_workers threads.
+        Yields one result per question, in completion order, with latency, token usage and sources.
+        Answers completed while later batches are still being retrieved are yielded between the batches.
+        """
+        from retrieval_utils import HYBRID_RETRIEVER
+        from context_utils import CONTEXT_BUILDER
+
+        retriever = HYBRID_RETRIEVER(db=db, bm25_index=bm25_index, mode=retrieval_mode, k=6)
+        context_builder = CONTEXT_BUILDER()
+
+        # Repeated questions are retrieved and answered once
+        positions = {}
+        for index, query in enumerate(queries):
+            positions.setdefault(query, []).append(index)
+        unique_queries = list(positions)
+
+        def answer(query, documents, retrieval_seconds):
+            start_time = time.time()
+            result = self.answer_from_documents(
+                query, prompt, documents, context_builder=context_builder
+            )
+            completion_seconds = time.time() - start_time
+            return {
+                "answer": result["result"],
+                "latency_seconds": retrieval_seconds + completion_seconds,
+                "retrieval_seconds": retrieval_seconds,
+                "completion_seconds": completion_seconds,
+                "prompt_tokens": result["prompt_tokens"],
+                "completion_tokens": result["completion_tokens"],
+                "total_tokens": result["tokens_used"],
+                "context_tokens_saved": result["context_stats"]["tokens_saved"],
+                "sources": list(
+                    dict.fromkeys(
+                        document.metadata.get("source")
+                        for document in result["source_documents"]
+                    )
+                ),
+                "error": None,
+            }
+
+        futures = {}  # Answers not yielded yet -> question
+
+        def results(done):
+            for future in done:
+                query = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error retrieving response: {e}")
+                    result = {"answer": None, "error": str(e)}
+                for index in positions[query]:
+                    yield {"index": index, "question": query, **result}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for start in range(0, len(unique_queries), retrieval_batch_size):
+                batch = unique_queries[start : start + retrieval_batch_size]
+                start_time = time.time()
+                try:
+                    with tracer.span("retrieve", name=f"{retrieval_mode}_batch", queries=len(batch)):
+                        documents_batch = retriever.batch_get_relevant_documents(batch)
+                except Exception as e:
+                    print(f"Error retrieving documents: {e}")
+                    for query in batch:
+                        for index in positions[query]:
+                            yield {"index": index, "question": query, "answer": None, "error": str(e)}
+                    continue
+                # Every question of the batch is charged an equal share of the shared retrieval
+                retrieval_seconds = (time.time() - start_time) / len(batch)
+                for query, documents in zip(batch, documents_batch):
+                    future = executor.submit(answer, query, documents, retrieval_seconds)
+                    futures[future] = query
+                # Stream the answers already completed before retrieving the next batch
+                yield from results(wait(futures, timeout=0).done)
+
+            yield from results(as_completed(list(futures)))
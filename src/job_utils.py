@@ -0,0 +1,279 @@
+""" A python file to run vector database builds as background jobs.
+    Jobs are recorded in a SQLite table with their stage and progress, run on a local worker pool
+    and can be cancelled. Every process refreshes a heartbeat of the jobs it runs, and only jobs whose heartbeat
+    went stale because their process stopped are marked as interrupted so they can be resumed.
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from db_utils import VECTOR_DB_UTILS, BuildCancelled
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+JOB_DIR = config["JOB_DIR"]  # Load directory name for the job table and job input files
+JOB_MAX_WORKERS = config["JOB_MAX_WORKERS"]  # Number of builds running at the same time
+JOB_HEARTBEAT_SECONDS = config["JOB_HEARTBEAT_SECONDS"]  # Interval of the heartbeat of the jobs of a process
+
+job_path = f"{project_root}/{JOB_DIR}"
+
+ACTIVE_STATUSES = ["queued", "running"]
+RESUMABLE_STATUSES = ["interrupted", "failed"]
+
+# Heartbeats missed before a job is considered abandoned by its process
+HEARTBEAT_MISSES = 3
+
+# Share of the overall progress of every build stage, in order
+STAGE_WEIGHTS = {"queued": 0.0, "extract": 0.3, "split": 0.05, "dedup": 0.05, "embed": 0.5, "index": 0.1}
+
+
+def overall_progress(stage, fraction) -> float:
+    """A function to convert the progress of a stage into the overall progress of a build."""
+    progress = 0.0
+    for name, weight in STAGE_WEIGHTS.items():
+        if name == stage:
+            return progress + weight * min(max(fraction, 0.0), 1.0)
+        progress += weight
+    return 1.0
+
+
+class JOB_QUEUE:
+    """A class to submit, run, track and cancel vector database builds in background threads."""
+
+    def __init__(
+        self, job_dir=job_path, max_workers=JOB_MAX_WORKERS, on_complete=None, heartbeat_seconds=JOB_HEARTBEAT_SECONDS
+    ) -> None:
+        self.job_dir = job_dir
+        self.heartbeat_seconds = heartbeat_seconds
+        self.db_file = os.path.join(job_dir, "jobs.db")
+        self.on_complete = on_complete  # Called with the job after a successful build
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db_build")
+        self.cancel_events = {}  # job_id -> threading.Event of the jobs submitted by this process
+        self.lock = threading.Lock()
+        os.makedirs(job_dir, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    collection TEXT NOT NULL,
+                    input_type TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    progress REAL NOT NULL,
+                    message TEXT,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    heartbeat_at REAL
+                )"""
+            )
+            # Job tables created before heartbeats were recorded
+            columns = [row["name"] for row in connection.execute("PRAGMA table_info(jobs)")]
+            if "heartbeat_at" not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        self._mark_interrupted()
+        threading.Thread(target=self._heartbeat_loop, name="job_heartbeat", daemon=True).start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_file, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _update(self, job_id, **fields) -> None:
+        """A method to update the columns of a job."""
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{column} = ?" for column in fields)
+        with self._connect() as connection:
+            connection.execute(
+                f"UPDATE jobs SET {columns} WHERE id = ?", [*fields.values(), job_id]
+            )
+
+    def _heartbeat_loop(self) -> None:
+        """A method to refresh the heartbeat of the jobs queued or running in this process."""
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            with self.lock:
+                job_ids = list(self.cancel_events)
+            if job_ids:
+                with self._connect() as connection:
+                    connection.execute(
+                        f"UPDATE jobs SET heartbeat_at = ? WHERE id IN ({', '.join('?' * len(job_ids))})",
+                        [time.time(), *job_ids],
+                    )
+
+    def _mark_interrupted(self) -> None:
+        """A method to mark the active jobs whose process stopped sending heartbeats so they can be resumed.
+        Jobs queued or running in another live process, like the API or a second app, are left alone.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'interrupted', message = 'Interrupted by a restart, resume to rebuild.', "
+                "updated_at = ? WHERE status IN ('queued', 'running') AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                [now, now - HEARTBEAT_MISSES * self.heartbeat_seconds],
+            )
+
+    def _files_path(self, job_id) -> str:
+        return os.path.join(self.job_dir, job_id, "files")
+
+    def submit(
+        self,
+        collection,
+        input_type,
+        embeddings,
+        incremental=False,
+        page_content="",
+        source_url="",
+        files_path=None,
+    ) -> str:
+        """A method to record a build job and queue it, returns the job id.
+        For documents, the files of files_path are copied with the job so later uploads do not change it,
+        and the chunks record files_path as their source location rather than the job copy.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        if input_type == "documents":
+            shutil.copytree(files_path, self._files_path(job_id))
+        params = {
+            "incremental": incremental,
+            "page_content": page_content,
+            "source_url": source_url,
+            "source_path": os.path.abspath(files_path) if input_type == "documents" else None,
+        }
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, 'queued', 'queued', 0.0, NULL, NULL, ?, ?, ?)",
+                [job_id, collection, input_type, json.dumps(params), now, now, now],
+            )
+        self._start(job_id, embeddings)
+        return job_id
+
+    def resume(self, job_id, embeddings) -> None:
+        """A method to queue an interrupted or failed job again. Files extracted by the previous run are cached."""
+        self._update(job_id, status="queued", stage="queued", progress=0.0, message=None, heartbeat_at=time.time())
+        self._start(job_id, embeddings)
+
+    def _start(self, job_id, embeddings) -> None:
+        with self.lock:
+            self.cancel_events[job_id] = threading.Event()
+        self.executor.submit(self._run, job_id, embeddings)
+
+    def _run(self, job_id, embeddings) -> None:
+        """A method to run a build job in a worker thread."""
+        job = self.get(job_id)
+        cancel_event = self.cancel_events[job_id]
+        progress = 0.0
+
+        def progress_callback(stage, fraction, message=""):
+            nonlocal progress
+            if cancel_event.is_set():
+                raise BuildCancelled()
+            # Builds go through the stages batch by batch, the overall progress never moves back
+            progress = max(progress, overall_progress(stage, fraction))
+            self._update(job_id, stage=stage, progress=progress, message=message)
+
+        try:
+            if cancel_event.is_set():
+                raise BuildCancelled()
+            self._update(job_id, status="running")
+            vector_db = VECTOR_DB_UTILS(collection=job["collection"])
+            vector_db.knowledge_base_path = self._files_path(job_id)
+            # The job copy is removed after the build, sources point to the directory the files were queued from
+            vector_db.source_path = job["params"].get("source_path")
+            db, build_seconds = vector_db.run_db_build(
+                input_type=job["input_type"],
+                embeddings=embeddings,
+                page_content=job["params"]["page_content"],
+                source_url=job["params"]["source_url"],
+                db_persist=True,
+                incremental=job["params"]["incremental"],
+                progress_callback=progress_callback,
+            )
+        except BuildCancelled:
+            self._update(job_id, status="cancelled", message="Cancelled by the user.")
+            shutil.rmtree(os.path.join(self.job_dir, job_id), ignore_errors=True)
+            return
+        except Exception as e:
+            self._update(job_id, status="failed", message=str(e))
+            return
+        finally:
+            with self.lock:
+                self.cancel_events.pop(job_id, None)
+
+        if db is None:
+            self._update(job_id, status="failed", message="The vector database could not be built.")
+            return
+
+        result = {
+            "num_chunks": db.index.ntotal,
+            "build_seconds": build_seconds,
+            "dedup": vector_db.dedup_report,
+        }
+        message = f"Built in {build_seconds:.2f} seconds"
+        if vector_db.dedup_report and vector_db.dedup_report["dropped"]:
+            message += f", {vector_db.dedup_report['dropped']} duplicate chunks skipped"
+        self._update(
+            job_id,
+            status="completed",
+            stage="completed",
+            progress=1.0,
+            message=message,
+            result=json.dumps(result),
+        )
+        shutil.rmtree(os.path.join(self.job_dir, job_id), ignore_errors=True)
+        if self.on_complete is not None:
+            self.on_complete(self.get(job_id))
+
+    def cancel(self, job_id) -> bool:
+        """A method to request the cancellation of a job, returns False when the job is not active."""
+        job = self.get(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES + ["interrupted"]:
+            return False
+        with self.lock:
+            cancel_event = self.cancel_events.get(job_id)
+        if cancel_event is not None:
+            cancel_event.set()  # The worker stops at its next progress report
+        else:
+            self._update(job_id, status="cancelled", message="Cancelled by the user.")
+            shutil.rmtree(os.path.join(self.job_dir, job_id), ignore_errors=True)
+        return True
+
+    def get(self, job_id):
+        """A method to return a job as a dict, or None when it does not exist."""
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", [job_id]).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def recent(self, collection=None, limit: int = 10) -> list:
+        """A method to return the most recent jobs, optionally of a single collection."""
+        self._mark_interrupted()
+        query = "SELECT * FROM jobs"
+        params = []
+        if collection is not None:
+            query += " WHERE collection = ?"
+            params.append(collection)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as connection:
+            rows = connection.execute(query, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def _to_dict(self, row) -> dict:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
@@ -212,6 +212,6 @@ response_schema = {
         "Experience_Details",
         "Work_Experiences",
         "Certifications",
-        "Course_Completed",
+        "Courses_Completed",
     ],
 }
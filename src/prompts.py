@@ -1,7 +1,5 @@
 """ A python file to define prompts for various tasks with GPT models"""
 
-from langchain.prompts import PromptTemplate
-
 
 def summarize_cv(resume_context: str, word_limit: int = 250):
     """A prompt template to summariza the CV content."""
@@ -66,6 +64,22 @@ def extract_cv_details(resume_context, response_schema):
     return messages, functions
 
 
+def reextract_cv_fields(resume_context, field_names, response_schema):
+    """A prompt template to extract only the listed CV fields again, after they failed validation."""
+    delimitter = "####"
+    system_message = f"""Read the resume content provided in between {delimitter} characters. \
+        Extract only these fields in the JSON format mentioned in function schema: {", ".join(field_names)}. \
+        If a field is not mentioned in the resume, answer NA for text and 0 for numbers.
+        """
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": f"{delimitter}{resume_context}{delimitter}"},
+    ]
+    functions = [{"name": "json_response", "parameters": response_schema}]
+
+    return messages, functions
+
+
 def recommend_workouts(user_inputs:dict):
     """A prompt template to take user inputs and generate a workout routine."""
     system_message = """You are a professional physical trainer. \
@@ -106,6 +120,7 @@ def recommend_workouts(user_inputs:dict):
 
 def prompt_doc_qa():
     """A prompt template to define a prompt template for Question and Answering of a document."""
+    from langchain.prompts import PromptTemplate
 
     template = """Use the following pieces of context and answer the question at the end. \
         If you don't know the answer, just say you don't know. \
@@ -124,3 +139,39 @@ def prompt_doc_qa():
     )
 
     return qa_chain_prompt
+
+
+def condense_question(chat_history: str, question: str):
+    """A prompt template to rewrite a follow-up question into a standalone question for retrieval."""
+    delimitter = "####"
+    system_message = f"""Given the conversation provided in between {delimitter} characters and a follow-up question, \
+        rewrite the follow-up question as a standalone question that can be understood without the conversation. \
+        Replace pronouns and references with the names and topics they refer to. \
+        If the question is already standalone, return it unchanged. \
+        Answer with the standalone question only.
+        """
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": f"{delimitter}{chat_history}{delimitter}\nFollow-up question: {question}"},
+    ]
+
+    return messages
+
+
+def summarize_chat_history(summary: str, turns: str, word_limit: int = 120):
+    """A prompt template to roll older conversation turns into the running summary of a conversation."""
+    delimitter = "####"
+    system_message = f"""You keep a running summary of a conversation between a user and an assistant. \
+        Update the current summary with the new turns provided in between {delimitter} characters. \
+        Keep the topics, names, facts and open questions needed to understand follow-up questions. \
+        The updated summary must be not more than {word_limit} words.
+        """
+    messages = [
+        {"role": "system", "content": system_message},
+        {
+            "role": "user",
+            "content": f"Current summary: {summary or 'None'}\n{delimitter}{turns}{delimitter}",
+        },
+    ]
+
+    return messages
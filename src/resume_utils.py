@@ -0,0 +1,178 @@
+""" A python file to detect repeated resumes before their details are extracted.
+    Every resume text is matched against an index of the candidates seen so far, first by the hash of its
+    normalized text and then by the MinHash similarity of its word shingles, so a resume submitted again or
+    slightly edited is linked to the candidate it duplicates and only the first copy is sent to GPT.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import numpy as np
+from dedup_utils import CHUNK_DEDUPLICATOR
+from cv_utils import CV_EXTRACTOR
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+RESUME_INDEX_DIR = config["RESUME_INDEX_DIR"]  # Directory of the resume dedup index
+RESUME_DEDUP_THRESHOLD = config[
+    "RESUME_DEDUP_THRESHOLD"
+]  # Estimated Jaccard similarity above which resumes are the same candidate
+
+resume_index_path = f"{project_root}/{RESUME_INDEX_DIR}"
+INDEX_FILE_NAME = "index.json"
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text(text) -> str:
+    """A function to normalize a resume text, so copies exported with other spacing or casing hash the same."""
+    return WHITESPACE_PATTERN.sub(" ", text).strip().lower()
+
+
+def text_hash(text) -> str:
+    """A function to return the hash of a normalized resume text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class RESUME_INDEX:
+    """A class to link every resume to its canonical candidate record, stored on disk between sessions."""
+
+    def __init__(self, index_dir=resume_index_path, threshold=RESUME_DEDUP_THRESHOLD) -> None:
+        self.index_dir = index_dir
+        self.index_path = os.path.join(index_dir, INDEX_FILE_NAME)
+        self.threshold = threshold
+        self.deduplicator = CHUNK_DEDUPLICATOR(threshold=threshold)
+        self.candidates = {}  # candidate id -> candidate record
+        self.hashes = {}  # normalized text hash -> candidate id
+        self.load()
+
+    def load(self) -> None:
+        """A method to read the index from disk, an unreadable index starts empty."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.candidates = json.load(f)["candidates"]
+        except (OSError, ValueError, KeyError):
+            self.candidates = {}
+        self.hashes = {
+            resume_hash: candidate_id
+            for candidate_id, candidate in self.candidates.items()
+            for resume_hash in candidate["text_hashes"]
+        }
+
+    def save(self) -> None:
+        """A method to write the index to disk."""
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"candidates": self.candidates}, f)
+            os.replace(temp_path, self.index_path)  # Readers never see a half written index
+        except OSError as e:
+            print(f"Error while writing resume index: {e}")
+
+    def match(self, text) -> tuple:
+        """A method to return (candidate id, match type, similarity) of the candidate a resume text duplicates.
+        Exact copies are found by hash, edited copies by the highest signature similarity above the threshold.
+        Returns (None, "new", 0.0) for a new candidate.
+        """
+        candidate_id = self.hashes.get(text_hash(text))
+        if candidate_id is not None:
+            return candidate_id, "exact", 1.0
+        if not self.candidates:
+            return None, "new", 0.0
+
+        # Resume counts are small, so the signature is compared with every candidate instead of LSH buckets
+        candidate_ids = list(self.candidates)
+        signatures = np.array([self.candidates[candidate_id]["signature"] for candidate_id in candidate_ids])
+        similarities = np.mean(signatures == self.deduplicator.signature(text), axis=1)
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            return candidate_ids[best], "near", float(similarities[best])
+        return None, "new", 0.0
+
+    def add(self, file_name, text) -> dict:
+        """A method to index a resume and return its record, linking a duplicate to its canonical candidate."""
+        candidate_id, match, similarity = self.match(text)
+        resume_hash = text_hash(text)
+        if candidate_id is None:
+            candidate_id = resume_hash[:12]
+            self.candidates[candidate_id] = {
+                "canonical_file": file_name,
+                "signature": self.deduplicator.signature(text).tolist(),
+                "text_hashes": [],
+                "files": [],
+                "cv_details": None,
+                "errors": [],
+                "tokens_used": 0,
+                "created_at": time.time(),
+            }
+        candidate = self.candidates[candidate_id]
+        if resume_hash not in candidate["text_hashes"]:
+            candidate["text_hashes"].append(resume_hash)
+            self.hashes[resume_hash] = candidate_id
+        if file_name not in candidate["files"]:
+            candidate["files"].append(file_name)
+        return {
+            "file": file_name,
+            "candidate_id": candidate_id,
+            "match": match,
+            "similarity": round(similarity, 3),
+            "duplicate_of": None if candidate["canonical_file"] == file_name else candidate["canonical_file"],
+        }
+
+    def digest(self, gpt, file_paths, extract_text) -> tuple:
+        """A method to index resume files and extract the details of every new candidate.
+        Duplicates are linked to their candidate before any request, so each candidate is extracted once.
+        Candidates whose extraction reported errors are extracted again by the next digest, at most once per digest.
+        The index is saved after every file. Returns the record of every file and a report.
+        """
+        records, attempted = [], set()
+        report = {"files": len(file_paths), "new": 0, "exact": 0, "near": 0, "extracted": 0, "tokens_used": 0}
+        extractor = CV_EXTRACTOR(gpt)
+        for file_path in file_paths:
+            file_name = os.path.basename(file_path)
+            try:
+                text = extract_text(file_path)
+            except Exception as e:
+                records.append({"file": file_name, "error": f"Error while reading the resume: {e}"})
+                continue
+            if not text.strip():
+                records.append({"file": file_name, "error": "No text extracted."})
+                continue
+            record = self.add(file_name, text)
+            candidate_id = record["candidate_id"]
+            candidate = self.candidates[candidate_id]
+            report[record["match"]] += 1
+            if (candidate["cv_details"] is None or candidate.get("errors")) and candidate_id not in attempted:
+                attempted.add(candidate_id)
+                extraction = extractor.extract(text)
+                report["extracted"] += 1
+                report["tokens_used"] += extraction["tokens_used"]
+                candidate["tokens_used"] += extraction["tokens_used"]
+                candidate["errors"] = extraction["errors"]
+                if not extraction["errors"] or candidate["cv_details"] is None:
+                    candidate["cv_details"] = extraction["cv_details"]
+            if candidate.get("errors"):
+                # Duplicates report the errors of the candidate whose details they reuse
+                record["error"] = "; ".join(candidate["errors"])
+            records.append(record)
+            self.save()
+        report["candidates"] = len(self.candidates)
+        return records, report
+
+    def clear(self) -> None:
+        """A method to remove every candidate from the index."""
+        self.candidates, self.hashes = {}, {}
+        try:
+            os.remove(self.index_path)
+        except OSError:
+            pass
@@ -0,0 +1,302 @@
+""" A python file to define the local lexical index and the retrievers used to query the vector databases.
+    Retrieval can be lexical-only (BM25), vector-only (FAISS MMR) or both fused with reciprocal rank fusion.
+    Vector search runs batches of queries as one matrix search with NumPy MMR re-ranking.
+"""
+
+import os
+import re
+import json
+import math
+import heapq
+from collections import Counter
+from typing import Any, List
+import numpy as np
+from langchain.schema import BaseRetriever, Document
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+RETRIEVAL_MODE = config["RETRIEVAL_MODE"]  # Default retrieval mode - lexical, vector or hybrid
+RETRIEVAL_MODES = config["RETRIEVAL_MODES"]  # Retrieval modes offered by the pages and the API
+
+RRF_K = 60  # Rank offset of reciprocal rank fusion
+
+BM25_FILE_NAME = "bm25_index.json"  # File name of the lexical index inside the db directory
+
+# Words with inner separators like "ABC-123", "v1.2" or "user_id" are kept as one token
+TOKEN_PATTERN = re.compile(r"\w+(?:[-_./]\w+)*")
+
+
+def tokenize(text: str) -> list:
+    """A function to split text into lower cased lexical tokens.
+    Compound identifiers are indexed as a whole and by their parts, so exact codes and partial names both match.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[-_./]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def reciprocal_rank_fusion(ranked_lists, k: int = RRF_K) -> list:
+    """A function to fuse several ranked lists of ids into one ranking with reciprocal rank fusion."""
+    scores = {}
+    for ranked_ids in ranked_lists:
+        for rank, doc_id in enumerate(ranked_ids):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25_INDEX:
+    """A class to define an inverted BM25 index over the chunks stored in a vector database."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {doc_id: term frequency}
+        self.doc_lengths = {}  # doc_id -> number of tokens in the chunk
+        self.total_length = 0
+
+    def add_documents(self, doc_ids, texts) -> None:
+        """A method to add chunks to the index, replacing any chunk indexed with the same id."""
+        self.remove_documents([doc_id for doc_id in doc_ids if doc_id in self.doc_lengths])
+        for doc_id, text in zip(doc_ids, texts):
+            term_counts = Counter(tokenize(text))
+            for term, count in term_counts.items():
+                self.postings.setdefault(term, {})[doc_id] = count
+            length = sum(term_counts.values())
+            self.doc_lengths[doc_id] = length
+            self.total_length += length
+
+    def remove_documents(self, doc_ids) -> None:
+        """A method to remove chunks from the index."""
+        doc_ids = set(doc_ids)
+        if not doc_ids:
+            return
+        for term in list(self.postings):
+            posting = self.postings[term]
+            for doc_id in doc_ids.intersection(posting):
+                del posting[doc_id]
+            if not posting:
+                del self.postings[term]
+        for doc_id in doc_ids:
+            self.total_length -= self.doc_lengths.pop(doc_id, 0)
+
+    def search(self, query: str, k: int = 6) -> list:
+        """A method to return the top k (doc_id, score) pairs for the query."""
+        num_docs = len(self.doc_lengths)
+        if num_docs == 0:
+            return []
+        avg_length = self.total_length / num_docs
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (num_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, folder_path) -> None:
+        """A method to persist the index as json in the given folder."""
+        os.makedirs(folder_path, exist_ok=True)
+        with open(os.path.join(folder_path, BM25_FILE_NAME), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "k1": self.k1,
+                    "b": self.b,
+                    "postings": self.postings,
+                    "doc_lengths": self.doc_lengths,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, folder_path):
+        """A method to load a persisted index, returns None when the folder has no index."""
+        index_path = os.path.join(folder_path, BM25_FILE_NAME)
+        if not os.path.isfile(index_path):
+            return None
+        with open(index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.postings = data["postings"]
+        index.doc_lengths = data["doc_lengths"]
+        index.total_length = sum(index.doc_lengths.values())
+        return index
+
+    @classmethod
+    def from_db(cls, db):
+        """A method to build the index from the chunks stored in a FAISS database."""
+        index = cls()
+        doc_ids = list(db.index_to_docstore_id.values())
+        index.add_documents(
+            doc_ids, [db.docstore.search(doc_id).page_content for doc_id in doc_ids]
+        )
+        return index
+
+
+def batch_mmr(query_vectors, candidate_vectors, candidate_mask, k: int, lambda_mult: float = 0.5):
+    """A function to run maximal marginal relevance for a batch of queries at once with NumPy.
+
+    query_vectors is (queries, dim), candidate_vectors is (queries, candidates, dim) and candidate_mask
+    marks the valid candidates of each query. Returns the selected candidate positions (queries, k),
+    padded with -1, and the cosine similarity of every candidate to its query (queries, candidates).
+    """
+    queries = query_vectors / (
+        np.linalg.norm(query_vectors, axis=-1, keepdims=True) + 1e-12
+    )
+    candidates = candidate_vectors / (
+        np.linalg.norm(candidate_vectors, axis=-1, keepdims=True) + 1e-12
+    )
+    query_similarity = np.einsum("qd,qfd->qf", queries, candidates)
+    pair_similarity = np.einsum("qfd,qgd->qfg", candidates, candidates)
+
+    num_queries, num_candidates = query_similarity.shape
+    rows = np.arange(num_queries)
+    selected = np.full((num_queries, k), -1, dtype=np.int64)
+    available = candidate_mask.copy()
+    redundancy = np.full((num_queries, num_candidates), -np.inf, dtype=np.float32)
+
+    # The first pick is the most similar candidate, later picks trade similarity for diversity
+    scores = np.where(available, query_similarity, -np.inf)
+    for step in range(min(k, num_candidates)):
+        picks = np.argmax(scores, axis=1)
+        has_pick = np.isfinite(scores[rows, picks])
+        selected[has_pick, step] = picks[has_pick]
+        available[rows[has_pick], picks[has_pick]] = False
+        redundancy = np.maximum(redundancy, pair_similarity[rows, :, picks])
+        scores = np.where(
+            available,
+            lambda_mult * query_similarity - (1 - lambda_mult) * redundancy,
+            -np.inf,
+        )
+
+    return selected, query_similarity
+
+
+def batch_vector_search(db, queries, k: int = 6, fetch_k: int = 20, lambda_mult: float = 0.5) -> list:
+    """A function to search a FAISS database for a batch of queries with one embedding call and one matrix search.
+    Candidates are re-ranked with vectorized MMR. Returns a list of (chunk id, relevance) rankings, one per query.
+    """
+    if not queries:
+        return []
+    query_vectors = np.array(
+        db.embedding_function.embed_documents(list(queries)), dtype=np.float32
+    )
+    _, indices = db.index.search(query_vectors, fetch_k)
+
+    # Reconstruct every distinct candidate once and gather them per query
+    candidate_ids = np.unique(indices[indices != -1])
+    if len(candidate_ids) == 0:
+        return [[] for _ in queries]
+    if hasattr(db.index, "reconstruct_batch"):
+        vectors = db.index.reconstruct_batch(candidate_ids)
+    else:
+        vectors = np.vstack([db.index.reconstruct(int(i)) for i in candidate_ids])
+    positions = np.searchsorted(candidate_ids, np.where(indices == -1, candidate_ids[0], indices))
+    candidate_mask = indices != -1
+
+    selected, similarity = batch_mmr(
+        query_vectors, vectors[positions], candidate_mask, k=k, lambda_mult=lambda_mult
+    )
+    return [
+        [
+            (db.index_to_docstore_id[int(indices[q, i])], max(float(similarity[q, i]), 0.0))
+            for i in selected[q]
+            if i != -1
+        ]
+        for q in range(len(queries))
+    ]
+
+
+class HYBRID_RETRIEVER(BaseRetriever):
+    """A retriever to get chunks from a FAISS database with lexical, vector or fused rankings."""
+
+    db: Any
+    bm25_index: Any = None
+    mode: str = RETRIEVAL_MODE
+    k: int = 6
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+
+    def lexical_ranking(self, query: str) -> list:
+        """A method to rank (chunk id, relevance) pairs with BM25. It runs locally without any network call.
+        Relevance is the BM25 score relative to the best match.
+        """
+        results = self.bm25_index.search(query, k=self.fetch_k)
+        if not results:
+            return []
+        top_score = results[0][1]
+        return [(doc_id, score / top_score) for doc_id, score in results]
+
+    def vector_rankings(self, queries) -> list:
+        """A method to rank (chunk id, relevance) pairs for a batch of queries with vectorized MMR over the FAISS neighbours.
+        Relevance is the cosine similarity between the query and the chunk.
+        """
+        return batch_vector_search(
+            self.db, queries, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult
+        )
+
+    def batch_get_relevant_documents(self, queries) -> list:
+        """A method to retrieve the relevant chunks of several queries at once, returns a list of documents per query.
+        Vector search embeds and searches all queries in one batch.
+        """
+        if self.mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unsupported retrieval mode: {self.mode}")
+
+        if self.mode != "vector" and self.bm25_index is None:
+            raise ValueError(f"{self.mode} retrieval requires a BM25 index.")
+
+        queries = list(queries)
+        if self.mode == "lexical":
+            rankings = [self.lexical_ranking(query) for query in queries]
+        elif self.mode == "vector":
+            rankings = self.vector_rankings(queries)
+        else:
+            rankings = []
+            for query, vector in zip(queries, self.vector_rankings(queries)):
+                ranked_lists = [
+                    [doc_id for doc_id, _ in ranking] for ranking in (self.lexical_ranking(query), vector)
+                ]
+                # BM25 and cosine scores are not on the same scale, so relevance is the fused score alone,
+                # relative to a chunk ranked first by both rankings
+                top_score = len(ranked_lists) / (RRF_K + 1)
+                rankings.append(
+                    [
+                        (doc_id, score / top_score)
+                        for doc_id, score in reciprocal_rank_fusion(ranked_lists, k=RRF_K)
+                    ]
+                )
+
+        results = []
+        for ranking in rankings:
+            documents = []
+            for doc_id, score in ranking[: self.k]:
+                document = self.db.docstore.search(doc_id)
+                # Copy the stored document so the relevance never leaks into the shared docstore
+                documents.append(
+                    Document(
+                        page_content=document.page_content,
+                        metadata={**document.metadata, "relevance_score": score},
+                    )
+                )
+            results.append(documents)
+        return results
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.batch_get_relevant_documents([query])[0]
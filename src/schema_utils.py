@@ -0,0 +1,154 @@
+""" A python file to validate and repair JSON output of GPT models locally.
+    A schema is compiled once into nested check functions, which report the path of every invalid field and
+    coerce values that are cheap to fix, like numbers returned as text. Truncated or slightly malformed
+    JSON is repaired before it is parsed, so only the fields that are still invalid need another request.
+"""
+
+import re
+import json
+
+
+TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+CODE_FENCE_PATTERN = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+INTEGER_PATTERN = re.compile(r"-?\d+")
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+MAX_TRUNCATION_ATTEMPTS = 50  # Commas cut back to when closing a truncated JSON document
+
+
+def _close_json(text) -> str:
+    """A function to close the open string, objects and arrays at the end of a truncated JSON document."""
+    closers, in_string, escaped = [], False, False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]" and closers:
+            closers.pop()
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(",")
+    if text.endswith(":"):
+        text += " null"
+    return TRAILING_COMMA_PATTERN.sub(r"\1", text + "".join(reversed(closers)))
+
+
+def repair_json(text):
+    """A function to parse JSON output, repairing code fences, trailing commas and truncation.
+    Raises json.JSONDecodeError when the text can not be repaired.
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        error = e
+
+    text = TRAILING_COMMA_PATTERN.sub(r"\1", CODE_FENCE_PATTERN.sub("", text))
+    candidate = text
+    for _ in range(MAX_TRUNCATION_ATTEMPTS):
+        try:
+            return json.loads(_close_json(candidate))
+        except json.JSONDecodeError:
+            pass
+        # Drop the last incomplete member and try again
+        cut = candidate.rfind(",")
+        if cut <= 0:
+            break
+        candidate = candidate[:cut]
+    raise error
+
+
+def format_path(path) -> str:
+    """A function to format a field path like Work_Experiences[0].Company."""
+    formatted = ""
+    for key in path:
+        formatted += f"[{key}]" if isinstance(key, int) else f".{key}" if formatted else key
+    return formatted
+
+
+def compile_schema(schema):
+    """A function to compile a JSON schema into a check function.
+    The check function takes (value, path) and returns the coerced value and a list of (path, message) errors.
+    Supports the type, properties, required and items keywords used by the response schemas.
+    """
+    kind = schema.get("type")
+
+    if kind == "object":
+        properties = {name: compile_schema(sub) for name, sub in schema.get("properties", {}).items()}
+        required = schema.get("required", [])
+
+        def check(value, path):
+            if not isinstance(value, dict):
+                return value, [(path, "expected an object")]
+            checked, errors = dict(value), []
+            for name in required:
+                if value.get(name) is None:
+                    errors.append((path + (name,), "missing"))
+            for name, check_property in properties.items():
+                if value.get(name) is not None:
+                    checked[name], property_errors = check_property(value[name], path + (name,))
+                    errors.extend(property_errors)
+            return checked, errors
+
+    elif kind == "array":
+        check_item = compile_schema(schema.get("items", {}))
+
+        def check(value, path):
+            if isinstance(value, dict):
+                value = [value]  # A single item returned without its list
+            if not isinstance(value, list):
+                return value, [(path, "expected a list")]
+            checked, errors = [], []
+            for index, item in enumerate(value):
+                item, item_errors = check_item(item, path + (index,))
+                checked.append(item)
+                errors.extend(item_errors)
+            return checked, errors
+
+    elif kind in ("integer", "number"):
+        pattern = INTEGER_PATTERN if kind == "integer" else NUMBER_PATTERN
+        cast = int if kind == "integer" else float
+        message = "expected an integer" if kind == "integer" else "expected a number"
+
+        def check(value, path):
+            if isinstance(value, bool):
+                return value, [(path, message)]
+            if isinstance(value, float) and kind == "integer":
+                return round(value), []
+            if isinstance(value, (int, float)):
+                return value, []
+            match = pattern.search(value) if isinstance(value, str) else None
+            if match is None:
+                return value, [(path, message)]
+            return cast(match.group(0)), []
+
+    elif kind == "string":
+
+        def check(value, path):
+            if isinstance(value, str):
+                return value, []
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return str(value), []
+            if isinstance(value, list) and all(isinstance(item, str) for item in value):
+                return ", ".join(value), []
+            return value, [(path, "expected a string")]
+
+    elif kind == "boolean":
+
+        def check(value, path):
+            if isinstance(value, bool):
+                return value, []
+            return value, [(path, "expected a boolean")]
+
+    else:
+
+        def check(value, path):
+            return value, []
+
+    return check
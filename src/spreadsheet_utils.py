@@ -0,0 +1,112 @@
+""" A python file to extract spreadsheets row by row into chunks of whole table rows.
+    Workbooks are read in openpyxl read-only mode, which parses the sheet XML as a stream, and the rows are
+    grouped into token bounded chunks that repeat the sheet name and header row. Only the rows of the chunk
+    being built are held while a sheet is read, so the reader's memory does not grow with the workbook size.
+    Workbooks larger than SPREADSHEET_CACHE_MAX_MB are streamed into builds without the extraction cache,
+    which would hold every chunk of the workbook.
+"""
+
+import os
+import json
+import datetime
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+SPREADSHEET_CHUNK_TOKENS = config["SPREADSHEET_CHUNK_TOKENS"]  # Maximum tokens of a chunk of spreadsheet rows
+SPREADSHEET_CACHE_MAX_MB = config[
+    "SPREADSHEET_CACHE_MAX_MB"
+]  # Larger workbooks are streamed into builds instead of being cached
+
+CELL_SEPARATOR = " | "
+
+
+def should_stream_workbook(file_path, max_size_mb=SPREADSHEET_CACHE_MAX_MB) -> bool:
+    """A function to check whether a workbook is too large to be extracted whole and cached."""
+    return os.path.getsize(file_path) > max_size_mb * 1024 * 1024
+
+
+def format_cell(value) -> str:
+    """A function to render a cell value as text, empty cells are empty strings."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value).replace("\n", " ").strip()
+
+
+def _trim(cells) -> list:
+    """A function to drop the empty cells at the end of a row."""
+    end = len(cells)
+    while end > 0 and not cells[end - 1]:
+        end -= 1
+    return cells[:end]
+
+
+def iter_row_chunks(file_path, max_tokens=SPREADSHEET_CHUNK_TOKENS):
+    """A function to yield the chunks of a workbook as {"page_content", "metadata"} records, sheet by sheet.
+    The first non-empty row of a sheet is its header. A row longer than max_tokens is a chunk of its own,
+    rows are never split. The metadata holds the sheet name and the first and last row numbers of the chunk.
+    """
+    from openpyxl import load_workbook
+    from context_utils import count_tokens
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            header, header_row, offset = None, None, 0
+            rows, row_start, row_end, num_tokens, header_tokens = [], None, None, 0, 0
+
+            for row_number, values in enumerate(sheet.iter_rows(values_only=True), start=1):
+                cells = _trim([format_cell(value) for value in values])
+                if not cells:
+                    continue
+                if header is None:
+                    # Columns left of the header are empty in a table that does not start at column A
+                    offset = next(index for index, cell in enumerate(cells) if cell)
+                    header = f"Sheet: {sheet.title}\n{CELL_SEPARATOR.join(cells[offset:])}"
+                    header_tokens = count_tokens(header) + 1
+                    header_row = row_number
+                    continue
+
+                line = CELL_SEPARATOR.join(cells[offset:] if any(cells[offset:]) else cells)
+                line_tokens = count_tokens(line) + 1
+                if rows and header_tokens + num_tokens + line_tokens > max_tokens:
+                    yield {
+                        "page_content": "\n".join([header] + rows),
+                        "metadata": {"sheet": sheet.title, "row_start": row_start, "row_end": row_end},
+                    }
+                    rows, num_tokens = [], 0
+                if not rows:
+                    row_start = row_number
+                rows.append(line)
+                row_end = row_number
+                num_tokens += line_tokens
+
+            if rows:
+                yield {
+                    "page_content": "\n".join([header] + rows),
+                    "metadata": {"sheet": sheet.title, "row_start": row_start, "row_end": row_end},
+                }
+            elif header is not None:
+                # A sheet with a single row is kept as one chunk of its header
+                yield {
+                    "page_content": header,
+                    "metadata": {"sheet": sheet.title, "row_start": header_row, "row_end": header_row},
+                }
+    finally:
+        workbook.close()
+
+
+def xlsx_row_records(file_path) -> list:
+    """A function to extract the row chunks of a workbook that is not streamed as cacheable records."""
+    return list(iter_row_chunks(file_path))
@@ -0,0 +1,97 @@
+""" A python file to split very large text files into chunks without reading them into memory.
+    The file is memory mapped and decoded window by window with an incremental decoder, every window is split
+    with the same text splitter as the other documents and the chunks are yielded as soon as they are complete.
+    Only a window of text and the chunks being yielded are held at a time, whatever the size of the file.
+"""
+
+import os
+import io
+import json
+import mmap
+import codecs
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+CHUNK_SIZE = config["CHUNK_SIZE"]  # Loading Text chunk size as integer variable
+CHUNK_OVERLAP = config["CHUNK_OVERLAP"]  # Loading Text chunk overlap as integer variable
+TEXT_STREAM_MIN_MB = config["TEXT_STREAM_MIN_MB"]  # Text files from this size on are streamed
+TEXT_STREAM_WINDOW_MB = config["TEXT_STREAM_WINDOW_MB"]  # Megabytes of the file decoded and split at a time
+
+
+def should_stream(file_path, min_size_mb=TEXT_STREAM_MIN_MB) -> bool:
+    """A function to check whether a text file is large enough to be streamed."""
+    return os.path.getsize(file_path) >= min_size_mb * 1024 * 1024
+
+
+def iter_text_windows(file_path, window_mb=TEXT_STREAM_WINDOW_MB):
+    """A function to yield the decoded text of a file window by window.
+    Multi-byte characters and line endings split across windows are decoded like a file opened in text mode.
+    """
+    # Windows are whole pages so the pages of a decoded window can be released
+    window_bytes = max(1, int(window_mb * 1024 * 1024) // mmap.PAGESIZE) * mmap.PAGESIZE
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder("utf-8")(errors="replace"), translate=True
+    )
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            release = hasattr(mapped, "madvise") and hasattr(mmap, "MADV_DONTNEED")
+            if hasattr(mmap, "MADV_SEQUENTIAL") and hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            for start in range(0, len(mapped), window_bytes):
+                text = decoder.decode(mapped[start : start + window_bytes])
+                if release:
+                    # Mapped pages stay resident after they are read, drop them so memory does not grow with the file
+                    mapped.madvise(mmap.MADV_DONTNEED, start, min(window_bytes, len(mapped) - start))
+                if text:
+                    yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def _split_with_starts(text_splitter, text, chunk_overlap) -> list:
+    """A function to split a text into (chunk text, start index) pairs, locating chunks like the text splitter."""
+    pairs, index, previous_chunk_len = [], 0, 0
+    for chunk in text_splitter.split_text(text):
+        index = text.find(chunk, max(0, index + previous_chunk_len - chunk_overlap))
+        previous_chunk_len = len(chunk)
+        pairs.append((chunk, index))
+    return pairs
+
+
+def iter_text_chunks(
+    file_path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, window_mb=TEXT_STREAM_WINDOW_MB
+):
+    """A function to yield the (chunk text, start index) of a text file, streamed window by window.
+    The last chunk of a window may be cut by the window end, so it is split again with the next window.
+    Start indexes are character offsets in the whole file, like those of the text splitter.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    buffer, buffer_offset = "", 0
+    for window in iter_text_windows(file_path, window_mb):
+        buffer += window
+        pairs = _split_with_starts(text_splitter, buffer, chunk_overlap)
+        if len(pairs) < 2:
+            continue
+        for chunk, start in pairs[:-1]:
+            yield chunk, buffer_offset + start
+        # The last chunk may continue in the next window
+        last_start = pairs[-1][1]
+        buffer = buffer[last_start:]
+        buffer_offset += last_start
+
+    for chunk, start in _split_with_starts(text_splitter, buffer, chunk_overlap):
+        yield chunk, buffer_offset + start
@@ -0,0 +1,239 @@
+""" A python file to trace the stages of ingestion, retrieval and generation.
+    Every stage runs inside a span that records its duration and attributes such as token counts and cache hits.
+    Spans are appended to a size rotated JSONL file and can be summarized or exported as a Prometheus text file.
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+TRACE_DIR = config["TRACE_DIR"]  # Load directory name for traces and metrics
+TRACE_BUFFER_SIZE = config["TRACE_BUFFER_SIZE"]  # Number of recent spans kept in memory
+TRACE_FILE_MAX_MB = config["TRACE_FILE_MAX_MB"]  # Size at which the JSONL trace file is rotated
+TRACE_FILE_BACKUPS = config["TRACE_FILE_BACKUPS"]  # Number of rotated trace files kept
+
+trace_path = f"{project_root}/{TRACE_DIR}"
+
+STAGES = ["load", "extract", "split", "dedup", "embed", "index", "retrieve", "complete"]
+NUMERIC_ATTRIBUTES = ["tokens", "prompt_tokens", "completion_tokens", "items"]
+TOTAL_KEYS = ["count", "errors", "total_seconds", "cache_hits", "cache_misses"] + NUMERIC_ATTRIBUTES
+
+
+def _percentile(values, fraction) -> float:
+    """A function to return a percentile of a sorted list of values."""
+    if not values:
+        return 0.0
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+class TRACER:
+    """A class to record spans of pipeline stages in memory and in a JSONL file."""
+
+    def __init__(
+        self,
+        trace_dir=trace_path,
+        buffer_size=TRACE_BUFFER_SIZE,
+        max_file_mb=TRACE_FILE_MAX_MB,
+        backups=TRACE_FILE_BACKUPS,
+    ) -> None:
+        self.trace_dir = trace_dir
+        self.spans = deque(maxlen=buffer_size)
+        self.max_file_bytes = int(max_file_mb * 1024 * 1024)
+        self.backups = backups
+        self.totals = {}  # (stage, name) -> totals since the process started, never reduced by the buffer
+        self.lock = threading.Lock()
+        self._local = threading.local()  # Stack of open spans of the current thread
+
+    @property
+    def jsonl_path(self) -> str:
+        return os.path.join(self.trace_dir, "traces.jsonl")
+
+    @property
+    def prometheus_path(self) -> str:
+        return os.path.join(self.trace_dir, "metrics.prom")
+
+    @contextmanager
+    def span(self, stage, name="", **attributes):
+        """A context manager to trace a stage. It yields the span attributes so callers can add
+        token counts or cache hits while the stage runs.
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1] if stack else None
+        record = {
+            "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent["span_id"] if parent else None,
+            "stage": stage,
+            "name": name or stage,
+            "start_time": time.time(),
+            "duration_seconds": 0.0,
+            "status": "ok",
+            "attributes": dict(attributes),
+        }
+        stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record["attributes"]
+        except Exception as e:
+            record["status"] = "error"
+            record["attributes"]["error"] = str(e)
+            raise
+        finally:
+            record["duration_seconds"] = time.perf_counter() - start
+            stack.pop()
+            self._record(record)
+
+    def _record(self, record) -> None:
+        """A method to keep a finished span in memory, add it to the totals and append it to the JSONL file."""
+        with self.lock:
+            self.spans.append(record)
+            totals = self.totals.setdefault(
+                (record["stage"], record["name"]), dict.fromkeys(TOTAL_KEYS, 0)
+            )
+            totals["count"] += 1
+            totals["errors"] += record["status"] == "error"
+            totals["total_seconds"] += record["duration_seconds"]
+            totals["cache_hits"] += record["attributes"].get("cache_hit") is True
+            totals["cache_misses"] += record["attributes"].get("cache_hit") is False
+            for attribute in NUMERIC_ATTRIBUTES:
+                totals[attribute] += record["attributes"].get(attribute) or 0
+            try:
+                os.makedirs(self.trace_dir, exist_ok=True)
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+                    file_size = f.tell()
+                if file_size >= self.max_file_bytes:
+                    self._rotate()
+            except OSError as e:
+                print(f"Error while writing trace: {e}")
+
+    def _rotate(self) -> None:
+        """A method to rotate the JSONL file to traces.jsonl.1, shifting older files and dropping the oldest."""
+        if self.backups <= 0:
+            os.remove(self.jsonl_path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            backup_path = f"{self.jsonl_path}.{index}"
+            if os.path.exists(backup_path):
+                os.replace(backup_path, f"{self.jsonl_path}.{index + 1}")
+        os.replace(self.jsonl_path, f"{self.jsonl_path}.1")
+
+    def recent(self, limit: int = 100) -> list:
+        """A method to return the most recent spans, newest first."""
+        with self.lock:
+            return list(self.spans)[-limit:][::-1]
+
+    def summary(self) -> list:
+        """A method to aggregate the spans in memory per stage and span name."""
+        with self.lock:
+            spans = list(self.spans)
+
+        groups = {}
+        for record in spans:
+            groups.setdefault((record["stage"], record["name"]), []).append(record)
+
+        rows = []
+        for (stage, name), records in sorted(groups.items()):
+            durations = sorted(record["duration_seconds"] for record in records)
+            row = {
+                "stage": stage,
+                "name": name,
+                "count": len(records),
+                "errors": sum(record["status"] == "error" for record in records),
+                "total_seconds": sum(durations),
+                "mean_seconds": sum(durations) / len(durations),
+                "p50_seconds": _percentile(durations, 0.5),
+                "p95_seconds": _percentile(durations, 0.95),
+                "max_seconds": durations[-1],
+                "cache_hits": sum(record["attributes"].get("cache_hit") is True for record in records),
+                "cache_misses": sum(record["attributes"].get("cache_hit") is False for record in records),
+            }
+            for attribute in NUMERIC_ATTRIBUTES:
+                row[attribute] = sum(
+                    record["attributes"].get(attribute) or 0 for record in records
+                )
+            rows.append(row)
+        return rows
+
+    def export_jsonl(self, file_path=None) -> str:
+        """A method to write the spans in memory to a JSONL file and return its path."""
+        file_path = file_path or os.path.join(self.trace_dir, "traces_export.jsonl")
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with self.lock:
+            spans = list(self.spans)
+        with open(file_path, "w", encoding="utf-8") as f:
+            for record in spans:
+                f.write(json.dumps(record, default=str) + "\n")
+        return file_path
+
+    def export_prometheus(self, file_path=None) -> str:
+        """A method to write the stage metrics in the Prometheus text exposition format and return its path.
+        Durations are a summary family whose count and sum are totals since the process started, like the
+        counters, so they never decrease when the span buffer wraps. Its quantiles cover the spans in memory.
+        """
+        file_path = file_path or self.prometheus_path
+        counters = [
+            ("gpt_stage_errors_total", "Failed spans per stage", "errors"),
+            ("gpt_stage_tokens_total", "Tokens processed per stage", "tokens"),
+            ("gpt_stage_prompt_tokens_total", "Prompt tokens per stage", "prompt_tokens"),
+            ("gpt_stage_completion_tokens_total", "Completion tokens per stage", "completion_tokens"),
+            ("gpt_stage_cache_hits_total", "Cache hits per stage", "cache_hits"),
+            ("gpt_stage_cache_misses_total", "Cache misses per stage", "cache_misses"),
+        ]
+        quantiles = [("0.5", "p50_seconds"), ("0.95", "p95_seconds")]
+        recent = {(row["stage"], row["name"]): row for row in self.summary()}
+        with self.lock:
+            totals = [
+                {"stage": stage, "name": name, **values} for (stage, name), values in sorted(self.totals.items())
+            ]
+
+        metric = "gpt_stage_duration_seconds"
+        lines = [f"# HELP {metric} Seconds spent per stage", f"# TYPE {metric} summary"]
+        for row in totals:
+            labels = f'stage="{row["stage"]}",name="{row["name"]}"'
+            if (row["stage"], row["name"]) in recent:
+                for quantile, key in quantiles:
+                    lines.append(
+                        f'{metric}{{{labels},quantile="{quantile}"}} {recent[(row["stage"], row["name"])][key]}'
+                    )
+            lines.append(f"{metric}_sum{{{labels}}} {row['total_seconds']}")
+            lines.append(f"{metric}_count{{{labels}}} {row['count']}")
+        for metric, help_text, key in counters:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for row in totals:
+                lines.append(
+                    f'{metric}{{stage="{row["stage"]}",name="{row["name"]}"}} {row[key]}'
+                )
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, file_path)  # Scrapers never read a half written file
+        return file_path
+
+    def clear(self) -> None:
+        """A method to drop the spans kept in memory, the exported counters keep their totals."""
+        with self.lock:
+            self.spans.clear()
+
+
+# Tracer shared by all modules of the process
+tracer = TRACER()
@@ -1,7 +1,6 @@
 """ A python file to define various utilities with url text extraction."""
-import trafilatura
-from trafilatura.settings import use_config
 from courlan import validate_url, check_url
+from trace_utils import tracer
 
 
 def validate_input_url(url):
@@ -23,6 +22,8 @@ def validate_youtube_url(url):
 
 def extract_text_url(url):
     """A function to extract the text content from given URL"""
+    import trafilatura
+    from trafilatura.settings import use_config
 
     # Instantiate config for trafilatura
     config = use_config()
@@ -31,9 +32,13 @@ def extract_text_url(url):
     config.set("DEFAULT", "EXTRACTION_TIMEOUT", "0")
 
     # Download the Web content from the URL
-    download_web = trafilatura.fetch_url(url)
+    with tracer.span("load", name="web_url") as span:
+        download_web = trafilatura.fetch_url(url)
+        span["bytes"] = len(download_web or "")
 
     # Extract the main text content from the download web content
-    extracted_text = trafilatura.extract(download_web, config=config)
+    with tracer.span("extract", name="trafilatura") as span:
+        extracted_text = trafilatura.extract(download_web, config=config)
+        span["characters"] = len(extracted_text or "")
 
     return extracted_text
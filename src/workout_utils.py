@@ -0,0 +1,203 @@
+""" A python file to serve workout plans from a store of generated plans.
+    The workout inputs form a small closed space, so every plan is stored on disk under a key of its normalized
+    inputs and served instantly when the same inputs are submitted again. Popular inputs can be generated ahead
+    of time with scripts/warm_workout_plans.py, and a single entry can be regenerated on demand.
+"""
+
+import os
+import json
+import time
+import hashlib
+from itertools import combinations
+from collections import Counter
+from prompts import recommend_workouts
+
+
+# Get the absolute path to the project root directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Load the config.json file
+with open(f"{project_root}/config/config.json", "r") as config_file:
+    config = json.load(config_file)
+
+# Load Config Values
+WORKOUT_PLAN_DIR = config["WORKOUT_PLAN_DIR"]  # Directory of the stored workout plans
+WORKOUT_WARMUP_WORKERS = config["WORKOUT_WARMUP_WORKERS"]  # Plans generated at the same time by the warm-up job
+default_model = config["DEFAULT_MODEL"]  # Plans are stored per model
+
+workout_plan_path = f"{project_root}/{WORKOUT_PLAN_DIR}"
+DEMAND_FILE_NAME = "requests.jsonl"  # Log of the submitted inputs, ranks the inputs for the warm-up job
+
+# The input space offered by the workout recommendations page
+FITNESS_GOALS = ["Build Muscle", "Lose Weight", "Improve Endurance", "Increase Flexibility"]
+FITNESS_LEVELS = ["Beginner", "Intermediate", "Advanced", "Pro-Level"]
+WORKOUT_STYLES = ["Weight Lifting 🏋🏻", "Cardio 🏃🏻‍♂️", "Yoga 🧘🏻‍♀️", "Pilates 🤸🏻"]
+DAYS_PER_WEEK = list(range(1, 8))
+WORKOUT_LOCATIONS = ["Home Only", "Gym or Fitness Studio"]
+
+
+def normalize_inputs(user_inputs) -> dict:
+    """A function to normalize workout inputs, so the same choices always map to the same plan.
+    Workout styles are deduplicated and put in a fixed order, the selection order does not matter.
+    """
+    styles = [style.strip() for style in user_inputs["workout_style"]]
+    return {
+        "fitness_goal": user_inputs["fitness_goal"].strip(),
+        "fitness_level": user_inputs["fitness_level"].strip(),
+        "workout_style": sorted(
+            set(styles),
+            key=lambda style: (
+                WORKOUT_STYLES.index(style) if style in WORKOUT_STYLES else len(WORKOUT_STYLES),
+                style,
+            ),
+        ),
+        "days_per_week": int(user_inputs["days_per_week"]),
+        "workout_location": user_inputs["workout_location"].strip(),
+    }
+
+
+def plan_key(user_inputs, model=default_model) -> str:
+    """A function to return the store key of workout inputs.
+    The key hashes the prompt built from the normalized inputs, so a prompt change invalidates the stored plans.
+    """
+    messages = recommend_workouts(user_inputs=normalize_inputs(user_inputs))
+    return hashlib.sha256(json.dumps([model, messages], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def all_inputs() -> list:
+    """A function to enumerate every combination of the workout inputs offered by the page."""
+    style_sets = [
+        list(styles)
+        for size in range(1, len(WORKOUT_STYLES) + 1)
+        for styles in combinations(WORKOUT_STYLES, size)
+    ]
+    return [
+        {
+            "fitness_goal": goal,
+            "fitness_level": level,
+            "workout_style": styles,
+            "days_per_week": days,
+            "workout_location": location,
+        }
+        for goal in FITNESS_GOALS
+        for level in FITNESS_LEVELS
+        for styles in style_sets
+        for days in DAYS_PER_WEEK
+        for location in WORKOUT_LOCATIONS
+    ]
+
+
+class WORKOUT_PLAN_STORE:
+    """A class to store and serve generated workout plans keyed by their normalized inputs."""
+
+    def __init__(self, store_dir=workout_plan_path, model=default_model) -> None:
+        self.store_dir = store_dir
+        self.model = model
+
+    def _entry_path(self, key) -> str:
+        return os.path.join(self.store_dir, key[:2], f"{key}.json")
+
+    def get(self, user_inputs):
+        """A method to return the stored entry of the inputs, or None when no plan is stored."""
+        try:
+            with open(self._entry_path(plan_key(user_inputs, self.model)), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, user_inputs, workout_plan, tokens_used) -> dict:
+        """A method to store the plan of the inputs, replacing any stored plan."""
+        entry = {
+            "inputs": normalize_inputs(user_inputs),
+            "model": self.model,
+            "workout_plan": workout_plan,
+            "tokens_used": tokens_used,
+            "created_at": time.time(),
+        }
+        entry_path = self._entry_path(plan_key(user_inputs, self.model))
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            temp_path = f"{entry_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(temp_path, entry_path)  # Readers never see a half written entry
+        except OSError as e:
+            print(f"Error while writing workout plan: {e}")
+        return entry
+
+    def generate(self, gpt, user_inputs) -> dict:
+        """A method to generate a fresh plan for the inputs and store it, replacing any stored plan."""
+        response = gpt.get_completion_from_messages(
+            messages=recommend_workouts(user_inputs=normalize_inputs(user_inputs))
+        )
+        return self.put(user_inputs, response.choices[0].message.content, response.usage.total_tokens)
+
+    def serve(self, gpt, user_inputs, refresh=False) -> tuple:
+        """A method to return (entry, served from the store) for the inputs.
+        A stored plan is served without a request, refresh regenerates the plan of these inputs.
+        """
+        self.record_request(user_inputs)
+        entry = None if refresh else self.get(user_inputs)
+        if entry is not None:
+            return entry, True
+        return self.generate(gpt, user_inputs), False
+
+    def record_request(self, user_inputs) -> None:
+        """A method to append the submitted inputs to the demand log read by the warm-up job."""
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            with open(os.path.join(self.store_dir, DEMAND_FILE_NAME), "a", encoding="utf-8") as f:
+                f.write(json.dumps(normalize_inputs(user_inputs)) + "\n")
+        except OSError as e:
+            print(f"Error while recording workout request: {e}")
+
+    def popular_inputs(self, limit=None) -> list:
+        """A method to return the inputs ordered by how often they were submitted, then the rest of the space.
+        Logged inputs outside the input space offered by the page are ignored.
+        """
+        space = {plan_key(inputs, self.model): inputs for inputs in all_inputs()}
+        counts = Counter()
+        try:
+            with open(os.path.join(self.store_dir, DEMAND_FILE_NAME), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        key = plan_key(json.loads(line), self.model)
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        continue
+                    if key in space:
+                        counts[key] += 1
+        except OSError:
+            pass
+        ranked = [key for key, _ in counts.most_common()]
+        ranked.extend(key for key in space if key not in counts)
+        ranked = [space[key] for key in ranked]
+        return ranked[:limit] if limit is not None else ranked
+
+    def invalidate(self, user_inputs=None) -> int:
+        """A method to remove the stored plan of the inputs, or every stored plan without inputs."""
+        if user_inputs is not None:
+            try:
+                os.remove(self._entry_path(plan_key(user_inputs, self.model)))
+                return 1
+            except OSError:
+                return 0
+        removed = 0
+        for root, _, files in os.walk(self.store_dir):
+            for file_name in files:
+                if file_name.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(root, file_name))
+                        removed += 1
+                    except OSError:
+                        continue
+        return removed
+
+    def stats(self) -> dict:
+        """A method to return the number of stored plans out of the whole input space."""
+        entries = sum(
+            file_name.endswith(".json")
+            for _, _, files in os.walk(self.store_dir)
+            for file_name in files
+        )
+        return {"entries": entries, "input_space": len(all_inputs())}